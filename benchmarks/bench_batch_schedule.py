@@ -0,0 +1,42 @@
+"""Compare the makespan of a mixed batch rendered in FIFO order and
+largest-first order.
+
+Usage: python benchmarks/bench_batch_schedule.py [processes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from py3o.template.batch import render_batch
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "py3o", "template", "tests", "templates"
+)
+
+
+def make_jobs(outdir):
+    sizes = [300] * 30 + [15000] * 2  # the heavy documents come last
+    jobs = []
+    for i, size in enumerate(sizes):
+        data = {"items": [{"val": "row %s" % j} for j in range(size)]}
+        outfile = os.path.join(outdir, "out%s.odt" % i)
+        jobs.append(("py3o_list_template.odt", data, outfile))
+    return jobs
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    with tempfile.TemporaryDirectory() as outdir:
+        jobs = make_jobs(outdir)
+        for order in ("fifo", "cost"):
+            start = time.perf_counter()
+            render_batch(jobs, TEMPLATE_DIR, processes=processes, order=order)
+            print(
+                "%-4s makespan: %.2fs" % (order, time.perf_counter() - start)
+            )
+
+
+if __name__ == "__main__":
+    main()
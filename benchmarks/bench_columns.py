@@ -0,0 +1,107 @@
+"""Compare the memory use and speed of rendering a loop over one object per
+row and over the same data stored as columns.
+
+The template is the ODS variable type test template, whose loop shows
+``item.val1`` and ``item.val2``. The columns are NumPy arrays when NumPy is
+installed, ``array.array`` otherwise. Building the data is part of each
+measure: the object per row approach has to build all of its rows before
+rendering.
+
+Usage: python benchmarks/bench_columns.py [rows]
+"""
+
+import array
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from py3o.template import Template
+from py3o.template.columns import Columns
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_ods_variable_type.ods",
+)
+
+
+class Line:
+    def __init__(self, val1, val2):
+        self.val1 = val1
+        self.val2 = val2
+
+
+def make_columns(rows):
+    if numpy is not None:
+        return {
+            "val1": numpy.arange(rows, dtype=numpy.float64) * 0.5,
+            "val2": numpy.arange(rows, dtype=numpy.int64),
+        }
+    return {
+        "val1": array.array("d", (i * 0.5 for i in range(rows))),
+        "val2": array.array("q", range(rows)),
+    }
+
+
+def objects(columns):
+    return [
+        Line(val1, val2)
+        for val1, val2 in zip(
+            columns["val1"].tolist(), columns["val2"].tolist()
+        )
+    ]
+
+
+def render(make_items, rows, table_loop, trace):
+    """Render the loop over ``rows`` rows, return the time it took and the
+    peak memory use, when traced."""
+    columns = make_columns(rows)
+    with tempfile.NamedTemporaryFile(suffix=".ods") as outfile:
+        template = Template(TEMPLATE, outfile.name)
+        if table_loop:
+            template.set_table_loop("items")
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        template.render({"items": make_items(columns)})
+        elapsed = time.perf_counter() - start
+        if trace:
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return elapsed, peak
+        return elapsed, None
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print("columns stored as %s" % ("NumPy arrays" if numpy else "arrays"))
+    for name, make_items in (("objects", objects), ("columns", Columns)):
+        for table_loop in (False, True):
+            # tracing memory slows rendering down: measure separately
+            elapsed, _peak = render(make_items, rows, table_loop, False)
+            _elapsed, peak = render(make_items, rows, table_loop, True)
+            print(
+                "%d rows, %s, table loop %s: %.2fs, %.1f MB peak"
+                % (
+                    rows,
+                    name,
+                    "on" if table_loop else "off",
+                    elapsed,
+                    peak / 2**20,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
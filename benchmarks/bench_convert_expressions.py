@@ -0,0 +1,90 @@
+"""Measure how convert_py3o_to_python_ast scales with the number of
+expressions of a template, against its previous implementation, which looked
+the blocks up with list.index and concatenated strings.
+
+The expressions are those of a catalogue: a loop over the products of each
+category, with a conditional field in each loop. list.index scans the
+expressions from the start for each loop and if.
+
+Usage: python benchmarks/bench_convert_expressions.py [expressions...]
+"""
+
+import sys
+import time
+
+from py3o.template import Template
+
+
+def previous_convert(expressions):
+    python_src = ""
+    indent = 0
+    for expression in expressions:
+        if expression.startswith("for="):
+            python_src += f"{indent * ' '}for {expression[5:-1]}:\n"
+            indent += 1
+            if expressions[expressions.index(expression) + 1] == "/for":
+                python_src += f"{indent * ' '}pass\n"
+        elif expression == "/for":
+            indent -= 1
+        elif expression.startswith("if="):
+            python_src += f"{indent * ' '}if {expression[4:-1]}:\n"
+            indent += 1
+            if expressions[expressions.index(expression) + 1] == "/if":
+                python_src += f"{indent * ' '}pass\n"
+        elif expression == "/if":
+            indent -= 1
+        elif expression.startswith("function="):
+            python_src += f"{indent * ' '}{expression[10:-1]}\n"
+        else:
+            python_src += f"{indent * ' '}{expression}\n"
+    return python_src
+
+
+def catalogue(count):
+    """Return about ``count`` expressions."""
+    expressions = []
+    for category in range(max(1, count // 8)):
+        expressions += [
+            'for="product in category%d.products"' % category,
+            "product.name",
+            "product.reference",
+            'if="product.discount"',
+            "product.discount",
+            "/if",
+            "function=\"format_currency(product.price, 'EUR')\"",
+            "/for",
+        ]
+    return expressions
+
+
+def measure(function, expressions):
+    start = time.perf_counter()
+    result = function(expressions)
+    return time.perf_counter() - start, result
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [
+        100,
+        1000,
+        5000,
+        10000,
+        50000,
+    ]
+    for count in counts:
+        expressions = catalogue(count)
+        elapsed, result = measure(
+            Template.convert_py3o_to_python_ast, expressions
+        )
+        previous_elapsed, previous_result = measure(
+            previous_convert, expressions
+        )
+        assert result == previous_result
+        print(
+            "%d expressions: previous %.4fs, now %.4fs"
+            % (len(expressions), previous_elapsed, elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main()
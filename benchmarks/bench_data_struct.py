@@ -0,0 +1,80 @@
+"""Measure the data structures of deeply nested templates: the time to
+build them from the template expressions, their memory, and the time to
+extract data with them.
+
+The expressions are those of a template with nested loops, each level
+iterating over the children of the previous one and showing a few of their
+attributes.
+
+Usage: python benchmarks/bench_data_struct.py [depth] [fields]
+"""
+
+import sys
+import timeit
+import tracemalloc
+
+from py3o.template import Template
+from py3o.template.helpers import Py3oConvertor
+
+
+class Node:
+    def __init__(self, depth, fields, width):
+        for field in range(fields):
+            setattr(self, "field%d" % field, field)
+        self.children = (
+            [Node(depth - 1, fields, width) for _ in range(width)]
+            if depth
+            else []
+        )
+
+
+def expressions(depth, fields):
+    result = []
+    parent = "root"
+    for level in range(depth):
+        item = "item%d" % level
+        result.append('for="%s in %s.children"' % (item, parent))
+        result += ["%s.field%d" % (item, field) for field in range(fields)]
+        parent = item
+    result += ["/for"] * depth
+    return result
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    fields = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    source = Template.convert_py3o_to_python_ast(expressions(depth, fields))
+
+    build = (
+        min(
+            timeit.repeat(lambda: Py3oConvertor()(source), number=20, repeat=5)
+        )
+        / 20
+    )
+
+    tracemalloc.start()
+    structures = [Py3oConvertor()(source) for _ in range(100)]
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    data = {"root": Node(depth, fields, 2)}
+    render = min(
+        timeit.repeat(lambda: structures[0].render(data), number=1, repeat=5)
+    )
+
+    print(
+        "depth %d, %d fields: build %.2fms, %.1f KB per data structure, "
+        "extract %d nodes %.2fs"
+        % (
+            depth,
+            fields,
+            build * 1e3,
+            size / len(structures) / 1024,
+            2 ** (depth + 1) - 1,
+            render,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare extracting the data of a template with Py3oModule.render and with
+the function compiled by Py3oModule.get_extractor, on ORM-like records.
+
+The template shows invoices with their partner and lines, each line with
+its product.
+
+Usage: python benchmarks/bench_extractor.py [invoices]
+"""
+
+import sys
+import timeit
+
+from py3o.template import Template
+from py3o.template.helpers import Py3oConvertor
+
+EXPRESSIONS = [
+    'for="invoice in invoices"',
+    "invoice.number",
+    "invoice.date",
+    "invoice.partner.name",
+    "invoice.partner.street",
+    "invoice.partner.city",
+    'for="line in invoice.lines"',
+    "line.product.code",
+    "line.product.name",
+    "line.quantity",
+    "line.price",
+    "line.discount",
+    "/for",
+    "invoice.total",
+    "/for",
+    "company.name",
+]
+
+
+class Record:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def make_data(count):
+    partner = Record(name="Partner", street="1 main street", city="Paris")
+    products = [
+        Record(code="P%d" % i, name="Product %d" % i) for i in range(50)
+    ]
+    invoices = [
+        Record(
+            number="INV%06d" % i,
+            date="2020-01-01",
+            partner=partner,
+            lines=[
+                Record(
+                    product=products[(i + j) % 50],
+                    quantity=j,
+                    price=1.5 * j,
+                    discount=0,
+                )
+                for j in range(10)
+            ],
+            total=67.5,
+        )
+        for i in range(count)
+    ]
+    return {"invoices": invoices, "company": Record(name="Company")}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    structure = Py3oConvertor()(
+        Template.convert_py3o_to_python_ast(EXPRESSIONS)
+    )
+    data = make_data(count)
+    extract = structure.get_extractor()
+    extract_records = structure.get_extractor(records=True)
+    assert extract(data) == structure.render(data)
+    for name, function in (
+        ("render", structure.render),
+        ("extractor", extract),
+        ("extractor with records", extract_records),
+    ):
+        elapsed = min(
+            timeit.repeat(lambda: function(data), number=1, repeat=5)
+        )
+        print("%d invoices, %s: %.3fs" % (count, name, elapsed))
+
+
+if __name__ == "__main__":
+    main()
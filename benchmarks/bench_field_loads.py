@@ -0,0 +1,67 @@
+"""Count the field loads and measure the render time of a spreadsheet
+whose rows are lazily loaded records, as with ORM-backed data.
+
+Usage: python benchmarks/bench_field_loads.py [rows]
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+from py3o.template import Template
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_simple_calc.ods",
+)
+
+FIELD_LOAD_COST = 0.00002  # seconds
+
+
+class LazyRecord:
+    loads = 0
+
+    def __init__(self, i):
+        self._values = {
+            "col1": i,
+            "col2": "row %s" % i,
+            "col3": i * 1.5,
+            "col4": "value %s" % i,
+        }
+
+    def __getattr__(self, name):
+        if name not in self.__dict__.get("_values", ()):
+            raise AttributeError(name)
+        # simulate a database round trip
+        LazyRecord.loads += 1
+        end = time.perf_counter() + FIELD_LOAD_COST
+        while time.perf_counter() < end:
+            pass
+        return self._values[name]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    records = [LazyRecord(i) for i in range(count)]
+    template = Template(TEMPLATE, BytesIO())
+    start = time.perf_counter()
+    template.render({"items": records})
+    print(
+        "%d rows: %.2fs, %d field loads (%.1f per cell)"
+        % (
+            count,
+            time.perf_counter() - start,
+            LazyRecord.loads,
+            LazyRecord.loads / (count * 4),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare formatting whole columns with the column formatters to calling
+the format helpers value per value.
+
+Usage: python benchmarks/bench_format_columns.py [values]
+"""
+
+import array
+import datetime
+import random
+import sys
+import time
+
+from py3o.template.main import (
+    format_currency,
+    format_currency_column,
+    format_datetime,
+    format_datetime_column,
+    format_multiline,
+    format_multiline_column,
+)
+
+
+def measure(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    amounts = array.array(
+        "d", (round(random.uniform(-1e6, 1e6), 2) for _ in range(count))
+    )
+    start = datetime.date(2020, 1, 1)
+    dates = [
+        start + datetime.timedelta(days=random.randrange(3650))
+        for _ in range(count)
+    ]
+    texts = ["line %d\nline <%d>" % (i, i) for i in range(count)]
+    cases = [
+        (
+            "format_currency(amount, 'EUR', locale='fr_FR')",
+            lambda: [
+                format_currency(amount, "EUR", locale="fr_FR")
+                for amount in amounts
+            ],
+            lambda: format_currency_column(amounts, "EUR", locale="fr_FR"),
+        ),
+        (
+            "format_currency(amount, format='#,##0.00', locale='de_CH')",
+            lambda: [
+                format_currency(amount, format="#,##0.00", locale="de_CH")
+                for amount in amounts
+            ],
+            lambda: format_currency_column(
+                amounts, format="#,##0.00", locale="de_CH"
+            ),
+        ),
+        (
+            "format_datetime(date, 'dd/MM/YYYY', 'fr_FR')",
+            lambda: [
+                format_datetime(date, "dd/MM/YYYY", "fr_FR") for date in dates
+            ],
+            lambda: format_datetime_column(dates, "dd/MM/YYYY", "fr_FR"),
+        ),
+        (
+            "format_multiline(text)",
+            lambda: [format_multiline(text) for text in texts],
+            lambda: format_multiline_column(texts),
+        ),
+    ]
+    for name, per_value, column in cases:
+        per_value_time, expected = measure(per_value)
+        column_time, result = measure(column)
+        assert result == expected
+        print(
+            "%d values, %s: per value %.2fs, column %.2fs"
+            % (count, name, per_value_time, column_time)
+        )
+
+
+if __name__ == "__main__":
+    main()
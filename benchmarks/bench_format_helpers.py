@@ -0,0 +1,78 @@
+"""Measure the format helpers available in templates against calling Babel
+directly, as they did before caching their locales and patterns.
+
+Usage: python benchmarks/bench_format_helpers.py [calls]
+"""
+
+import datetime
+import sys
+import timeit
+
+import babel.dates
+import babel.numbers
+
+from py3o.template.main import (
+    format_currency,
+    format_datetime,
+    preload_locales,
+)
+
+DATE = datetime.date(2015, 8, 2)
+DATETIME = datetime.datetime(2015, 8, 2, 17, 5, 6)
+
+CASES = [
+    (
+        "format_currency(1234.5, 'EUR', locale='fr_FR')",
+        lambda: format_currency(1234.5, "EUR", locale="fr_FR"),
+        lambda: babel.numbers.format_currency(1234.5, "EUR", locale="fr_FR"),
+    ),
+    (
+        "format_currency(1234.5, format='#,##0.00', locale='de_CH')",
+        lambda: format_currency(1234.5, format="#,##0.00", locale="de_CH"),
+        lambda: babel.numbers.format_currency(
+            1234.5, "", format="#,##0.00", locale="de_CH"
+        ),
+    ),
+    (
+        "format_datetime(date, 'dd/MM/YYYY', 'fr_FR')",
+        lambda: format_datetime(DATE, "dd/MM/YYYY", "fr_FR"),
+        lambda: babel.dates.format_date(DATE, "dd/MM/YYYY", locale="fr_FR"),
+    ),
+    (
+        "format_datetime(datetime, locale='en_US')",
+        lambda: format_datetime(DATETIME, locale="en_US"),
+        lambda: babel.dates.format_datetime(
+            DATETIME, "YYYY-MM-dd HH:mm:ss", locale="en_US"
+        ),
+    ),
+    (
+        "format_datetime('2015-08-02', 'EEE d MMMM', 'fr_FR')",
+        lambda: format_datetime("2015-08-02", "EEE d MMMM", "fr_FR"),
+        lambda: babel.dates.format_date(
+            datetime.datetime.strptime("2015-08-02", "%Y-%m-%d"),
+            "EEE d MMMM",
+            locale="fr_FR",
+        ),
+    ),
+]
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    preload_locales(["fr_FR", "de_CH", "en_US"])
+    for name, helper, babel_call in CASES:
+        assert helper() == babel_call()
+        babel_time = min(timeit.repeat(babel_call, number=calls, repeat=3))
+        helper_time = min(timeit.repeat(helper, number=calls, repeat=3))
+        print(
+            "%s: babel %.2fus, helper %.2fus per call"
+            % (
+                name,
+                babel_time / calls * 1e6,
+                helper_time / calls * 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
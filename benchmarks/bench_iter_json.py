@@ -0,0 +1,90 @@
+"""Compare converting the data of a template to JSON with
+``json.dumps(structure.render(data))`` and with ``structure.iter_json(data)``:
+the time, the peak memory, and the time to the first chunk.
+
+The loop items are generated while they are extracted, as rows fetched from
+a database cursor would be.
+
+Usage: python benchmarks/bench_iter_json.py [rows]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+from py3o.template import Template
+from py3o.template.helpers import Py3oConvertor
+
+EXPRESSIONS = [
+    'for="line in lines"',
+    "line.code",
+    "line.label",
+    "line.quantity",
+    "line.price",
+    "/for",
+    "company.name",
+]
+
+
+class Record:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def make_data(rows):
+    return {
+        "lines": (
+            Record(code="P%d" % i, label="Line %d" % i, quantity=i, price=0.5)
+            for i in range(rows)
+        ),
+        "company": Record(name="Company"),
+    }
+
+
+def dumps(structure, data):
+    yield json.dumps(structure.render(data))
+
+
+def measure(convert, structure, rows, trace):
+    """Return the size of the JSON text, the time it took, the time to the
+    first chunk and the peak memory use, when traced."""
+    data = make_data(rows)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in convert(structure, data):
+        if first is None:
+            first = time.perf_counter() - start
+        # sent away: not kept
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace:
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return size, elapsed, first, peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    structure = Py3oConvertor()(
+        Template.convert_py3o_to_python_ast(EXPRESSIONS)
+    )
+    for name, convert in (
+        ("json.dumps(render(data))", dumps),
+        ("iter_json(data)", type(structure).iter_json),
+    ):
+        # tracing memory slows the conversion down: measure separately
+        size, elapsed, first, _peak = measure(convert, structure, rows, False)
+        _size, _elapsed, _first, peak = measure(convert, structure, rows, True)
+        print(
+            "%d rows, %s: %d characters in %.2fs, first chunk after %.3fs, "
+            "%.1f MB peak" % (rows, name, size, elapsed, first, peak / 2**20)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare the output throughput of a large spreadsheet rendered with
+several output buffer sizes; a buffer size of 1 writes every serialized
+chunk on its own, as py3o.template used to.
+
+Usage: python benchmarks/bench_output_buffer.py [rows]
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+from py3o.template import Template
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_simple_calc.ods",
+)
+
+
+def rows(count):
+    for i in range(count):
+        yield {
+            "col1": i,
+            "col2": "row %s" % i,
+            "col3": i * 1.5,
+            "col4": "value %s" % i,
+        }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    compiled = Template(TEMPLATE, None)
+    compiled.compile()
+
+    for buffer_size in (1, 4 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024):
+        outfile = BytesIO()
+        template = compiled.clone(outfile)
+        template.buffer_size = buffer_size
+        start = time.perf_counter()
+        steps = sum(1 for _ in template.render_flow({"items": rows(count)}))
+        elapsed = time.perf_counter() - start
+        print(
+            "buffer %8d: %.2fs, %7d steps, %.1f MB/s"
+            % (
+                buffer_size,
+                elapsed,
+                steps,
+                len(outfile.getvalue()) / elapsed / 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Measure format_datetime on a column of ISO date strings, against parsing
+them with datetime.strptime as it did before.
+
+The column holds dates over ten years, as an invoice or ledger export would,
+and date-times that are all distinct.
+
+Usage: python benchmarks/bench_parse_dates.py [rows]
+"""
+
+import datetime
+import random
+import sys
+import time
+
+from py3o.template.main import (
+    ISO_DATE_FORMAT,
+    ISO_DATETIME_FORMAT,
+    _get_date_pattern,
+    _get_locale,
+    format_datetime,
+)
+
+
+def strptime_format_datetime(string, format, locale):
+    """format_datetime on strings, parsing them with strptime."""
+    try:
+        date = datetime.datetime.strptime(string, ISO_DATE_FORMAT).date()
+    except ValueError:
+        date = datetime.datetime.strptime(string, ISO_DATETIME_FORMAT)
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return _get_date_pattern(format).apply(date, _get_locale(locale))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    random.seed(0)
+    start = datetime.datetime(2015, 1, 1)
+    columns = {
+        "dates": [
+            (start + datetime.timedelta(days=random.randrange(3650)))
+            .date()
+            .isoformat()
+            for _ in range(rows)
+        ],
+        "date-times": [
+            str(start + datetime.timedelta(seconds=i * 37))
+            for i in range(rows)
+        ],
+    }
+    for name, strings in columns.items():
+        timings = []
+        results = []
+        for function in (strptime_format_datetime, format_datetime):
+            begin = time.perf_counter()
+            results.append(
+                [function(s, "dd/MM/yyyy", "fr_FR") for s in strings]
+            )
+            timings.append(time.perf_counter() - begin)
+        assert results[0] == results[1]
+        print(
+            "%d %s: strptime %.2fs, format_datetime %.2fs"
+            % (rows, name, timings[0], timings[1])
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Measure the output size and the render time of a spreadsheet with
+blocks of identical rows, with and without the compression of repeated
+rows and cells.
+
+Usage: python benchmarks/bench_repeat.py [rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+from py3o.template import Template
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_ods_variable_type.ods",
+)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    # blank and constant rows between the data rows, as in reports with
+    # sections
+    items = [
+        {"val1": i, "val2": "row %d" % i}
+        if i % 10 == 0
+        else {"val1": None, "val2": "" if i % 10 < 5 else "n/a"}
+        for i in range(rows)
+    ]
+
+    for compress_repeated in (False, True):
+        with tempfile.NamedTemporaryFile(suffix=".ods") as outfile:
+            template = Template(
+                TEMPLATE, outfile.name, compress_repeated=compress_repeated
+            )
+            start = time.perf_counter()
+            template.render({"items": items})
+            elapsed = time.perf_counter() - start
+            with zipfile.ZipFile(outfile.name) as outods:
+                info = outods.getinfo("content.xml")
+            print(
+                "%d rows, compression %s: %.2fs, content.xml %d bytes "
+                "(%d compressed), archive %d bytes"
+                % (
+                    rows,
+                    "on" if compress_repeated else "off",
+                    elapsed,
+                    info.file_size,
+                    info.compress_size,
+                    os.path.getsize(outfile.name),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare Genshi's XMLSerializer and py3o's on the event stream of a
+large rendered spreadsheet.
+
+Usage: python benchmarks/bench_serializer.py [rows]
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+from genshi.core import Stream
+
+from py3o.template import Template
+from py3o.template.serializer import XMLSerializer
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_simple_calc.ods",
+)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    template = Template(TEMPLATE, BytesIO())
+    items = [
+        {"col1": i, "col2": "row %s" % i, "col3": i * 1.5, "col4": "x"}
+        for i in range(count)
+    ]
+    template.render_tree({"items": items})
+    # render once, serialize the same events with both serializers
+    events = list(template.output_streams[0][1])
+
+    start = time.perf_counter()
+    genshi_output = "".join(Stream(events).serialize(cache=False))
+    print("genshi: %.2fs" % (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    py3o_output = "".join(XMLSerializer()(events))
+    print("py3o:   %.2fs" % (time.perf_counter() - start))
+
+    assert genshi_output == py3o_output
+
+
+if __name__ == "__main__":
+    main()
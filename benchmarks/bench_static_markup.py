@@ -0,0 +1,76 @@
+"""Measure the render time of a small invoice with and without
+precompiled static markup.
+
+Usage: python benchmarks/bench_static_markup.py [renders]
+"""
+
+import os
+import sys
+import time
+from io import BytesIO
+
+import py3o.template.main
+from py3o.template import Template
+
+TEMPLATES = os.path.join(
+    os.path.dirname(__file__), "..", "py3o", "template", "tests", "templates"
+)
+
+
+class Item:
+    pass
+
+
+def make_data():
+    items = []
+    for i in range(5):
+        item = Item()
+        item.val1 = "Item%s Value1" % i
+        item.val2 = "Item%s Value2" % i
+        item.val3 = "Item%s Value3" % i
+        item.Currency = "EUR"
+        item.Amount = "6666.77"
+        item.InvoiceRef = "Reference #%04d" % i
+        items.append(item)
+    document = Item()
+    document.total = "9999999999999.999"
+    return dict(items=items, document=document)
+
+
+def compile_template():
+    template = Template(
+        os.path.join(TEMPLATES, "py3o_example_template.odt"), None
+    )
+    template.set_image_path(
+        "staticimage.logo", os.path.join(TEMPLATES, "images", "new_logo.png")
+    )
+    template.compile()
+    return template
+
+
+def bench(template, renders):
+    data = make_data()
+    start = time.perf_counter()
+    for _ in range(renders):
+        template.clone(BytesIO()).render(data)
+    return time.perf_counter() - start
+
+
+def main():
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    precompiled = compile_template()
+
+    precompile = py3o.template.main.precompile_static_markup
+    py3o.template.main.precompile_static_markup = lambda *args: None
+    try:
+        baseline = compile_template()
+    finally:
+        py3o.template.main.precompile_static_markup = precompile
+
+    print("genshi events:      %.2fs" % bench(baseline, renders))
+    print("precompiled chunks: %.2fs" % bench(precompiled, renders))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Measure the export of rows of tuples to a spreadsheet, through the
+template engine and with a table loop.
+
+The template is built from the simple calc test template, with its loop row
+widened to the given number of columns showing ``item[0]``, ``item[1]``...
+
+Usage: python benchmarks/bench_table_loop.py [rows] [columns]
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+import lxml.etree
+
+from py3o.template import Template
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_simple_calc.ods",
+)
+
+TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+
+def build_template(path, columns):
+    """Write a copy of the test template whose loop row has ``columns``
+    cells showing ``item[0]``, ``item[1]``...
+    """
+    with zipfile.ZipFile(TEMPLATE) as source:
+        content = lxml.etree.fromstring(source.read("content.xml"))
+        with zipfile.ZipFile(path, "w") as target:
+            for info in source.infolist():
+                if info.filename != "content.xml":
+                    target.writestr(info, source.read(info))
+
+            paragraph = content.xpath(
+                "//text:p[text()='${item.col1}']",
+                namespaces={"text": TEXT_NS},
+            )[0]
+            cell = paragraph.getparent()
+            row = cell.getparent()
+            for child in list(row):
+                row.remove(child)
+            for column in range(columns):
+                new_cell = copy.deepcopy(cell)
+                new_cell[0].text = "${item[%d]}" % column
+                row.append(new_cell)
+            target.writestr("content.xml", lxml.etree.tostring(content))
+
+
+def value(row, column):
+    if column % 3 == 0:
+        return row * column
+    if column % 3 == 1:
+        return row * 0.5
+    return "row %d" % row if row % 4 else None
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    items = [
+        tuple(value(i, column) for column in range(columns))
+        for i in range(rows)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        template_path = os.path.join(directory, "table_loop.ods")
+        build_template(template_path, columns)
+        for table_loop in (False, True):
+            with tempfile.NamedTemporaryFile(suffix=".ods") as outfile:
+                template = Template(
+                    template_path, outfile.name, compress_repeated=False
+                )
+                if table_loop:
+                    template.set_table_loop("items")
+                start = time.perf_counter()
+                template.render({"items": items})
+                print(
+                    "%d cells, table loop %s: %.2fs"
+                    % (
+                        rows * columns,
+                        "on" if table_loop else "off",
+                        time.perf_counter() - start,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Measure the rendering of a large spreadsheet of typed values, with and
+without the native typed cells.
+
+The template is built from the simple calc test template, with its loop row
+widened to the given number of columns.
+
+Usage: python benchmarks/bench_typed_cells.py [rows] [columns]
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from unittest import mock
+
+import lxml.etree
+
+from py3o.template import Template
+
+TEMPLATE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "py3o",
+    "template",
+    "tests",
+    "templates",
+    "py3o_simple_calc.ods",
+)
+
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+
+def build_template(path, columns):
+    """Write a copy of the test template whose loop row has ``columns``
+    cells showing ``item.col0``, ``item.col1``...
+    """
+    with zipfile.ZipFile(TEMPLATE) as source:
+        content = lxml.etree.fromstring(source.read("content.xml"))
+        with zipfile.ZipFile(path, "w") as target:
+            for info in source.infolist():
+                if info.filename != "content.xml":
+                    target.writestr(info, source.read(info))
+
+            paragraph = content.xpath(
+                "//text:p[text()='${item.col1}']",
+                namespaces={"text": TEXT_NS},
+            )[0]
+            cell = paragraph.getparent()
+            row = cell.getparent()
+            for child in list(row):
+                row.remove(child)
+            for column in range(columns):
+                new_cell = copy.deepcopy(cell)
+                new_cell[0].text = "${item.col%d}" % column
+                row.append(new_cell)
+            target.writestr("content.xml", lxml.etree.tostring(content))
+
+
+class Item:
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+
+def value(row, column):
+    if column % 3 == 0:
+        return row * column
+    if column % 3 == 1:
+        return row * 0.5
+    return "row %d" % row if row % 4 else None
+
+
+def render(template_path, items, typed_cells):
+    with tempfile.NamedTemporaryFile(suffix=".ods") as outfile:
+        template = Template(template_path, outfile.name)
+        if typed_cells:
+            template.render({"items": items})
+        else:
+            with mock.patch.object(
+                Template,
+                "_Template__is_typed_cell",
+                staticmethod(lambda cell, paragraphs: False),
+            ):
+                template.render({"items": items})
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    columns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # numbers, text and empty cells
+    items = [
+        Item({"col%d" % column: value(i, column) for column in range(columns)})
+        for i in range(rows)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        template_path = os.path.join(directory, "typed_cells.ods")
+        build_template(template_path, columns)
+        for typed_cells in (False, True):
+            start = time.perf_counter()
+            render(template_path, items, typed_cells)
+            print(
+                "%d rows x %d columns, typed cells %s: %.2fs"
+                % (
+                    rows,
+                    columns,
+                    "on" if typed_cells else "off",
+                    time.perf_counter() - start,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Render batches of documents with a pool of worker processes.
+
+In a mixed batch a few huge documents dominate the total run time; started
+last, they leave every other worker idle while they finish. The batch
+renderer below estimates the cost of each job before dispatching it and
+starts with the most expensive ones (the "longest processing time first"
+rule), which keeps the makespan close to the ideal one::
+
+    from py3o.template.batch import render_batch
+
+    render_batch(
+        [("invoice.odt", data, "out/%s.odt" % i) for i, data in ...],
+        template_dir="/path/to/templates",
+        processes=4,
+    )
+
+The same estimate makes a good priority for
+:meth:`py3o.template.jobs.JobQueue.submit`.
+"""
+
+import multiprocessing
+import os
+from collections.abc import Sized
+
+from py3o.template.cache import TemplateCache
+from py3o.template.data_struct import Py3oArray, Py3oModule
+
+# how many bytes of image data cost as much to render as one loop row
+BYTES_PER_ROW = 4096
+
+
+def _lookup(data, key):
+    """Get an attribute the way Genshi does: fall back on items."""
+    try:
+        return getattr(data, key)
+    except (AttributeError, TypeError):
+        try:
+            return data[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+
+def _binary_size(value):
+    """Return the size of a binary value, 0 for other values."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 0
+
+
+def _count_rows(node, data):
+    """Return the loop rows and the image bytes reached by walking ``data``
+    along the data structure ``node``.
+    """
+    rows = 0
+    image_bytes = 0
+    for key, child in node.items():
+        if isinstance(node, Py3oModule):
+            value = data.get(key)
+        else:
+            value = _lookup(data, key)
+        if value is None:
+            continue
+
+        if isinstance(child, Py3oArray):
+            # do not consume generators to count them
+            if not isinstance(value, Sized):
+                continue
+            rows += len(value)
+            for item in value:
+                if child.direct_access:
+                    image_bytes += _binary_size(item)
+                if child:
+                    item_rows, item_bytes = _count_rows(child, item)
+                    rows += item_rows
+                    image_bytes += item_bytes
+        elif child:
+            child_rows, child_bytes = _count_rows(child, value)
+            rows += child_rows
+            image_bytes += child_bytes
+        else:
+            image_bytes += _binary_size(value)
+    return rows, image_bytes
+
+
+def estimate_cost(data_structure, data, bytes_per_row=BYTES_PER_ROW):
+    """Estimate the cost of rendering ``data`` with a template.
+
+    The cost is the number of rows produced by the loops of the template,
+    nested loops included, plus the size of the binary (image) values the
+    template uses, counted in rows of ``bytes_per_row`` bytes. Only the
+    values found in the data structure count: the values of the data that
+    the template does not use, and the images of ``py3o.image`` frames,
+    which are not part of it, count for nothing. Iterables without a
+    length (generators) are not consumed and count for nothing.
+
+    :param data_structure: the data structure of the template, see
+      :meth:`py3o.template.Template.get_data_structure`
+    :type data_structure: py3o.template.data_struct.Py3oModule
+
+    :param data: the data the template will be rendered with
+    :type data: dict
+
+    :rtype: float
+    """
+    rows, image_bytes = _count_rows(data_structure, data)
+    return rows + image_bytes / bytes_per_row
+
+
+def schedule(jobs, cache, order="cost"):
+    """Return the jobs in the order they should be dispatched.
+
+    :param jobs: ``(template name, data, outfile)`` tuples
+    :param cache: the cache of the templates, which builds their data
+      structures
+    :type cache: py3o.template.cache.TemplateCache
+    :param order: ``"cost"`` to start with the most expensive jobs,
+      ``"fifo"`` to keep the given order
+    """
+    jobs = list(jobs)
+    if order == "fifo":
+        return jobs
+    if order != "cost":
+        raise ValueError("Unknown scheduling order '%s'" % order)
+
+    structures = {}
+
+    def cost(job):
+        name = job[0]
+        if name not in structures:
+            structures[name] = cache.get_data_structure(name)
+        return estimate_cost(structures[name], job[1])
+
+    # sorted is stable: jobs of the same cost keep their order
+    return sorted(jobs, key=cost, reverse=True)
+
+
+_worker_cache = None
+
+
+def _init_worker(template_dir, cache_options):
+    global _worker_cache
+    _worker_cache = TemplateCache(template_dir, **cache_options)
+
+
+def _render_job(job):
+    name, data, outfile = job
+    _worker_cache.render(name, data, outfile)
+    return outfile
+
+
+def render_batch(
+    jobs, template_dir=None, processes=None, order="cost", **cache_options
+):
+    """Render a batch of documents with a pool of worker processes.
+
+    Jobs are handed to the workers one at a time, largest first (see
+    :func:`schedule`), so that the expensive documents never end up
+    rendering alone at the end of the batch. Their data must be picklable.
+
+    :param jobs: ``(template name, data, outfile)`` tuples
+    :param template_dir: the template directory of the workers' caches
+    :param processes: the number of workers, defaults to the CPU count
+    :param order: ``"cost"`` (default) or ``"fifo"``
+    :param cache_options: extra :class:`TemplateCache` arguments
+
+    :returns: the output files, in the order they were completed
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    jobs = schedule(jobs, TemplateCache(template_dir, **cache_options), order)
+    with multiprocessing.Pool(
+        processes, _init_worker, (template_dir, cache_options)
+    ) as pool:
+        return list(pool.imap_unordered(_render_job, jobs, chunksize=1))
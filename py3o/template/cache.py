@@ -0,0 +1,238 @@
+"""A cache of compiled templates for long running processes.
+
+Loading a template parses its XML files and compiling it transforms them
+into Genshi templates; both steps can cost more than the rendering itself
+for small documents. The cache below keeps compiled templates in memory and
+hands out cheap clones of them (see :meth:`py3o.template.Template.clone`).
+
+The data structures of the templates (see
+:meth:`py3o.template.Template.get_data_structure`) are kept apart, keyed by
+the hash of the template content, so that they can be saved and loaded
+again by the next process.
+"""
+
+import gc
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+from py3o.template.main import Template, TemplateException
+
+
+class SchemaCache:
+    """An LRU cache of template data structures, keyed by the
+    ``content_hash`` of their template.
+
+    The cache is thread safe, and can be pickled with the data structures
+    it holds: :meth:`save` and :meth:`load` do so with a file.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        :param maxsize: the maximum number of data structures kept
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._schemas)
+
+    def __contains__(self, content_hash):
+        return content_hash in self._schemas
+
+    def get(self, content_hash, default=None):
+        """Return the data structure of the template content whose hash is
+        ``content_hash``, ``default`` if it is not in the cache."""
+        with self._lock:
+            schema = self._schemas.get(content_hash)
+            if schema is None:
+                return default
+            self._schemas.move_to_end(content_hash)
+            return schema
+
+    def __setitem__(self, content_hash, schema):
+        with self._lock:
+            self._schemas[content_hash] = schema
+            self._schemas.move_to_end(content_hash)
+            while len(self._schemas) > self.maxsize:
+                self._schemas.popitem(last=False)
+
+    def clear(self):
+        """Drop every data structure."""
+        with self._lock:
+            self._schemas.clear()
+
+    def __getstate__(self):
+        with self._lock:
+            return {
+                "maxsize": self.maxsize,
+                "schemas": list(self._schemas.items()),
+            }
+
+    def __setstate__(self, state):
+        self.maxsize = state["maxsize"]
+        self._schemas = OrderedDict(state["schemas"])
+        self._lock = threading.Lock()
+
+    def save(self, path):
+        """Write the cache to the file ``path``."""
+        with open(path, "wb") as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """Return the cache written to the file ``path`` by :meth:`save`.
+
+        The file is unpickled: only load files written by trusted processes.
+        """
+        with open(path, "rb") as f:
+            cache = pickle.load(f)
+        if not isinstance(cache, cls):
+            raise TemplateException("'%s' does not hold a schema cache" % path)
+        return cache
+
+
+class TemplateCache:
+    """An LRU cache of compiled :class:`py3o.template.Template` objects.
+
+    Templates are looked up by name. When a template directory is given,
+    names are relative paths inside that directory and cannot escape it;
+    otherwise they are plain file paths. A cached template is compiled again
+    when its file modification time changes.
+
+    The cache is thread safe.
+    """
+
+    def __init__(
+        self,
+        template_dir=None,
+        maxsize=128,
+        ignore_undefined_variables=False,
+        escape_false=False,
+        schemas=None,
+    ):
+        """
+        :param template_dir: the directory holding the templates, optional
+        :type template_dir: string
+
+        :param maxsize: the maximum number of compiled templates kept
+        :type maxsize: int
+
+        :param ignore_undefined_variables: passed to every Template
+        :type ignore_undefined_variables: boolean. Default is False
+
+        :param escape_false: passed to every Template
+        :type escape_false: boolean. Default is False
+
+        :param schemas: the cache of the data structures of the templates,
+          a new one by default
+        :type schemas: SchemaCache
+        """
+        self.template_dir = template_dir
+        self.maxsize = maxsize
+        self.ignore_undefined_variables = ignore_undefined_variables
+        self.escape_false = escape_false
+        self.schemas = SchemaCache() if schemas is None else schemas
+
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def resolve(self, name):
+        """Return the path of the template file named ``name``.
+
+        :raises: TemplateException if the name points outside the template
+        directory or if the file does not exist.
+        """
+        if self.template_dir is None:
+            path = os.path.realpath(name)
+        else:
+            root = os.path.realpath(self.template_dir)
+            path = os.path.realpath(os.path.join(root, name))
+            if os.path.commonpath([root, path]) != root:
+                raise TemplateException(
+                    "Template '%s' is outside of the template directory" % name
+                )
+
+        if not os.path.isfile(path):
+            raise TemplateException("Template '%s' not found" % name)
+        return path
+
+    def get(self, name):
+        """Return the compiled template named ``name``.
+
+        The returned template is shared: use its ``clone`` method to obtain
+        a template that can be rendered.
+        """
+        path = self.resolve(name)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._templates.get(path)
+            if entry is not None and entry[0] == mtime:
+                self._templates.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            template = Template(
+                path,
+                None,
+                ignore_undefined_variables=self.ignore_undefined_variables,
+                escape_false=self.escape_false,
+            )
+            template.compile()
+            self._templates[path] = (mtime, template)
+            self._templates.move_to_end(path)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+            return template
+
+    def preload(self, names, freeze=True):
+        """Load and compile the templates named ``names`` right away.
+
+        Meant for prefork servers (gunicorn, uwsgi...) that load the
+        application before forking workers: call this in the master so that
+        the workers inherit compiled templates instead of compiling their
+        own copy.
+
+        :param freeze: move every object tracked by the garbage collector,
+        compiled templates included, to a permanent generation (see
+        ``gc.freeze``). The collector of a forked worker then never visits,
+        hence never writes to, those objects and the memory pages holding
+        them stay shared with the master.
+        :type freeze: boolean. Default is True
+        """
+        for name in names:
+            self.get(name)
+
+        if freeze:
+            # collect first so that garbage does not get frozen with the rest
+            gc.collect()
+            gc.freeze()
+
+    def get_data_structure(self, name):
+        """Return the data structure expected by the template named
+        ``name``, built once per template content.
+
+        The returned data structure is shared and must not be modified.
+        """
+        return self.get(name).get_data_structure(self.schemas)
+
+    def render(self, name, data, outfile):
+        """Render the template named ``name`` with ``data`` into ``outfile``.
+
+        :param outfile: a file name or a binary file object
+        """
+        self.get(name).clone(outfile).render(data)
+
+    def clear(self):
+        """Drop every compiled template."""
+        with self._lock:
+            self._templates.clear()
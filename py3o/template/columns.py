@@ -0,0 +1,140 @@
+"""Column oriented loop data.
+
+Data often comes as columns: query results fetched column by column,
+NumPy arrays, data frames... Rendering them in a loop such as
+``for="line in lines"`` used to require one object per row, built up front
+and kept alive during the whole rendering.
+
+:class:`Columns` wraps a mapping of column names to sequences and is iterated
+as rows, which the template uses the usual way: ``${line.amount}`` or
+``${line['amount']}``::
+
+    lines = Columns({"label": labels, "amount": amounts})
+    t.render(dict(lines=lines))
+
+The rows are built block by block while the template is rendered, so that
+only a block of rows is ever in memory. Columns with a ``tolist`` method
+(NumPy arrays, ``array.array``...) are converted one block at a time to
+native Python values, which are rendered like any other number.
+"""
+
+import functools
+import itertools
+import operator
+from collections.abc import Sequence
+
+# row classes kept for the column names seen last
+ROW_TYPE_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=ROW_TYPE_CACHE_SIZE)
+def row_type(names):
+    """Return the class of the rows of columns ``names``: tuples whose
+    values are also found by column name, as items or attributes.
+
+    :param names: the column names
+    :type names: tuple of str
+    """
+    positions = {name: position for position, name in enumerate(names)}
+
+    def __getitem__(self, key):
+        if type(key) is str:
+            return tuple.__getitem__(self, positions[key])
+        return tuple.__getitem__(self, key)
+
+    def __reduce__(self):
+        return _make_row, (names, tuple(self))
+
+    def __repr__(self):
+        return "Row(%s)" % ", ".join(
+            "%s=%r" % item for item in zip(names, self)
+        )
+
+    namespace = {
+        "__slots__": (),
+        "__getitem__": __getitem__,
+        "__reduce__": __reduce__,
+        "__repr__": __repr__,
+        "_fields": names,
+    }
+    for position, name in enumerate(names):
+        if name.isidentifier() and not name.startswith("_"):
+            namespace[name] = property(operator.itemgetter(position))
+
+    return type("Row", (tuple,), namespace)
+
+
+def _make_row(names, values):
+    return row_type(names)(values)
+
+
+def _block(column, start, stop):
+    """Return the values of a column between ``start`` and ``stop`` as a
+    list of Python values."""
+    values = column[start:stop]
+    tolist = getattr(values, "tolist", None)
+    if tolist is not None:
+        return tolist()
+    return list(values)
+
+
+class Columns(Sequence):
+    """A sequence of rows stored as columns.
+
+    The rows are light tuples whose values are also reachable by column
+    name, as attributes (when the name is a valid identifier) or items:
+    ``row.amount``, ``row['amount']`` and ``row[1]`` are the same value.
+    """
+
+    # rows built at once while iterating
+    BLOCK_SIZE = 1000
+
+    def __init__(self, columns, block_size=None):
+        """
+        :param columns: the values of each column, all of the same length
+        :type columns: a mapping of column names to sequences, such as lists
+          or NumPy arrays
+
+        :param block_size: how many rows are built at once while iterating
+        :type block_size: int
+        """
+        self.columns = dict(columns)
+        self.names = tuple(self.columns)
+        self.block_size = block_size or self.BLOCK_SIZE
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("All the columns must have the same length")
+        self.length = lengths.pop() if lengths else 0
+        self.row_type = row_type(self.names)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Columns(
+                {name: column[index] for name, column in self.columns.items()},
+                self.block_size,
+            )
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Columns index out of range")
+        return next(iter(self.blocks(index, index + 1)))[0]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.blocks())
+
+    def blocks(self, start=0, stop=None):
+        """Yield the rows from ``start`` to ``stop`` as lists of
+        :attr:`block_size` rows."""
+        if stop is None:
+            stop = self.length
+        make = self.row_type
+        columns = list(self.columns.values())
+        for block_start in range(start, stop, self.block_size):
+            block_stop = min(block_start + self.block_size, stop)
+            values = [
+                _block(column, block_start, block_stop) for column in columns
+            ]
+            yield list(map(make, zip(*values)))
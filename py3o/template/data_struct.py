@@ -2,17 +2,37 @@
 See the docstring of Py3oConvertor.__call__() for further information
 """
 
+import itertools
+import json
+import operator
 from numbers import Number
 
+from py3o.template.columns import row_type
+
+# the size of the chunks of JSON text yielded by Py3oModule.iter_json
+JSON_CHUNK_SIZE = 65536
+# the number of list items converted to JSON at once
+JSON_BLOCK_SIZE = 1000
+
 
 class Py3oDataError(Exception):
     pass
 
 
 class Py3oObject(dict):
-    """Base class to be inherited."""
+    """Base class to be inherited.
 
-    is_list = False
+    The nodes have no instance dictionary: their attributes are slots, so
+    that a data structure costs little more than its dicts.
+    """
+
+    __slots__ = ("is_list", "direct_access")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_list = False
+        # only used by Py3oArray, but set on any accessed node
+        self.direct_access = False
 
     def render(self, data):  # pragma: no cover
         raise NotImplementedError("This function should be overriden")
@@ -142,8 +162,61 @@ class Py3oObject(dict):
             }
         return res
 
+    def _has_loops(self):
+        """Tell if the node renders lists of objects."""
+        # not self.values(): Py3oContainer shadows it
+        return any(child._has_loops() for child in dict.values(self))
+
+    def _json_parts(self, data):
+        """Yield the JSON text of ``self.render(data)``, in parts."""
+        yield json.dumps(self.render(data))
+
+    def _json_children(self, data, streamed):
+        """Yield the JSON text of ``self.render_children(data)``, in parts:
+        one per child if ``streamed``, a single one otherwise."""
+        if not streamed:
+            yield json.dumps(self.render_children(data))
+            return
+        separator = "{"
+        for key, child in self.items():
+            yield "%s%s: " % (separator, json.dumps(key))
+            yield from child._json_parts(getattr(data, key))
+            separator = ", "
+        yield "}" if separator == ", " else "{}"
+
 
 class Py3oModule(Py3oObject):
+    # the functions compiled by get_extractor
+    __slots__ = ("_extractors",)
+
+    def __getstate__(self):
+        # the compiled functions cannot be pickled, nor copied usefully
+        return None, {
+            "is_list": self.is_list,
+            "direct_access": self.direct_access,
+        }
+
+    def get_extractor(self, records=False):
+        """Return a function extracting from the user's data the same as
+        :meth:`render`, compiled for this data structure.
+
+        The function is compiled on the first call, and kept with the data
+        structure: it must not be modified afterwards.
+
+        :param records: the objects of the data are extracted as tuples
+          whose items are also attributes, instead of dicts
+        :type records: boolean
+        """
+        try:
+            extractors = self._extractors
+        except AttributeError:
+            extractors = self._extractors = {}
+        extractor = extractors.get(records)
+        if extractor is None:
+            extractor = compile_extractor(self, records)
+            extractors[records] = extractor
+        return extractor
+
     def render(self, data):
         """This function will render the datastruct according
         to the user's data
@@ -162,6 +235,65 @@ class Py3oModule(Py3oObject):
                 res[key] = val
         return res
 
+    def iter_json(self, data, chunk_size=JSON_CHUNK_SIZE):
+        """Yield the JSON text of ``self.render(data)``, in chunks.
+
+        The lists of objects are extracted and converted one object at a
+        time, while the chunks are consumed: the data extracted is never
+        held in memory as a whole, and the first chunks come before the end
+        of the extraction. The chunks joined are ``json.dumps(render(data))``.
+
+        :param chunk_size: the size of the chunks, in characters
+        :type chunk_size: int
+        """
+        for key in self:
+            if data.get(key, None) is None:
+                # as render does, before anything is written
+                raise Py3oDataError(
+                    "The key '%s' must be present"
+                    " in your data dictionary" % key
+                )
+        chunk = []
+        size = 0
+        for part in self._json_module(data):
+            chunk.append(part)
+            size += len(part)
+            if size >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield "".join(chunk)
+
+    def dump_json(self, data, stream, chunk_size=JSON_CHUNK_SIZE):
+        """Write the JSON text of ``self.render(data)`` into ``stream``, a
+        text file object, as :meth:`iter_json` yields it."""
+        for chunk in self.iter_json(data, chunk_size):
+            stream.write(chunk)
+
+    def _json_module(self, data):
+        separator = "{"
+        for key, child in self.items():
+            value = data.get(key)
+            if (
+                type(child) in (Py3oArray, Py3oName)
+                and not child.is_list
+                and child._has_loops()
+            ):
+                yield "%s%s: " % (separator, json.dumps(key))
+                yield from child._json_parts(value)
+            else:
+                value = child.render(value)
+                if value is None:
+                    continue
+                yield "%s%s: %s" % (
+                    separator,
+                    json.dumps(key),
+                    json.dumps(value),
+                )
+            separator = ", "
+        yield "}" if separator == ", " else "{}"
+
 
 class Py3oArray(Py3oObject):
     """A class representing an iterable value in the data structure.
@@ -169,9 +301,7 @@ class Py3oArray(Py3oObject):
      as a list of dict or a list of values.
     """
 
-    def __init__(self):
-        super().__init__()
-        self.direct_access = False
+    __slots__ = ()
 
     def render(self, data):
         """This function will render the datastruct according
@@ -185,6 +315,25 @@ class Py3oArray(Py3oObject):
             res = [self.render_children(d) for d in data]
         return res
 
+    def _has_loops(self):
+        return not self.direct_access and bool(self)
+
+    def _json_parts(self, data):
+        if self.direct_access and isinstance(data, (list, tuple)):
+            yield from _json_list(data)
+        elif self.is_list or not self._has_loops():
+            yield json.dumps(self.render(data))
+        elif super()._has_loops():
+            # the objects have lists of their own: stream them as well
+            separator = "["
+            for item in data:
+                yield separator
+                yield from self._json_children(item, True)
+                separator = ", "
+            yield "]" if separator == ", " else "[]"
+        else:
+            yield from _json_list(map(self.render_children, data))
+
 
 class Py3oName(Py3oObject):
     """This class holds information of variables.
@@ -193,6 +342,8 @@ class Py3oName(Py3oObject):
     i.e.: i.egg -> Py3oName({'i': Py3oName({'egg': Py3oName({})})})
     """
 
+    __slots__ = ()
+
     def render(self, data):
         """This function will render the datastruct according
         to the user's data
@@ -205,6 +356,12 @@ class Py3oName(Py3oObject):
             res = self.render_children(data)
         return res
 
+    def _json_parts(self, data):
+        if self.is_list or not self._has_loops():
+            yield json.dumps(self.render(data))
+        else:
+            yield from self._json_children(data, True)
+
 
 class Py3oCall(Py3oObject):
     """This class holds information of function call.
@@ -214,6 +371,8 @@ class Py3oCall(Py3oObject):
         - string keys are keywords arguments
     """
 
+    __slots__ = ("name",)
+
     return_format = None
 
     def __init__(self, name, dict):
@@ -262,6 +421,8 @@ class Py3oCall(Py3oObject):
 class Py3oEnumerate(Py3oCall):
     """Represent an enumerate call"""
 
+    __slots__ = ()
+
     return_format = (None, 0)
 
 
@@ -272,6 +433,9 @@ class Py3oContainer(Py3oObject):
     _ A tuple of variables that are the target of an unpack assignment
     """
 
+    # shadows dict.values, as the attribute did
+    __slots__ = ("values",)
+
     def __init__(self, values):
         super().__init__()
         self.values = values
@@ -286,12 +450,14 @@ class Py3oDummy(Py3oObject):
     such as counters from enumerate()
     """
 
-    pass
+    __slots__ = ()
 
 
 class Py3oBuiltin(Py3oObject):
     """This class holds information about builtins"""
 
+    __slots__ = ()
+
     builtins = {"enumerate": Py3oEnumerate}
 
     @classmethod
@@ -311,3 +477,137 @@ class Py3oBuiltin(Py3oObject):
         #     else:
         #     builtin = None
         return builtin
+
+
+def _json_list(items):
+    """Yield the JSON text of the list of ``items``, JSON_BLOCK_SIZE items
+    at a time."""
+    items = iter(items)
+    separator = "["
+    while True:
+        block = list(itertools.islice(items, JSON_BLOCK_SIZE))
+        if not block:
+            break
+        # without its brackets
+        yield separator + json.dumps(block)[1:-1]
+        separator = ", "
+    yield "]" if separator == ", " else "[]"
+
+
+class _ExtractorCompiler:
+    """Write the source code of the function extracting the data of a
+    Py3oModule."""
+
+    def __init__(self, records):
+        self.records = records
+        self.namespace = {
+            "_Number": Number,
+            "_Py3oDataError": Py3oDataError,
+        }
+        self.functions = []
+
+    def add(self, prefix, value):
+        """Add ``value`` to the namespace of the function, return its
+        name."""
+        name = "_%s%d" % (prefix, len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def expression(self, node, value):
+        """Return the expression of ``node.render(value)``."""
+        if node.is_list or not all(type(key) is str for key in node):
+            # unpacked loop targets and the like
+            return "%s(%s)" % (self.add("render", node.render), value)
+        if type(node) is Py3oName:
+            if not node:
+                return "(%s if %s or isinstance(%s, _Number) else '')" % (
+                    (value,) * 3
+                )
+            getter, variables, result = self.children(node)
+            function = "_object%d" % len(self.functions)
+            self.functions.append(
+                "def %s(data):\n"
+                "    %s = %s(data)\n"
+                "    return %s\n" % (function, variables, getter, result)
+            )
+            return "%s(%s)" % (function, value)
+        if type(node) is Py3oArray:
+            if node.direct_access:
+                return value
+            if not node:
+                return "None"
+            getter, variables, result = self.children(node)
+            function = "_array%d" % len(self.functions)
+            self.functions.append(
+                "def %s(data):\n"
+                "    return [%s for %s in map(%s, data)]\n"
+                % (function, result, variables, getter)
+            )
+            return "%s(%s)" % (function, value)
+        return "%s(%s)" % (self.add("render", node.render), value)
+
+    def children(self, node):
+        """Return the name of the attribute getter of the children of
+        ``node``, the variables it assigns and the expression of the object
+        rendered from them."""
+        keys = tuple(node)
+        getter = self.add("get", operator.attrgetter(*keys))
+        # every object is rendered by its own function: no name clashes
+        variables = ["v%d" % i for i in range(len(keys))]
+        expressions = [
+            self.expression(child, variable)
+            for child, variable in zip(node.values(), variables)
+        ]
+        if self.records:
+            result = "%s((%s,))" % (
+                self.add("record", row_type(keys)),
+                ", ".join(expressions),
+            )
+        else:
+            result = "{%s}" % ", ".join(
+                "%r: %s" % item for item in zip(keys, expressions)
+            )
+        if len(variables) == 1:
+            # attrgetter returns the value itself
+            return getter, variables[0], result
+        return getter, ", ".join(variables), result
+
+    def module(self, module):
+        """Return the source code of the function extracting the data of
+        ``module``."""
+        lines = ["def extract(data):", "    result = {}"]
+        for key, child in module.items():
+            lines += [
+                "    value = data.get(%r, None)" % key,
+                "    if value is None:",
+                "        raise _Py3oDataError(%r)"
+                % (
+                    "The key '%s' must be present in your data dictionary"
+                    % key
+                ),
+                "    value = %s" % self.expression(child, "value"),
+                "    if value is not None:",
+                "        result[%r] = value" % key,
+            ]
+        lines.append("    return result\n")
+        return "\n".join(self.functions + lines)
+
+
+def compile_extractor(module, records=False):
+    """Return a function extracting from the user's data the same as
+    ``module.render``, as Python code written for this data structure.
+
+    The objects of the data are read with ``operator.attrgetter`` and their
+    lists with list comprehensions, instead of walking the data structure
+    for every object. The nodes the code is not written for are rendered by
+    their ``render`` method. See :meth:`Py3oModule.get_extractor`, which
+    keeps the compiled function.
+
+    :param records: see :meth:`Py3oModule.get_extractor`
+    """
+    if not all(type(key) is str for key in module):
+        return module.render
+    compiler = _ExtractorCompiler(records)
+    source = compiler.module(module)
+    exec(compile(source, "<py3o extractor>", "exec"), compiler.namespace)
+    return compiler.namespace["extract"]
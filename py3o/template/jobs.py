@@ -0,0 +1,433 @@
+"""A durable render job queue stored in a SQLite database.
+
+Large batch runs are queued as jobs (a template name, a JSON data payload
+and an output file) and rendered by local worker processes. The queue keeps
+track of the state of every job, so a run interrupted by a crash or a
+restart picks up where it stopped instead of starting over::
+
+    from py3o.template.jobs import JobQueue, run_workers
+
+    queue = JobQueue("batch.sqlite")
+    queue.submit_many(
+        ("invoice.odt", invoice, "out/%s.odt" % invoice["number"])
+        for invoice in invoices
+    )
+    run_workers("batch.sqlite", "/path/to/templates", processes=4)
+
+SQLite has no row locks: workers claim jobs in ``BEGIN IMMEDIATE``
+transactions, which serialize the claims without blocking the renders.
+"""
+
+import contextlib
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from py3o.template.cache import TemplateCache
+from py3o.template.main import TemplateException
+
+log = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Job = namedtuple(
+    "Job", ["id", "template", "data", "outfile", "attempts", "worker"]
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS py3o_job (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    template TEXT NOT NULL,
+    data TEXT NOT NULL,
+    outfile TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    priority REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS py3o_job_state
+    ON py3o_job (state, priority DESC, id);
+"""
+
+
+class JobQueue:
+    """Render jobs stored in a SQLite database.
+
+    A job is ``pending`` until a worker claims it and marks it ``running``.
+    It then ends up ``done``, or back to ``pending`` when rendering failed
+    and it has been attempted less than ``max_attempts`` times, ``failed``
+    otherwise. A ``running`` job whose worker did not report back within
+    ``lease`` seconds (because it crashed) is claimable again, or
+    ``failed`` when it has no attempts left: a job that kills its worker is
+    not retried forever. Only the worker holding a job can complete, fail
+    or renew it.
+
+    Instances can be shared between processes: each process opens its own
+    database connection.
+    """
+
+    def __init__(self, path, max_attempts=3, lease=600):
+        """
+        :param path: the SQLite database file, created if needed
+        :type path: string
+
+        :param max_attempts: how many times a job is tried before failing
+        :type max_attempts: int
+
+        :param lease: delay (in seconds) after which a running job is
+        considered abandoned by its worker. :func:`work` renews the lease of
+        the job it renders, so it may be shorter than the longest render.
+        :type lease: float
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._connection = None
+        self._connection_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = state["_connection_pid"] = None
+        return state
+
+    @property
+    def connection(self):
+        # SQLite connections must not cross a fork
+        if self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def submit(self, template, data, outfile, priority=0):
+        """Queue a job and return its identifier.
+
+        :param template: the template name, as understood by the
+        :class:`py3o.template.cache.TemplateCache` of the workers
+        :param data: the data to render, serializable to JSON
+        :param outfile: the file name of the rendered document
+        :param priority: jobs with a higher priority are claimed first
+        """
+        cursor = self.connection.execute(
+            "INSERT INTO py3o_job (template, data, outfile, priority) "
+            "VALUES (?, ?, ?, ?)",
+            (template, json.dumps(data), outfile, priority),
+        )
+        return cursor.lastrowid
+
+    def submit_many(self, jobs):
+        """Queue many jobs in a single transaction.
+
+        :param jobs: an iterable of ``(template, data, outfile)`` or
+        ``(template, data, outfile, priority)`` tuples
+        """
+        rows = (
+            (job[0], json.dumps(job[1]), job[2], job[3] if job[3:] else 0)
+            for job in jobs
+        )
+        connection = self.connection
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(
+                "INSERT INTO py3o_job (template, data, outfile, priority) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def claim(self, worker=None):
+        """Mark the next job as running and return it, None if there is
+        nothing left to do.
+        """
+        if worker is None:
+            worker = str(os.getpid())
+        now = time.time()
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE py3o_job SET state = ?, error = ? "
+                "WHERE state = ? AND claimed_at < ? AND attempts >= ?",
+                (
+                    FAILED,
+                    "Lease expired",
+                    RUNNING,
+                    now - self.lease,
+                    self.max_attempts,
+                ),
+            )
+            row = connection.execute(
+                "SELECT id, template, data, outfile, attempts FROM py3o_job "
+                "WHERE state = ? "
+                "OR (state = ? AND claimed_at < ? AND attempts < ?) "
+                "ORDER BY priority DESC, id LIMIT 1",
+                (PENDING, RUNNING, now - self.lease, self.max_attempts),
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE py3o_job SET state = ?, attempts = attempts + 1, "
+                    "worker = ?, claimed_at = ? WHERE id = ?",
+                    (RUNNING, worker, now, row[0]),
+                )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+        if row is None:
+            return None
+        job_id, template, data, outfile, attempts = row
+        return Job(
+            job_id, template, json.loads(data), outfile, attempts + 1, worker
+        )
+
+    def _update_claimed(self, job, assignments, values):
+        # the job may have been claimed again since its lease expired
+        cursor = self.connection.execute(
+            "UPDATE py3o_job SET %s "
+            "WHERE id = ? AND worker = ? AND state = ? AND attempts = ?"
+            % assignments,
+            values + (job.id, job.worker, RUNNING, job.attempts),
+        )
+        return cursor.rowcount == 1
+
+    def renew(self, job):
+        """Extend the lease of a claimed job, return False if the job is not
+        held by its worker anymore.
+        """
+        return self._update_claimed(job, "claimed_at = ?", (time.time(),))
+
+    def complete(self, job):
+        """Mark a claimed job as done, return False if the job is not held
+        by its worker anymore.
+        """
+        return self._update_claimed(job, "state = ?, error = NULL", (DONE,))
+
+    def fail(self, job, error):
+        """Record the failure of a claimed job, queue it again if it has
+        attempts left. Return False if the job is not held by its worker
+        anymore.
+        """
+        state = PENDING if job.attempts < self.max_attempts else FAILED
+        return self._update_claimed(
+            job, "state = ?, error = ?", (state, str(error))
+        )
+
+    def recover(self):
+        """Make every running job claimable again, or failed if it has no
+        attempts left.
+
+        Call it when (re)starting a run after all the workers of a previous
+        run died, rather than waiting for their leases to expire.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE py3o_job SET state = ?, error = ? "
+                "WHERE state = ? AND attempts >= ?",
+                (FAILED, "Lease expired", RUNNING, self.max_attempts),
+            )
+            connection.execute(
+                "UPDATE py3o_job SET state = ? WHERE state = ?",
+                (PENDING, RUNNING),
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def counts(self):
+        """Return the number of jobs in each state."""
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update(
+            self.connection.execute(
+                "SELECT state, count(*) FROM py3o_job GROUP BY state"
+            )
+        )
+        return counts
+
+    def templates(self):
+        """Return the names of the templates of the jobs left to do."""
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT DISTINCT template FROM py3o_job WHERE state IN (?, ?)",
+                (PENDING, RUNNING),
+            )
+        ]
+
+    def errors(self):
+        """Return ``(job id, error)`` pairs for the failed jobs."""
+        return self.connection.execute(
+            "SELECT id, error FROM py3o_job WHERE state = ? ORDER BY id",
+            (FAILED,),
+        ).fetchall()
+
+
+@contextlib.contextmanager
+def _renewing(queue, job):
+    """Renew the lease of ``job`` from a thread until the block exits."""
+    if queue.lease <= 0:
+        yield
+        return
+
+    stop = threading.Event()
+
+    def renew():
+        # SQLite connections must not cross threads
+        renewer = JobQueue(queue.path, queue.max_attempts, queue.lease)
+        try:
+            while not stop.wait(queue.lease / 3) and renewer.renew(job):
+                pass
+        finally:
+            renewer.connection.close()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def work(queue, cache, worker=None, max_jobs=None):
+    """Render the jobs of ``queue`` until there is none left.
+
+    Documents are first rendered to a temporary file, unique to the claim of
+    the job, then renamed, so an interrupted render never leaves a truncated
+    document behind. The lease of the job is renewed while it is rendered,
+    and a job whose lease was lost meanwhile is left to the worker that
+    claimed it again.
+
+    :param queue: the job queue
+    :type queue: JobQueue
+
+    :param cache: the compiled templates to render the jobs with
+    :type cache: py3o.template.cache.TemplateCache
+
+    :param max_jobs: stop after this many jobs, optional
+    :type max_jobs: int
+
+    :returns: the number of jobs processed
+    """
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = queue.claim(worker)
+        if job is None:
+            break
+        processed += 1
+
+        partfile = "%s.%s-%d.part" % (job.outfile, os.getpid(), job.attempts)
+        try:
+            with _renewing(queue, job):
+                cache.render(job.template, job.data, partfile)
+            if not queue.renew(job):
+                log.warning("Job %s was claimed again, dropped", job.id)
+                os.unlink(partfile)
+                continue
+            os.replace(partfile, job.outfile)
+        except Exception as e:
+            log.warning("Job %s failed: %s", job.id, e, exc_info=True)
+            if os.path.exists(partfile):
+                os.unlink(partfile)
+            queue.fail(job, e)
+        else:
+            if not queue.complete(job):
+                log.warning(
+                    "Job %s was claimed again while completed, its output "
+                    "may be overwritten",
+                    job.id,
+                )
+    return processed
+
+
+def _work(path, template_dir, max_attempts, lease, cache_options, cache):
+    queue = JobQueue(path, max_attempts=max_attempts, lease=lease)
+    if cache is None:
+        cache = TemplateCache(template_dir, **cache_options)
+    work(queue, cache)
+
+
+def run_workers(
+    path,
+    template_dir=None,
+    processes=None,
+    max_attempts=3,
+    lease=600,
+    **cache_options,
+):
+    """Render all the jobs of a queue with several worker processes.
+
+    Where processes can be forked, the templates of the queued jobs are
+    compiled once, before starting the workers, which share them.
+
+    :param path: the SQLite database file of the queue
+    :param template_dir: the template directory of the workers' caches
+    :param processes: the number of workers, defaults to the CPU count
+    :param cache_options: extra :class:`TemplateCache` arguments
+
+    :returns: the number of jobs in each state once the workers are done
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    cache = None
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        cache = TemplateCache(template_dir, **cache_options)
+        names = []
+        for name in JobQueue(path).templates():
+            try:
+                cache.get(name)
+            except TemplateException:
+                # left to the workers, which record the error in the jobs
+                continue
+            names.append(name)
+        cache.preload(names)
+    else:
+        # the compiled templates cannot be sent to spawned processes
+        context = multiprocessing.get_context()
+
+    workers = [
+        context.Process(
+            target=_work,
+            args=(
+                path,
+                template_dir,
+                max_attempts,
+                lease,
+                cache_options,
+                cache,
+            ),
+        )
+        for _ in range(processes)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+    finally:
+        if cache is not None:
+            gc.unfreeze()
+    for worker in workers:
+        worker.join()
+
+    return JobQueue(path).counts()
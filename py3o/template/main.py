@@ -1,8 +1,12 @@
 import codecs
+import collections
 import decimal
+import functools
 import hashlib
-import locale
+import itertools
 import logging
+import math
+import operator
 import os
 import re
 import tempfile
@@ -11,8 +15,9 @@ import urllib.parse
 import warnings
 import zipfile
 from base64 import b64decode
+from concurrent.futures import ProcessPoolExecutor
 from copy import copy
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from io import BytesIO
 from uuid import uuid4
 from xml.sax.saxutils import escape
@@ -20,22 +25,46 @@ from xml.sax.saxutils import escape
 import babel.dates
 import babel.numbers
 import lxml.etree
-from genshi.core import Markup
-from genshi.filters.transform import Transformer
+from genshi.core import START, TEXT, Markup, QName
+from genshi.input import XMLParser
 from genshi.template import MarkupTemplate
+from genshi.template.eval import LenientLookup, StrictLookup
 from genshi.template.text import NewTextTemplate as GenshiTextTemplate
 from PIL import Image
 
+from py3o.template.helpers import Py3oConvertor
+from py3o.template.repeat import RepeatCompressor
+from py3o.template.serializer import (
+    StaticMarkup,
+    XMLSerializer,
+    escape_attribute,
+    escape_text,
+    precompile_static_markup,
+    strip_text,
+)
+from py3o.template.split import TableSplitter
+
 log = logging.getLogger(__name__)
 
 # expressed in clark notation: http://www.jclark.com/xml/xmlns.htm
 XML_NS = "{http://www.w3.org/XML/1998/namespace}"
 
+# amount of serialized XML (in characters) encoded and written at once
+OUTPUT_BUFFER_SIZE = 64 * 1024
+SPREADSHEET_MIMETYPE = "application/vnd.oasis.opendocument.spreadsheet"
+
 GENSHI_URI = "http://genshi.edgewall.org/"
 REGEXP_URI = "http://exslt.org/regular-expressions"
 PY3O_URI = "http://py3o.org/"
 MANIFEST = "META-INF/manifest.xml"
 
+# Babel locales and parsed format patterns kept by the format helpers
+LOCALE_CACHE_SIZE = 64
+PATTERN_CACHE_SIZE = 256
+DATE_CACHE_SIZE = 4096
+# compiled loop chunk templates kept by each process rendering loop chunks
+LOOP_CHUNK_CACHE_SIZE = 32
+
 
 def _get_secure_filename(prefix="tmp", suffix=""):
     """creates a tempfile in the most secure manner possible,
@@ -140,8 +169,14 @@ def move_siblings(
         old_.remove(end)
 
 
+def get_list_tags(namespaces):
+    """the tags handled by the list transformer, which must reach it as
+    stream events"""
+    return (QName("%s}list" % namespaces.get("text")),)
+
+
 def get_list_transformer(namespaces):
-    """this function returns a transformer to
+    """this function returns a stream filter to
      find all list elements and recompute their xml:id.
     Because if we duplicate lists we create invalid XML.
     Each list must have its own xml:id
@@ -149,10 +184,20 @@ def get_list_transformer(namespaces):
     This is important if you want to be able to reopen the produced
      document wih an XML parser. LibreOffice will fix those ids itself
      silently, but lxml.etree.parse will bork on such duplicated lists
+
+    The filter handles one event at a time and never buffers the stream.
     """
-    return Transformer(
-        '//list[namespace-uri()="%s"]' % namespaces.get("text")
-    ).attr(f"{XML_NS}id", lambda *args: f"list{uuid4().hex}")
+    (list_tag,) = get_list_tags(namespaces)
+    id_attr = QName(f"{XML_NS}id")
+
+    def list_filter(stream):
+        for kind, data, pos in stream:
+            if kind is START and data[0] == list_tag:
+                tag, attrs = data
+                data = tag, attrs | [(id_attr, f"list{uuid4().hex}")]
+            yield kind, data, pos
+
+    return list_filter
 
 
 def get_all_python_expression(content_trees, namespaces):
@@ -213,6 +258,9 @@ def format_locale(amount, format_, locale_, grouping=True):
     """format the given amount using the format and a locale
     example: format_locale(10000.33, "%.02f", "fr_FR.UTF-8")
     will give you: "10 000,33"
+
+    The separators are those of the Babel locale: the locale of the process
+    is left untouched, so that documents can be rendered in several threads.
     """
 
     warnings.warn(
@@ -221,11 +269,124 @@ def format_locale(amount, format_, locale_, grouping=True):
         DeprecationWarning,
     )
 
-    # pragma: nocover
-    # Not including this into tests as this was short-lived and now deprecated.
+    match = _percent.fullmatch(format_)
+    if match is None:
+        raise ValueError(
+            "format() must be given exactly one %%char format specifier, "
+            "%s not valid" % repr(format_)
+        )
+    formatted = format_ % amount
+    if format_[-1] not in "eEfFgGdiu":
+        return formatted
+
+    # as locale.format does, with the conventions of the Babel locale rather
+    # than setting the locale of the whole process
+    if not locale_:
+        # the locale of the environment, the C locale when none is set, as
+        # setlocale does
+        locale_ = babel.default_locale("LC_NUMERIC") or "C"
+    decimal_point, thousands_sep, intervals = _get_locale_conventions(locale_)
+    integer, point, fraction = formatted.partition(".")
+    separators = 0
+    if grouping and intervals:
+        integer, separators = _group_digits(integer, thousands_sep, intervals)
+    formatted = integer + (decimal_point if point else "") + fraction
+    if separators:
+        # the separators take the place of the padding
+        start = len(formatted) - len(formatted.lstrip(" "))
+        start = min(start, separators)
+        separators -= start
+        end = len(formatted) - len(formatted.rstrip(" "))
+        end = len(formatted) - min(end, separators)
+        formatted = formatted[start:end]
+    return formatted
+
+
+# a single % format specifier
+_percent = re.compile(
+    r"%(?:\((?P<key>.*?)\))?(?P<modifiers>[-#0-9 +*.hlL]*?)[eEfFgGdiouxXcrs%]"
+)
+
+
+@functools.lru_cache(maxsize=LOCALE_CACHE_SIZE)
+def _get_locale_conventions(identifier):
+    """Return the decimal point, the thousands separator and the sizes of the
+    digit groups of a locale, as given by locale.localeconv.
+
+    :param identifier: a POSIX locale name, such as "fr_FR.UTF-8"
+    """
+    if identifier in ("C", "POSIX") or identifier.startswith(("C.", "POSIX.")):
+        return ".", "", ()
+    babel_locale = _get_locale(identifier)
+    primary, secondary = babel_locale.decimal_formats[None].grouping
+    if primary >= 1000:
+        # no grouping
+        return babel.numbers.get_decimal_symbol(babel_locale), "", ()
+    return (
+        babel.numbers.get_decimal_symbol(babel_locale),
+        babel.numbers.get_group_symbol(babel_locale),
+        (primary, secondary),
+    )
+
+
+def _group_digits(integer, thousands_sep, intervals):
+    """Group the digits of a formatted integer as locale.format does, return
+    the grouped integer and the length of the separators added."""
+    stripped = integer.rstrip(" ")
+    right_spaces = integer[len(stripped) :]
+    integer = stripped
+    left_spaces = ""
+    groups = []
+    primary, secondary = intervals
+    interval = primary
+    while integer:
+        if integer[-1] not in "0123456789":
+            # only non-digit characters remain (sign, spaces)
+            left_spaces = integer
+            integer = ""
+            break
+        groups.append(integer[-interval:])
+        integer = integer[:-interval]
+        interval = secondary
+    groups.reverse()
+    return (
+        left_spaces + thousands_sep.join(groups) + right_spaces,
+        len(thousands_sep) * (len(groups) - 1),
+    )
+
+
+@functools.lru_cache(maxsize=LOCALE_CACHE_SIZE)
+def _get_locale(identifier):
+    """Return the Babel locale of an identifier, with its data loaded."""
+    locale = babel.Locale.parse(identifier)
+    # Babel loads the locale data on first use
+    locale.number_symbols
+    return locale
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _get_number_pattern(format):
+    """Return a parsed Babel number pattern."""
+    return babel.numbers.parse_pattern(format)
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _get_date_pattern(format):
+    """Return a parsed Babel date / time pattern."""
+    return babel.dates.parse_pattern(format)
+
 
-    locale.setlocale(locale.LC_ALL, locale_)
-    return locale.format(format_, amount, grouping)
+def preload_locales(locales):
+    """Load Babel locales ahead of rendering, so that the first documents
+    formatted with them do not pay for loading their data.
+
+    The format helpers keep the last LOCALE_CACHE_SIZE locales they used.
+
+    :param locales: locale identifiers, such as "fr_FR"
+    :type locales: iterable of strings
+    """
+    for identifier in locales:
+        _get_locale(identifier)
 
 
 def format_currency(*args, **kwargs):
@@ -264,11 +425,80 @@ def format_currency(*args, **kwargs):
     if len(args) < 2:
         args += ("",)  # empty "currency" arg
 
-    return babel.numbers.format_currency(*args, **kwargs)
+    return _format_currency(*args, **kwargs)
+
+
+def _format_currency(
+    number,
+    currency,
+    format=None,
+    locale=None,
+    currency_digits=True,
+    format_type="standard",
+    decimal_quantization=True,
+    **kwargs,
+):
+    """babel.numbers.format_currency, with cached locales and patterns"""
+    if format_type == "name" or not isinstance(locale, (str, type(None))):
+        return babel.numbers.format_currency(
+            number,
+            currency,
+            format,
+            locale,
+            currency_digits,
+            format_type,
+            decimal_quantization,
+            **kwargs,
+        )
+
+    locale = _get_locale(
+        locale
+        or getattr(babel.numbers, "LC_MONETARY", babel.numbers.LC_NUMERIC)
+    )
+    if format:
+        pattern = _get_number_pattern(format)
+    else:
+        pattern = locale.currency_formats.get(format_type)
+        if pattern is None:
+            # let Babel raise its error
+            return babel.numbers.format_currency(
+                number, currency, locale=locale, format_type=format_type
+            )
+    return pattern.apply(
+        number,
+        locale,
+        currency=currency,
+        currency_digits=currency_digits,
+        decimal_quantization=decimal_quantization,
+        **kwargs,
+    )
 
 
 ISO_DATE_FORMAT = "%Y-%m-%d"
 ISO_DATETIME_FORMAT = ISO_DATE_FORMAT + " %H:%M:%S"
+# the formats Babel takes from the locale instead of parsing them
+BABEL_FORMAT_NAMES = ("full", "long", "medium", "short")
+# the ISO strings fromisoformat parses as strptime would
+_iso_date = re.compile(r"\d{4}-\d\d-\d\d(?: \d\d:\d\d:\d\d)?", re.ASCII)
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_iso_date(string):
+    """Return the datetime of an ISO formatted string, and whether it is a
+    date-time rather than a date.
+
+    Raise the ValueError of datetime.strptime for the other strings.
+    """
+    if _iso_date.fullmatch(string):
+        try:
+            return datetime.fromisoformat(string), len(string) > 10
+        except ValueError:
+            # out of range: let strptime raise its error
+            pass
+    try:
+        return datetime.strptime(string, ISO_DATE_FORMAT), False
+    except ValueError:
+        return datetime.strptime(string, ISO_DATETIME_FORMAT), True
 
 
 def format_date(date, format=ISO_DATE_FORMAT):
@@ -288,14 +518,11 @@ def format_date(date, format=ISO_DATE_FORMAT):
     # Deserialize when we got a string.
     if isinstance(date, str):
         try:
-            date = datetime.strptime(date, ISO_DATE_FORMAT)
-        except ValueError:
-            try:
-                date = datetime.strptime(date, ISO_DATETIME_FORMAT)
-            except ValueError as e:  # pragma: nocover
-                # Exclude from code coverage as deprecated; the same code in
-                # format_datetime below is covered though.
-                raise TemplateException(e)
+            date, _is_datetime = _parse_iso_date(date)
+        except ValueError as e:  # pragma: nocover
+            # Exclude from code coverage as deprecated; the same code in
+            # format_datetime below is covered though.
+            raise TemplateException(e)
 
     res = date.strftime(format)
     return res
@@ -324,19 +551,14 @@ def format_datetime(date_obj, format=None, locale=None):
     # This is the default value in format_* functions called below.
     if locale is None:
         locale = babel.dates.LC_TIME
+    locale = _get_locale(locale)
 
     # Deserialize when we got a string.
     if isinstance(date_obj, str):
         try:
-            date_obj = datetime.strptime(date_obj, ISO_DATE_FORMAT)
-            is_datetime = False  # This is a date (not a datetime).
-
-        except ValueError:
-            try:
-                date_obj = datetime.strptime(date_obj, ISO_DATETIME_FORMAT)
-                is_datetime = True  # This is a datetime (not a date).
-            except ValueError as e:
-                raise TemplateException(e)
+            date_obj, is_datetime = _parse_iso_date(date_obj)
+        except ValueError as e:
+            raise TemplateException(e)
 
     else:
         # Not a string: Find out whether we got a date or datetime.
@@ -346,14 +568,25 @@ def format_datetime(date_obj, format=None, locale=None):
         # This is a datetime (not a date).
         if format is None:
             format = "YYYY-MM-dd HH:mm:ss"
-        return babel.dates.format_datetime(
-            datetime=date_obj, format=format, locale=locale
-        )
+        if format in BABEL_FORMAT_NAMES:
+            return babel.dates.format_datetime(
+                datetime=date_obj, format=format, locale=locale
+            )
+        if date_obj.tzinfo is None:
+            # as Babel does
+            date_obj = date_obj.replace(tzinfo=babel.dates.UTC)
+        return _get_date_pattern(format).apply(date_obj, locale)
 
     # This is a date (not a datetime).
     if format is None:
         format = "YYYY-MM-dd"
-    return babel.dates.format_date(date=date_obj, format=format, locale=locale)
+    if format in BABEL_FORMAT_NAMES:
+        return babel.dates.format_date(
+            date=date_obj, format=format, locale=locale
+        )
+    if isinstance(date_obj, datetime):
+        date_obj = date_obj.date()
+    return _get_date_pattern(format).apply(date_obj, locale)
 
 
 def format_multiline(value):
@@ -365,6 +598,208 @@ def format_multiline(value):
     return Markup(value)
 
 
+def _column_values(values):
+    """Return the values of a column as a sequence of Python values."""
+    tolist = getattr(values, "tolist", None)
+    if tolist is not None:
+        # NumPy arrays and the like
+        return tolist()
+    return values
+
+
+# numbers a fast formatter must format as Babel does: rounding, grouping,
+# signs and plural forms
+_FORMATTER_CHECKS = [
+    decimal.Decimal(text)
+    for text in (
+        "0",
+        "1",
+        "-1",
+        "2",
+        "0.125",
+        "-2.5",
+        "1.123456789",
+        "-1234567.891",
+        "12345678901234.5",
+    )
+]
+
+
+def _fixed_decimals_formatter(apply, locale, group_separator):
+    """Return a function formatting numbers as ``apply`` does, for the
+    common patterns with a fixed number of decimals; or None for the other
+    patterns.
+
+    The prefixes, suffixes and decimals are found in numbers formatted by
+    ``apply``, and the function is only returned if it formats a few
+    tricky numbers exactly as ``apply`` does.
+    """
+    group = babel.numbers.get_group_symbol(locale)
+    decimal_symbol = babel.numbers.get_decimal_symbol(locale)
+    spec = ",f" if group_separator else "f"
+    symbols = str.maketrans({",": group, ".": decimal_symbol})
+
+    one = apply(decimal.Decimal(1))
+    for digits in range(6, -1, -1):
+        number = format(1, ".%df" % digits).translate(symbols)
+        if number in one:
+            break
+    else:
+        return None
+    quantum = decimal.Decimal(1).scaleb(-digits)
+    prefix, _number, suffix = one.partition(number)
+    negative_prefix, found, negative_suffix = apply(
+        decimal.Decimal(-1)
+    ).partition(number)
+    if not found:
+        return None
+
+    def format_number(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value))
+        if not value.is_finite():
+            return None
+        try:
+            text = format(abs(value).normalize().quantize(quantum), spec)
+        except decimal.InvalidOperation:
+            # more digits than the decimal context holds
+            return None
+        if value.is_signed():
+            return negative_prefix + text.translate(symbols) + negative_suffix
+        return prefix + text.translate(symbols) + suffix
+
+    for value in _FORMATTER_CHECKS:
+        if format_number(value) != apply(value):
+            return None
+    return format_number
+
+
+def format_currency_column(
+    values,
+    currency="",
+    format=None,
+    locale=None,
+    currency_digits=True,
+    format_type="standard",
+    decimal_quantization=True,
+    **kwargs,
+):
+    """Format a whole column of numbers as format_currency does, in one call.
+
+    The locale and pattern are resolved once for the column, and the common
+    patterns with a fixed number of decimals are formatted without going
+    through Babel.
+
+    :param values: the numbers to format
+    :type values: a sequence or a NumPy array
+
+    The other parameters are those of format_currency.
+
+    :rtype: list of strings.
+    """
+    values = _column_values(values)
+    if (
+        set(kwargs) - {"group_separator"}
+        or format_type == "name"
+        or not isinstance(locale, (str, type(None)))
+    ):
+        return [
+            _format_currency(
+                value,
+                currency,
+                format,
+                locale,
+                currency_digits,
+                format_type,
+                decimal_quantization,
+                **kwargs,
+            )
+            for value in values
+        ]
+
+    locale = _get_locale(
+        locale
+        or getattr(babel.numbers, "LC_MONETARY", babel.numbers.LC_NUMERIC)
+    )
+    if format:
+        pattern = _get_number_pattern(format)
+    else:
+        pattern = locale.currency_formats.get(format_type)
+        if pattern is None:
+            # let Babel raise its error
+            babel.numbers.format_currency(
+                0, currency, locale=locale, format_type=format_type
+            )
+
+    def apply(value):
+        return pattern.apply(
+            value,
+            locale,
+            currency=currency,
+            currency_digits=currency_digits,
+            decimal_quantization=decimal_quantization,
+            **kwargs,
+        )
+
+    format_number = None
+    if decimal_quantization:
+        format_number = _fixed_decimals_formatter(
+            apply, locale, kwargs.get("group_separator", True)
+        )
+    if format_number is None:
+        return [apply(value) for value in values]
+
+    result = []
+    for value in values:
+        text = None
+        if isinstance(value, (int, float, decimal.Decimal)):
+            text = format_number(value)
+        result.append(apply(value) if text is None else text)
+    return result
+
+
+def format_datetime_column(values, format=None, locale=None):
+    """Format a whole column of dates as format_datetime does, in one call.
+
+    Each distinct value of the column is formatted once.
+
+    :param values: the dates to format
+    :type values: a sequence or a NumPy array
+
+    The other parameters are those of format_datetime.
+
+    :rtype: list of strings.
+    """
+    formatted = {}
+    result = []
+    for value in _column_values(values):
+        # dates and strings of the same date are formatted differently
+        key = (value.__class__, value)
+        try:
+            text = formatted[key]
+        except KeyError:
+            text = formatted[key] = format_datetime(value, format, locale)
+        except TypeError:
+            # not hashable
+            text = format_datetime(value, format, locale)
+        result.append(text)
+    return result
+
+
+def format_multiline_column(values):
+    """Format a whole column of texts as format_multiline does, in one call.
+
+    :param values: the texts to format
+    :type values: a sequence or a NumPy array
+
+    :rtype: list of Markup.
+    """
+    return [
+        Markup(escape(value).replace("\n", "<text:line-break/>"))
+        for value in _column_values(values)
+    ]
+
+
 def get_var_corresponding_ods_type(var):
     """Check variable type and return the corresponding ODS value."""
     if isinstance(var, (int, float)):
@@ -372,6 +807,409 @@ def get_var_corresponding_ods_type(var):
     return "string"
 
 
+def get_formula_value(var):
+    """Return the value of a variable used inside an ODS cell formula."""
+    if isinstance(var, (int, float)):
+        return var
+    return getattr(var, "odf_value", f'"{var}"')
+
+
+FieldValue = collections.namedtuple(
+    "FieldValue", ["type", "value", "date_value", "formula"]
+)
+
+# the date office suites count days from by default
+NULL_DATE = datetime(1899, 12, 30)
+
+
+def get_field_value(var):
+    """Return the office:value-type, office:value, office:date-value and
+    text:formula attributes of an ODT field showing a number or a date with
+    its data style, None for the other values."""
+    if isinstance(var, bool):
+        return None
+    if isinstance(var, (int, float, decimal.Decimal)):
+        if isinstance(var, float) and not math.isfinite(var):
+            return None
+        if isinstance(var, decimal.Decimal) and not var.is_finite():
+            return None
+        return FieldValue("float", str(var), None, "ooow:%s" % var)
+    if isinstance(var, date):
+        if not isinstance(var, datetime):
+            var = datetime(var.year, var.month, var.day)
+            date_value = var.date().isoformat()
+        else:
+            var = var.replace(tzinfo=None)
+            date_value = var.isoformat()
+        # the formula gives the value shown, as a number of days
+        days = (var - NULL_DATE) / timedelta(days=1)
+        return FieldValue("date", None, date_value, "ooow:%r" % days)
+    return None
+
+
+class TypedCell:
+    """An ODS cell showing the value of a single expression.
+
+    The markup of the cell is built directly from the Python value for the
+    common value types, with the attributes that only depend on the value
+    type prepared once per type; other values go through a Genshi template
+    of the cell. Both give the same output.
+    """
+
+    # placeholders in the parts of the start tag
+    VALUE_TYPE = 1
+    VALUE = 2
+
+    def __init__(self, cell, namespaces):
+        """
+        :param cell: the table:table-cell element, whose office:value,
+          office:value-type, calcext:value-type attributes and paragraph
+          show the ``__py3o_value`` variable
+        :type cell: lxml.etree.Element
+
+        :param namespaces: the namespaces of the document
+        :type namespaces: dict
+        """
+        prefixes = {uri: prefix for prefix, uri in cell.nsmap.items()}
+
+        def qualify(name):
+            qname = lxml.etree.QName(name)
+            prefix = prefixes.get(qname.namespace)
+            if prefix is None:
+                return qname.localname
+            return f"{prefix}:{qname.localname}"
+
+        def start_tag(element, placeholders):
+            parts = ["<", qualify(element.tag)]
+            for name, value in element.attrib.items():
+                placeholder = placeholders.get(name)
+                if placeholder == self.VALUE:
+                    parts += [self.VALUE]
+                    self.value_attr = ' %s="' % qualify(name)
+                else:
+                    if placeholder is None:
+                        value = escape_attribute(value)
+                    parts += [
+                        " ",
+                        qualify(name),
+                        '="',
+                        placeholder or value,
+                        '"',
+                    ]
+            return parts
+
+        placeholders = {
+            "{%s}value-type" % namespaces[ns]: self.VALUE_TYPE
+            for ns in ("office", "calcext")
+        }
+        placeholders["{%s}value" % namespaces["office"]] = self.VALUE
+        self.start = start_tag(cell, placeholders) + [">"]
+        self.end = "</%s>" % qualify(cell.tag)
+
+        paragraph = cell[0]
+        self.paragraph = "".join(start_tag(paragraph, {}))
+        self.paragraph_end = "</%s>" % qualify(paragraph.tag)
+
+        self.source = lxml.etree.tostring(cell, with_tail=False)
+        self.namespaces = {
+            prefix: uri for prefix, uri in cell.nsmap.items() if prefix
+        }
+        self.types = {}
+        self.template = self.compile()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["types"] = {}
+        del state["template"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.template = self.compile()
+
+    def compile(self):
+        """Return the Genshi template of the cell."""
+        template = MarkupTemplate(self.source)
+        # Genshi prepares its templates lazily on first use; do it now so
+        # the cells can be rendered from several threads.
+        template.stream
+        return template
+
+    def prepare(self, value_type):
+        """Return the markup of the cell for values of ``value_type``: the
+        parts around the office:value attribute and the text, and whether
+        those values are escaped; or None if they are rendered by Genshi.
+        """
+        if value_type is type(None) or value_type is str:
+            ods_type = "string"
+        elif issubclass(value_type, (int, float)):
+            # Genshi does not escape numbers
+            ods_type = "float"
+        elif hasattr(value_type, "__iter__") or hasattr(
+            value_type, "__html__"
+        ):
+            # Genshi renders iterables and markup in its own way
+            self.types[value_type] = None
+            return None
+        else:
+            ods_type = "string"
+
+        parts = [
+            ods_type if part == self.VALUE_TYPE else part
+            for part in self.start
+        ]
+        index = parts.index(self.VALUE)
+        before, after = "".join(parts[:index]), "".join(parts[index + 1 :])
+        if value_type is type(None):
+            # Genshi drops attributes set to None, and writes empty
+            # elements as such
+            prepared = (
+                before + after + self.paragraph + "/>" + self.end,
+                None,
+                None,
+                False,
+            )
+        else:
+            prepared = (
+                before + self.value_attr,
+                '"' + after + self.paragraph + ">",
+                self.paragraph_end + self.end,
+                ods_type != "float",
+            )
+        self.types[value_type] = prepared
+        return prepared
+
+    def markup(self, value, prepared):
+        """Return the markup of the cell showing ``value``, prepared for its
+        type."""
+        head, middle, tail, escaped = prepared
+        if middle is None:
+            return head
+        value = str(value)
+        if escaped:
+            text = escape_text(value)
+            attribute = text.replace('"', "&#34;")
+            text = strip_text(text)
+        else:
+            text = attribute = value
+        return f"{head}{attribute}{middle}{text}{tail}"
+
+    def get_prepared(self, value_type):
+        """Return the markup of the cell prepared for ``value_type``, see
+        prepare."""
+        try:
+            return self.types[value_type]
+        except KeyError:
+            return self.prepare(value_type)
+
+    def __call__(self, value):
+        prepared = self.get_prepared(type(value))
+        if prepared is None:
+            return self.generate(value)
+        return StaticMarkup(self.markup(value, prepared))
+
+    def generate(self, value):
+        """Render the cell with Genshi."""
+        return self.template.generate(
+            __py3o_value=value,
+            get_var_corresponding_ods_type=get_var_corresponding_ods_type,
+        )
+
+
+# characters changed by escaping or white space stripping
+_needs_escape = re.compile('[&<>"\n]').search
+
+
+class TableLoop:
+    """A loop over the rows of a spreadsheet table, written without going
+    through Genshi.
+
+    The loop body is a single table row whose cells are either static or
+    typed cells showing a field of the loop item: the item itself,
+    ``row.name``, ``row["name"]`` or ``row[0]``. The fields of each item are
+    fetched at once, then the cells are written by their :class:`TypedCell`.
+    """
+
+    # rows written per markup block
+    BLOCK_ROWS = 1000
+
+    def __init__(self, parts, cells, fields, lenient):
+        """
+        :param parts: the static markup around the typed cells of the row,
+          one more than the cells
+        :type parts: list of strings
+
+        :param cells: the typed cells of the row
+        :type cells: list of TypedCell
+
+        :param fields: how each cell gets its value from the loop item:
+          ``(None, None)`` for the item itself, ``("attr", name)`` or
+          ``("item", key)``
+        :type fields: list of tuples
+
+        :param lenient: whether undefined fields are rendered empty rather
+          than raising an error
+        :type lenient: boolean
+        """
+        self.parts = parts
+        self.cells = cells
+        self.fields = fields
+        self.lookup = LenientLookup if lenient else StrictLookup
+        self.getters = {}
+        self.plans = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["getters"] = {}
+        state["plans"] = {}
+        return state
+
+    def getter(self, row_type):
+        """Return a function fetching the values of the cells from the loop
+        items of type ``row_type``, as a tuple.
+        """
+        getters = []
+        for kind, key in self.fields:
+            if kind is None:
+                getters.append(None)
+            elif kind == "item" or (
+                issubclass(row_type, dict) and not hasattr(row_type, key)
+            ):
+                getters.append(("item", key))
+            else:
+                getters.append(("attr", key))
+
+        kinds = {getter and getter[0] for getter in getters}
+        keys = [getter[1] for getter in getters if getter]
+        if kinds == {"item"} and len(keys) > 1:
+            getter = operator.itemgetter(*keys)
+        elif kinds == {"attr"} and len(keys) > 1:
+            getter = operator.attrgetter(*keys)
+        else:
+            functions = [
+                (
+                    (lambda row: row)
+                    if getter is None
+                    else operator.itemgetter(getter[1])
+                    if getter[0] == "item"
+                    else operator.attrgetter(getter[1])
+                )
+                for getter in getters
+            ]
+
+            def getter(row):
+                return [function(row) for function in functions]
+
+        self.getters[row_type] = getter
+        return getter
+
+    def lookup_values(self, row):
+        """Fetch the values of the cells from a loop item the way Genshi
+        does.
+        """
+        values = []
+        for kind, key in self.fields:
+            if kind is None:
+                values.append(row)
+            elif kind == "attr":
+                values.append(self.lookup.lookup_attr(row, key))
+            else:
+                values.append(self.lookup.lookup_item(row, (key,)))
+        return values
+
+    def plan(self, value_types):
+        """Return how to write the rows whose values are of ``value_types``:
+        the markup of the row with slots for the text of each non-empty
+        value (twice: the office:value attribute and the cell text), and a
+        function fetching those values; or None if those rows are written
+        cell by cell.
+        """
+        markup = [self.parts[0]]
+        present = []
+        for index, (cell, value_type, part) in enumerate(
+            zip(self.cells, value_types, self.parts[1:])
+        ):
+            prepared = cell.get_prepared(value_type)
+            if prepared is None:
+                self.plans[value_types] = None
+                return None
+            head, middle, tail, _escaped = prepared
+            if middle is None:
+                # an empty cell
+                markup[-1] += head + part
+            else:
+                present.append(index)
+                markup[-1] += head
+                markup += [None, middle, None, tail + part]
+
+        if len(present) > 1:
+            getter = operator.itemgetter(*present)
+        else:
+
+            def getter(values):
+                return [values[index] for index in present]
+
+        plan = (markup, getter)
+        self.plans[value_types] = plan
+        return plan
+
+    def write_row(self, values):
+        """Return the markup of a row, written cell by cell."""
+        markup = [self.parts[0]]
+        for cell, value, part in zip(self.cells, values, self.parts[1:]):
+            prepared = cell.get_prepared(type(value))
+            if prepared is None:
+                serializer = XMLSerializer(cell.namespaces)
+                markup.append("".join(serializer(cell.generate(value))))
+            else:
+                markup.append(cell.markup(value, prepared))
+            markup.append(part)
+        return "".join(markup)
+
+    def __call__(self, rows):
+        """Yield the markup of the rows, called back from genshi template
+        rendering in place of the loop."""
+        plans = self.plans
+        block = []
+        count = 0
+        row_type = None
+        for row in rows:
+            if type(row) is not row_type:
+                row_type = type(row)
+                getter = self.getters.get(row_type) or self.getter(row_type)
+            try:
+                values = getter(row)
+            except (AttributeError, KeyError, IndexError, TypeError):
+                values = self.lookup_values(row)
+
+            # rows of the same value types are formatted at once
+            value_types = tuple(map(type, values))
+            try:
+                plan = plans[value_types]
+            except KeyError:
+                plan = self.plan(value_types)
+            if plan is not None:
+                markup, present = plan
+                texts = list(map(str, present(values)))
+                if _needs_escape("".join(texts)):
+                    block.append(self.write_row(values))
+                else:
+                    markup = markup.copy()
+                    markup[1::4] = texts
+                    markup[3::4] = texts
+                    block += markup
+            else:
+                block.append(self.write_row(values))
+
+            count += 1
+            if count == self.BLOCK_ROWS:
+                yield TEXT, StaticMarkup("".join(block)), (None, -1, -1)
+                block = []
+                count = 0
+        if block:
+            yield TEXT, StaticMarkup("".join(block)), (None, -1, -1)
+
+
 class FrameInjector:
     def __init__(self, template):
         """Inject a proper <draw:frame/> attributes into the template manifest
@@ -566,6 +1404,194 @@ class ImageInjector:
         return attrs
 
 
+def get_base_data(template, typed_cells, table_loop_writers):
+    """Return the helpers the templates are rendered with.
+
+    :param template: the object the image and frame injectors register the
+     images with: it must provide ``namespaces`` and ``set_image_data``
+    :param typed_cells: the native ODS value cells of the template
+    :param table_loop_writers: the table loop writers of the template
+    """
+    return {
+        "decimal": decimal,
+        "format_amount": format_amount,  # deprecated -> format_currency
+        "format_currency": format_currency,
+        "format_locale": format_locale,  # deprecated -> format_currency
+        "format_date": format_date,  # deprecated -> format_datetime
+        "format_datetime": format_datetime,
+        "format_multiline": format_multiline,
+        "format_currency_column": format_currency_column,
+        "format_datetime_column": format_datetime_column,
+        "format_multiline_column": format_multiline_column,
+        "__py3o_image": ImageInjector(template),
+        "__py3o_frame": FrameInjector(template),
+        "get_var_corresponding_ods_type": get_var_corresponding_ods_type,
+        "get_formula_value": get_formula_value,
+        "get_field_value": get_field_value,
+        "__py3o_cell": typed_cells,
+        "__py3o_table_loop": table_loop_writers,
+    }
+
+
+class _ImageSink:
+    """Collect the images registered by the image injectors in the
+    processes rendering loop chunks.
+    """
+
+    def __init__(self, namespaces):
+        self.namespaces = namespaces
+        self.images = {}
+
+    def set_image_data(self, identifier, data, mime_type=None):
+        self.images[identifier] = {"data": data, "mime_type": mime_type}
+
+
+class _LoopChunkError(Exception):
+    """Carry an exception raised in a process rendering a loop chunk back to
+    the rendering process.
+
+    Exceptions are pickled as their class called with their args, which
+    mangles the message of exceptions whose constructor builds it, such as
+    genshi's UndefinedError: the original exception is rebuilt without
+    calling its constructor instead.
+    """
+
+    def __init__(self, exc_type, exc_args, exc_state):
+        super().__init__(exc_type, exc_args, exc_state)
+        self.exc_type = exc_type
+        self.exc_args = exc_args
+        self.exc_state = exc_state
+
+    def original(self):
+        exc = self.exc_type.__new__(self.exc_type, *self.exc_args)
+        exc.args = self.exc_args
+        exc.__dict__.update(self.exc_state)
+        return exc
+
+
+@functools.lru_cache(maxsize=LOOP_CHUNK_CACHE_SIZE)
+def _get_loop_chunk_template(source, lenient, text_namespace):
+    template = MarkupTemplate(
+        source, lookup="lenient" if lenient else "strict"
+    )
+    precompile_static_markup(template, get_list_tags({"text": text_namespace}))
+    return template
+
+
+def _render_loop_chunk(
+    source,
+    lenient,
+    namespaces,
+    typed_cells,
+    table_loop_writers,
+    data,
+):
+    """Render a loop chunk template, return the serialized rows and the
+    images they use.
+    """
+    template = _get_loop_chunk_template(
+        source, lenient, namespaces.get("text")
+    )
+    sink = _ImageSink(namespaces)
+    template_dict = dict(data)
+    template_dict.update(get_base_data(sink, typed_cells, table_loop_writers))
+    stream = template.generate(**template_dict)
+    serializer = XMLSerializer()
+    output = "".join(serializer(stream | get_list_transformer(namespaces)))
+
+    # strip the chunk root element
+    start = output.index(">") + 1
+    if output[start - 2] == "/":
+        return "", sink.images
+    return output[start : output.rindex("</")], sink.images
+
+
+def _render_loop_chunk_in_worker(*args):
+    try:
+        return _render_loop_chunk(*args)
+    except Exception as exc:
+        raise _LoopChunkError(type(exc), exc.args, vars(exc)) from None
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class LoopChunkRenderer:
+    def __init__(self, template, data):
+        """Render the top-level loops registered with
+        :meth:`Template.set_parallel_loop` when called back from genshi
+        template rendering
+
+        :param template: the py3o.template.Template instance being rendered
+        :type template: py3o.template.Template instance
+
+        :param data: the user data the template is rendered with
+        :type data: dict
+        """
+        self.template = template
+        self.data = data
+
+    def __call__(self, index, iterable):
+        """this will be called by genshi in place of the loop number
+        ``index``, and yields the serialized rows in order, chunk by chunk
+        """
+        loop_template = self.template.parallel_loop_templates[index]
+        source, name, processes, chunk_size = loop_template
+
+        data = {key: value for key, value in self.data.items() if key != name}
+        args = (
+            source,
+            self.template.ignore_undefined_variables,
+            self.template.namespaces,
+            self.template.typed_cells,
+            self.template.table_loop_writers,
+        )
+        chunks = (
+            dict(data, **{name: chunk})
+            for chunk in _chunked(iterable, chunk_size)
+        )
+
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes == 1:
+            results = (_render_loop_chunk(*args, chunk) for chunk in chunks)
+        else:
+            results = self._render_chunks(processes, args, chunks)
+
+        for fragment, images in results:
+            self.template.images.update(images)
+            yield TEXT, StaticMarkup(fragment), (None, -1, -1)
+
+    @staticmethod
+    def _render_chunks(processes, args, chunks):
+        """Render chunks in worker processes and yield the results in order.
+        Only a few chunks per worker are queued at any time, so that the
+        loop data is not consumed faster than the rows are written.
+        """
+        with ProcessPoolExecutor(processes) as executor:
+            pending = collections.deque()
+            try:
+                for chunk in chunks:
+                    pending.append(
+                        executor.submit(
+                            _render_loop_chunk_in_worker, *args, chunk
+                        )
+                    )
+                    if len(pending) >= 2 * processes:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            except _LoopChunkError as error:
+                # chain the traceback of the worker process
+                raise error.original() from error.__cause__
+
+
 class TextTemplate:
     """A specific template that can be used to output textual content.
 
@@ -635,6 +1661,12 @@ class Template:
         outfile,
         ignore_undefined_variables=False,
         escape_false=False,
+        buffer_size=OUTPUT_BUFFER_SIZE,
+        compress_repeated=False,
+        max_sheet_rows=None,
+        max_size=None,
+        typed_user_fields=False,
+        zip64=False,
     ):
         """A template object exposes the API to render it to an OpenOffice
         document.
@@ -654,23 +1686,146 @@ class Template:
         @param escape_false: Values evaluated as False are replaced
         with an empty string during template rendering if True
         @type escape_false: boolean. Default is False
+
+        @param buffer_size: the amount of serialized XML (in characters)
+        accumulated before being encoded and written to the output document.
+        render_flow reports progress once per buffer written.
+        @type buffer_size: int. Default is 64 KiB
+
+        @param compress_repeated: Consecutive identical rows and cells of
+        the tables are written once, with a repeat count, if True. This
+        makes documents with many blank or constant rows smaller, at some
+        cost in render time. See py3o.template.repeat.RepeatCompressor
+        @type compress_repeated: boolean. Default is False
+
+        @param max_sheet_rows: the rows of a spreadsheet table beyond this
+        number are written in a copy of the table, inserted right after it.
+        py3o.template.split.MAX_SHEET_ROWS is the limit of the format. None
+        to never split the tables
+        @type max_sheet_rows: int. Default is None
+
+        @param max_size: the size in bytes of the content of a spreadsheet
+        beyond which the rows are written in another document, holding a copy
+        of the current table. Those documents are named after outfile with a
+        _2, _3... suffix, or outfile can be a function returning the file
+        name (or binary file object) of each document from its number,
+        starting at 1. The documents written are listed in output_files.
+        None for a single document
+        @type max_size: int
+
+        @param typed_user_fields: The py3o user fields of text documents
+        that have a data style show numbers and dates as typed values,
+        formatted by the office suite with that data style, if True.
+        Other values are shown as text, as usual
+        @type typed_user_fields: boolean. Default is False
+
+        @param zip64: The templated files are written with zip64 headers,
+        which lets them grow beyond 2 GiB, if True. This is the case anyway
+        when max_size is over 1 GiB
+        @type zip64: boolean. Default is False
         """
         self.template = template
         self.outputfilename = outfile
         self.infile = zipfile.ZipFile(self.template, "r")
-
-        self.content_trees = [
-            lxml.etree.parse(BytesIO(self.infile.read(filename)))
-            for filename in self.templated_files
-        ]
+        self.infile_pid = os.getpid()
+
+        content_hash = hashlib.sha256()
+        self.content_trees = []
+        for filename in self.templated_files:
+            content = self.infile.read(filename)
+            content_hash.update(b"%d:" % len(content) + content)
+            self.content_trees.append(lxml.etree.parse(BytesIO(content)))
+        # identifies the templated content, see get_data_structure
+        self.content_hash = content_hash.hexdigest()
         self.tree_roots = [tree.getroot() for tree in self.content_trees]
 
         self.__prepare_namespaces()
 
         self.images = {}
         self.output_streams = []
+        self.compiled_templates = None
+        self.parallel_loops = {}
+        self.parallel_loop_templates = []
+        self.typed_cells = []
+        self.table_loops = set()
+        self.table_loop_writers = []
         self.ignore_undefined_variables = ignore_undefined_variables
         self.escape_false = escape_false
+        self.typed_user_fields = typed_user_fields
+        self.buffer_size = buffer_size
+        is_spreadsheet = self.__is_spreadsheet()
+        self.compress_repeated = compress_repeated
+        if max_size is not None and not is_spreadsheet:
+            raise TemplateException("Only spreadsheets can be split")
+        self.max_sheet_rows = max_sheet_rows if is_spreadsheet else None
+        self.max_size = max_size
+        # the content of a split document can exceed max_size by a few rows
+        self.zip64 = zip64 or (
+            max_size is not None and max_size > zipfile.ZIP64_LIMIT // 2
+        )
+        self.output_files = []
+
+    def __is_spreadsheet(self):
+        """Tell if the template is a spreadsheet, from its mime type."""
+        if "mimetype" not in self.infile.namelist():
+            return False
+        mimetype = self.infile.read("mimetype").decode("ascii", "replace")
+        return mimetype.strip().startswith(SPREADSHEET_MIMETYPE)
+
+    def set_parallel_loop(self, iterable, processes=None, chunk_size=1000):
+        """Render a top-level loop of the template in worker processes.
+
+        The loop iterable is split in chunks of ``chunk_size`` items; each
+        chunk is rendered by a worker process and the serialized rows are
+        spliced back in order into the document. This is only correct for
+        loops whose rows do not depend on each other.
+
+        The loop (``for="row in rows"``) must not be nested in another
+        py3o instruction and must iterate over a name of the data
+        dictionary. The loop chunks and the other values of the data
+        dictionary are sent to the worker processes so they must be
+        picklable.
+
+        Must be called before the template is compiled.
+
+        @param iterable: the name of the iterable, ie: 'rows'
+        @type iterable: string
+
+        @param processes: the number of worker processes, defaults to the
+        CPU count. With 1, chunks are rendered in the current process.
+        @type processes: int
+
+        @param chunk_size: the number of loop items in a chunk
+        @type chunk_size: int
+        """
+        if self.compiled_templates is not None:
+            raise TemplateException(
+                "Parallel loops must be set before compiling the template"
+            )
+        self.parallel_loops[iterable] = (processes, chunk_size)
+
+    def set_table_loop(self, iterable):
+        """Write the rows of a spreadsheet loop with a specialized writer.
+
+        The loop (``for="row in rows"``) must wrap a single table row whose
+        cells are static or only show a field of the loop item:
+        ``${row}``, ``${row.name}``, ``${row['name']}`` or ``${row[0]}``.
+        Those rows are written without going through the template engine,
+        which makes data dumps of rows (tuples, dictionaries, objects, CSV
+        readers...) much faster. A table loop cannot be rendered in
+        parallel.
+
+        Must be called before the template is compiled.
+
+        @param iterable: the loop iterable as written in the template, ie:
+        'rows'
+        @type iterable: string
+        """
+        if self.compiled_templates is not None:
+            raise TemplateException(
+                "Table loops must be set before compiling the template"
+            )
+        self.table_loops.add(iterable)
 
     def __prepare_namespaces(self):
         """create proper namespaces for our document"""
@@ -791,42 +1946,72 @@ class Template:
           The expressions in the form of Python code that can be parsed by AST.
         :rtype: str
         """
-        python_src = ""
+        lines = []
         indent = 0
+        # the expression following each one, to find the empty blocks
+        following = itertools.chain(
+            itertools.islice(expressions, 1, None), [None]
+        )
 
-        def pindent():
-            # Easily add indentation
-            return indent * " "
-
-        for expression in expressions:
+        for expression, next_expression in zip(expressions, following):
             if expression.startswith("for="):
                 # For loop
                 # We construct a python for loop with the py3o one
-                python_src += f"{pindent()}for {expression[5:-1]}:\n"
+                lines.append(f"{' ' * indent}for {expression[5:-1]}:\n")
                 indent += 1
                 # Care of empty loop statement
-                if expressions[expressions.index(expression) + 1] == "/for":
-                    python_src += f"{pindent()}pass\n"
+                if next_expression in ("/for", None):
+                    lines.append(f"{' ' * indent}pass\n")
             elif expression == "/for":
                 # End of for loop
                 indent -= 1
             elif expression.startswith("if="):
                 # Construct an if statement
-                python_src += f"{pindent()}if {expression[4:-1]}:\n"
+                lines.append(f"{' ' * indent}if {expression[4:-1]}:\n")
                 indent += 1
                 # Care of empty if statement
-                if expressions[expressions.index(expression) + 1] == "/if":
-                    python_src += f"{pindent()}pass\n"
+                if next_expression in ("/if", None):
+                    lines.append(f"{' ' * indent}pass\n")
             elif expression == "/if":
                 # End of if
                 indent -= 1
             elif expression.startswith("function="):
                 # Convert to a function call
-                python_src += f"{pindent()}{expression[10:-1]}\n"
+                lines.append(f"{' ' * indent}{expression[10:-1]}\n")
             else:
                 # Variable access
-                python_src += f"{pindent()}{expression}\n"
-        return python_src
+                lines.append(f"{' ' * indent}{expression}\n")
+        return "".join(lines)
+
+    def get_data_structure(self, cache=None):
+        """Return the data structure expected by the template.
+
+        This chains :meth:`get_all_user_python_expression`,
+        :meth:`convert_py3o_to_python_ast` and :class:`Py3oConvertor`.
+
+        :param cache: data structures already built, keyed by the
+          ``content_hash`` of their template. The data structure is looked up
+          there first, and stored there once built. Templates with the same
+          content share the same data structure, which must not be modified
+        :type cache: py3o.template.cache.SchemaCache or dict
+
+        :returns: the root of the data structure, its ``render`` method
+          extracts from your data what the template uses.
+        :rtype: py3o.template.data_struct.Py3oModule
+        """
+        if cache is not None:
+            data_structure = cache.get(self.content_hash)
+            if data_structure is None:
+                data_structure = self.get_data_structure()
+                cache[self.content_hash] = data_structure
+            return data_structure
+
+        template = self
+        if self.compiled_templates is not None:
+            # compiling rewrote our content trees, read the original ones
+            template = Template(self.template, None)
+        expressions = template.get_all_user_python_expression()
+        return Py3oConvertor()(self.convert_py3o_to_python_ast(expressions))
 
     @staticmethod
     def find_image_frames(content_trees, namespaces):
@@ -887,21 +2072,99 @@ class Template:
         return starting_tags, closing_tags
 
     def apply_variable_type_in_cells(self, content_trees, namespaces):
-        """Replace default 'string' type by a function call."""
+        """Replace default 'string' type by a function call.
+
+        The cell expression is evaluated once per cell: it is bound to a
+        variable by a py:with directive on the cell, which its value, its
+        type and its text all use. Cells that only show the value of the
+        expression are rendered by a :class:`TypedCell` instead.
+        """
         text_nmspc = namespaces["text"]
+        cells = {}
         for e in get_all_python_expression(content_trees, namespaces):
             if e.tag == "{%s}p" % text_nmspc:
                 if not e.text:
                     continue
-                parent = e.getparent()
                 varname = re.findall(r"\${([^{}]*)}", e.text)[0]
-                for ns in ("office", "calcext"):
-                    parent.attrib["{%s}value-type" % namespaces[ns]] = (
-                        "${get_var_corresponding_ods_type(%s)}" % varname
-                    )
-                parent.attrib["{%s}value" % namespaces["office"]] = (
-                    "${%s}" % varname
+                # the last paragraph of a cell gives its value
+                cells.setdefault(e.getparent(), []).append((e, varname))
+
+        for cell, paragraphs in cells.items():
+            varname = paragraphs[-1][1]
+            value_type = "get_var_corresponding_ods_type(%s)" % varname
+            typed_cell = self.__is_typed_cell(cell, paragraphs)
+            if typed_cell:
+                # rendered by a TypedCell, see below
+                value = "__py3o_value"
+                value_type = "get_var_corresponding_ods_type(__py3o_value)"
+                cell[0].text = "${__py3o_value}"
+            elif any(
+                attr.startswith("{%s}" % GENSHI_URI) for attr in cell.attrib
+            ):
+                # the cell already holds instructions, leave them alone
+                value = varname
+            else:
+                cell.attrib["{%s}with" % GENSHI_URI] = (
+                    "__py3o_value = %s; __py3o_type = "
+                    "get_var_corresponding_ods_type(__py3o_value)" % varname
+                )
+                value, value_type = "__py3o_value", "__py3o_type"
+                for p, expr in paragraphs:
+                    if expr == varname:
+                        p.text = p.text.replace(
+                            "${%s}" % varname, "${%s}" % value
+                        )
+
+            for ns in ("office", "calcext"):
+                cell.attrib["{%s}value-type" % namespaces[ns]] = (
+                    "${%s}" % value_type
+                )
+            cell.attrib["{%s}value" % namespaces["office"]] = "${%s}" % value
+
+            if typed_cell:
+                replacement = lxml.etree.Element(
+                    "span",
+                    attrib={
+                        "{%s}replace" % GENSHI_URI: "__py3o_cell[%d](%s)"
+                        % (len(self.typed_cells), varname)
+                    },
+                    nsmap={"py": GENSHI_URI},
                 )
+                self.typed_cells.append(TypedCell(cell, namespaces))
+                replacement.tail = cell.tail
+                cell.getparent().replace(cell, replacement)
+
+    @staticmethod
+    def __is_typed_cell(cell, paragraphs):
+        """Tell if a cell can be rendered by a TypedCell: it holds a single
+        paragraph showing the value of an expression, and nothing else.
+        """
+        if len(paragraphs) != 1 or len(cell) != 1:
+            return False
+        paragraph, varname = paragraphs[0]
+        if (
+            paragraph.text != "${%s}" % varname
+            or len(paragraph)
+            or paragraph.tail
+            or cell.text
+        ):
+            return False
+        for element in (cell, paragraph):
+            for name, value in element.attrib.items():
+                if name.startswith("{%s}" % GENSHI_URI) or "${" in value:
+                    return False
+        if cell.xpath("ancestor-or-self::*[@xml:space]"):
+            return False
+        # the cell markup uses the namespace prefixes of the document
+        nsmap, root_nsmap = (
+            {
+                prefix: uri
+                for prefix, uri in element.nsmap.items()
+                if uri != GENSHI_URI
+            }
+            for element in (cell, cell.getroottree().getroot())
+        )
+        return nsmap == root_nsmap and len(set(nsmap.values())) == len(nsmap)
 
     @staticmethod
     def validate_link(link, py3o_base):
@@ -1104,7 +2367,11 @@ class Template:
         only consists of a name or attribute access. Any such expression
         ``my_odf_value`` will be replaced in the formula with::
 
-            VALUE(${getattr(my_odf_value, "odf_value", odf_value)})
+            VALUE(${get_formula_value(my_odf_value)})
+
+        which evaluates ``my_odf_value`` once and returns it as is if it is
+        a number, its ``odf_value`` attribute if it has one, the quoted
+        value otherwise.
 
         Note that any double quote placed immediately before or after the
         Genshi expression will be automatically removed.
@@ -1127,8 +2394,7 @@ class Template:
                 value = userfield.attrib[formula_attr]
                 userfield.attrib[formula_attr] = re.sub(
                     r"\"?\${([\w.]*?)(?<!odf_value)}\"?",
-                    r"VALUE(${\1 if isinstance(\1, (int, float)) "
-                    r'else getattr(\1, "odf_value", "\"{}\"".format(\1))})',
+                    r"VALUE(${get_formula_value(\1)})",
                     value,
                 )
 
@@ -1151,6 +2417,19 @@ class Template:
                 style = userfield.attrib.get(style_attr)
                 if_attr = "{%s}if" % self.namespaces["py"]
 
+                # Evaluate the field expression once: the instructions below
+                # use it through the __py3o_value variable.
+                with_node = lxml.etree.Element(
+                    "span",
+                    attrib={
+                        "{%s}with" % GENSHI_URI: "__py3o_value = %s" % value,
+                        "{%s}strip" % GENSHI_URI: "True",
+                    },
+                    nsmap={"py": GENSHI_URI},
+                )
+                userfield.addprevious(with_node)
+                value = "__py3o_value"
+
                 attribs = dict()
                 attribs["{%s}strip" % GENSHI_URI] = "True"
                 attribs["{%s}content" % GENSHI_URI] = value
@@ -1161,15 +2440,19 @@ class Template:
                 if style is not None:
                     node_tag = "{%s}expression" % self.namespaces["text"]
 
+                    with_node.attrib["{%s}with" % GENSHI_URI] += (
+                        "; __py3o_odf_value = "
+                        "hasattr(__py3o_value, 'odf_value')"
+                    )
+                    if self.typed_user_fields:
+                        self.__add_typed_user_field(with_node, value, style)
                     formula = (
                         "ooow:VALUE(\"${{getattr({val}, '{key}', '')}}\")"
                     ).format(val=value, key="odf_value")
                     vtype = "${{getattr({val}, '{key}', '{default}')}}".format(
                         val=value, key="odf_type", default="string"
                     )
-                    if_condition = "hasattr({val}, '{key}')".format(
-                        val=value, key="odf_value"
-                    )
+                    if_condition = "__py3o_odf_value"
 
                     formula_attribs = {
                         "{%s}content" % GENSHI_URI: value,
@@ -1178,21 +2461,257 @@ class Template:
                         "{%s}formula" % self.namespaces["text"]: formula,
                         "{%s}value-type" % self.namespaces["office"]: vtype,
                     }
-                    formula_node = lxml.etree.Element(
-                        node_tag, attrib=formula_attribs, nsmap=self.namespaces
+                    lxml.etree.SubElement(
+                        with_node,
+                        node_tag,
+                        attrib=formula_attribs,
+                        nsmap=self.namespaces,
                     )
-                    userfield.addprevious(formula_node)
 
-                    attribs[if_attr] = f"not {if_condition}"
+                    if self.typed_user_fields:
+                        if_condition += " or __py3o_field"
+                    attribs[if_attr] = f"not ({if_condition})"
 
-                genshi_node = lxml.etree.Element(
-                    "span", attrib=attribs, nsmap={"py": GENSHI_URI}
+                lxml.etree.SubElement(
+                    with_node, "span", attrib=attribs, nsmap={"py": GENSHI_URI}
                 )
 
                 if userfield.tail:
-                    genshi_node.tail = userfield.tail
+                    with_node.tail = userfield.tail
+
+                parent.remove(userfield)
+
+    def __add_typed_user_field(self, with_node, value, style):
+        """Add the text:expression showing a number or a date held by a user
+        field with the field's data style, so that the office suite formats
+        it.
+        """
+        with_node.attrib["{%s}with" % GENSHI_URI] += (
+            "; __py3o_field = None if __py3o_odf_value "
+            "else get_field_value(%s)" % value
+        )
+        office = self.namespaces["office"]
+        text = self.namespaces["text"]
+        lxml.etree.SubElement(
+            with_node,
+            "{%s}expression" % text,
+            attrib={
+                "{%s}content" % GENSHI_URI: value,
+                "{%s}if" % GENSHI_URI: "__py3o_field",
+                "{%s}data-style-name" % self.namespaces["style"]: style,
+                "{%s}formula" % text: "${__py3o_field.formula}",
+                "{%s}value-type" % office: "${__py3o_field.type}",
+                "{%s}value" % office: "${__py3o_field.value}",
+                "{%s}date-value" % office: "${__py3o_field.date_value}",
+            },
+            nsmap=self.namespaces,
+        )
+
+    def __prepare_table_loops(self):
+        """Replace the loops registered with set_table_loop by a call to
+        their TableLoop.
+        """
+        if not self.table_loops:
+            return
+
+        found = set()
+        for tree_root in self.tree_roots:
+            for loop in tree_root.xpath(
+                "//span[@py:for]", namespaces=self.namespaces
+            ):
+                loop_expr = re.match(
+                    r"^\s*(\w+)\s+in\s+(.*?)\s*$",
+                    loop.get("{%s}for" % GENSHI_URI),
+                )
+                if not loop_expr or loop_expr.group(2) not in self.table_loops:
+                    continue
+                name, iterable = loop_expr.groups()
+                found.add(iterable)
+
+                index = len(self.table_loop_writers)
+                self.table_loop_writers.append(
+                    self.__make_table_loop(loop, name, iterable)
+                )
+                replacement = lxml.etree.Element(
+                    "span",
+                    attrib={
+                        "{%s}replace" % GENSHI_URI: "__py3o_table_loop[%d](%s)"
+                        % (index, iterable)
+                    },
+                    nsmap={"py": GENSHI_URI},
+                )
+                replacement.tail = loop.tail
+                loop.getparent().replace(loop, replacement)
 
-                parent.replace(userfield, genshi_node)
+        missing = self.table_loops - found
+        if missing:
+            raise TemplateException(
+                "No loop found over '%s'" % "', '".join(sorted(missing))
+            )
+
+    def __make_table_loop(self, loop, name, iterable):
+        """Build the TableLoop writing the rows of a loop."""
+
+        def error(reason):
+            return TemplateException(
+                "The loop over '%s' cannot be written as a table loop: %s"
+                % (iterable, reason)
+            )
+
+        row_tag = "{%s}table-row" % self.namespaces["table"]
+        if (
+            len(loop) != 1
+            or loop[0].tag != row_tag
+            or loop.text
+            or loop[0].tail
+        ):
+            raise error("its body is not a single table row")
+        row = loop[0]
+        if row.xpath("ancestor-or-self::*[@xml:space]"):
+            raise error("it preserves white space")
+
+        cell_call = re.compile(r"^__py3o_cell\[(\d+)\]\((.*)\)$")
+        field = re.compile(
+            r"^%s(?:\.(\w+)|\[(\d+)\]|\[(['\"])(.*)\3\])?$" % re.escape(name)
+        )
+        cells = []
+        fields = []
+        for cell in list(row):
+            call = cell_call.match(cell.get("{%s}replace" % GENSHI_URI, ""))
+            if call is None:
+                # a static cell
+                for element in cell.iter():
+                    if "${" in (element.text or "") or any(
+                        attr.startswith("{%s}" % GENSHI_URI) or "${" in value
+                        for attr, value in element.attrib.items()
+                    ):
+                        raise error("a cell holds an instruction")
+                continue
+
+            expression = call.group(2).strip()
+            match = field.match(expression)
+            if match is None:
+                raise error(
+                    "the cell expression '%s' is not a field of '%s'"
+                    % (expression, name)
+                )
+            attr, index, _quote, key = match.groups()
+            if attr is not None:
+                fields.append(("attr", attr))
+            elif index is not None:
+                fields.append(("item", int(index)))
+            elif key is not None:
+                fields.append(("item", key))
+            else:
+                fields.append((None, None))
+            cells.append(self.typed_cells[int(call.group(1))])
+
+            placeholder = lxml.etree.Element(
+                "{%s}cell" % PY3O_URI, nsmap={"py3o": PY3O_URI}
+            )
+            placeholder.tail = cell.tail
+            row.replace(cell, placeholder)
+
+        for attr, value in row.attrib.items():
+            if attr.startswith("{%s}" % GENSHI_URI) or "${" in value:
+                raise error("the row holds an instruction")
+
+        namespaces = dict(
+            (prefix, uri)
+            for prefix, uri in loop.getroottree().getroot().nsmap.items()
+            if prefix
+        )
+        namespaces.update(py=GENSHI_URI, py3o=PY3O_URI)
+        markup = "".join(
+            XMLSerializer(namespaces)(
+                XMLParser(BytesIO(lxml.etree.tostring(row)))
+            )
+        )
+        parts = markup.split("<py3o:cell/>")
+        if len(parts) != len(cells) + 1:  # pragma: no cover
+            raise error("its row could not be serialized")
+        return TableLoop(parts, cells, fields, self.ignore_undefined_variables)
+
+    def __prepare_parallel_loops(self):
+        """Move the loops registered with set_parallel_loop to their own
+        Genshi templates, replaced in the document by a call to the loop
+        chunk renderer.
+        """
+        if not self.parallel_loops:
+            return
+
+        genshi_ns = "{%s}" % GENSHI_URI
+        directives = [
+            genshi_ns + name
+            for name in (
+                "for",
+                "if",
+                "with",
+                "choose",
+                "when",
+                "otherwise",
+                "def",
+                "match",
+                "replace",
+                "content",
+            )
+        ]
+        found = set()
+        for tree_root in self.tree_roots:
+            for loop in tree_root.xpath(
+                "//span[@py:for]", namespaces=self.namespaces
+            ):
+                loop_expr = re.match(
+                    r"^\s*\w+\s+in\s+(\w+)\s*$", loop.get(genshi_ns + "for")
+                )
+                if (
+                    not loop_expr
+                    or loop_expr.group(1) not in self.parallel_loops
+                ):
+                    continue
+                iterable = loop_expr.group(1)
+                if any(
+                    attr in directives
+                    for ancestor in loop.iterancestors()
+                    for attr in ancestor.attrib
+                ):
+                    raise TemplateException(
+                        "The loop over '%s' cannot be rendered in parallel: "
+                        "it is not a top-level loop" % iterable
+                    )
+                found.add(iterable)
+
+                nsmap = dict(tree_root.nsmap, py=GENSHI_URI, py3o=PY3O_URI)
+                chunk = lxml.etree.Element("{%s}chunk" % PY3O_URI, nsmap=nsmap)
+
+                index = len(self.parallel_loop_templates)
+                replacement = lxml.etree.Element(
+                    "span",
+                    attrib={
+                        genshi_ns + "replace": "__py3o_parallel_loop(%d, %s)"
+                        % (index, iterable)
+                    },
+                    nsmap={"py": GENSHI_URI},
+                )
+                replacement.tail, loop.tail = loop.tail, None
+                loop.getparent().replace(loop, replacement)
+                chunk.append(loop)
+
+                processes, chunk_size = self.parallel_loops[iterable]
+                self.parallel_loop_templates.append(
+                    (
+                        lxml.etree.tostring(chunk),
+                        iterable,
+                        processes,
+                        chunk_size,
+                    )
+                )
+
+        missing = set(self.parallel_loops) - found
+        if missing:
+            raise TemplateException(
+                "No loop over '%s' found" % "', '".join(sorted(missing))
+            )
 
     def __replace_image_links(self):
         """Replace links of placeholder images (the name of which starts with
@@ -1241,6 +2760,8 @@ class Template:
             if not manifest_e:
                 continue
 
+            # work on a copy: the compiled manifest is reused by every render
+            manifest = copy(manifest_e[0])
             for identifier in self.images.keys():
                 mime = self.images.get(identifier).get("mime_type", None)
                 attribs = {
@@ -1249,31 +2770,24 @@ class Template:
                 }
                 # Add a manifest:file-entry tag.
                 lxml.etree.SubElement(
-                    manifest_e[0],
+                    manifest,
                     "{%s}file-entry" % self.namespaces["manifest"],
                     attrib=attribs,
                 )
-            return manifest_e[0]
+            return manifest
 
     def add_base_data_to_template(self):
-        return {
-            "decimal": decimal,
-            "format_amount": format_amount,  # deprecated -> format_currency
-            "format_currency": format_currency,
-            "format_locale": format_locale,  # deprecated -> format_currency
-            "format_date": format_date,  # deprecated -> format_datetime
-            "format_datetime": format_datetime,
-            "format_multiline": format_multiline,
-            "__py3o_image": ImageInjector(self),
-            "__py3o_frame": FrameInjector(self),
-            "get_var_corresponding_ods_type": get_var_corresponding_ods_type,
-        }
+        return get_base_data(self, self.typed_cells, self.table_loop_writers)
 
-    def render_tree(self, data):
-        """prepare the flows without saving to file
-        this method has been decoupled from render_flow to allow better
-        unit testing
+    def compile(self):
+        """transform the py3o template into Genshi templates
+
+        This is only done once per Template instance: every later call to
+        render_tree reuses the compiled Genshi templates. Static images must
+        have been set before compiling.
         """
+        if self.compiled_templates is not None:
+            return
 
         # Soft page breaks are hints for applications for rendering a page
         # break. Soft page breaks in for loops may compromise the paragraph
@@ -1319,17 +2833,69 @@ class Template:
 
         self.__replace_image_links()
 
-        # Add base functions/module access inside the template.
-        # Also allow users to add their own data
-        new_data = self.add_base_data_to_template()
+        self.__prepare_table_loops()
+        self.__prepare_parallel_loops()
 
-        for fnum, content_tree in enumerate(self.content_trees):
+        compiled_templates = []
+        for content_tree in self.content_trees:
             content = lxml.etree.tostring(content_tree.getroot())
             if self.ignore_undefined_variables:
                 template = MarkupTemplate(content, lookup="lenient")
             else:
                 template = MarkupTemplate(content)
+            # Genshi prepares its templates lazily on first use; do it now so
+            # compiled templates are complete before being shared between
+            # threads or forked processes.
+            template.stream
+            precompile_static_markup(template, get_list_tags(self.namespaces))
+            compiled_templates.append(template)
+
+        self.compiled_templates = compiled_templates
+
+    def clone(self, outfile):
+        """Return a new Template sharing our compiled Genshi templates.
+
+        The clone has its own output file, images and output streams, so
+        several clones of the same compiled template can be rendered one
+        after the other or concurrently (from different threads) without
+        paying for the template preparation again.
+
+        @param outfile: the desired file name (or binary file object) for the
+        resulting document
+        @type outfile: a string representing the full filename for output
+        """
+        self.compile()
+        if self.infile_pid != os.getpid() and isinstance(
+            self.template, (str, os.PathLike)
+        ):
+            # we are in a forked process: reopen the source archive instead
+            # of sharing the file offset of our parent's file descriptor
+            self.infile = zipfile.ZipFile(self.template, "r")
+            self.infile_pid = os.getpid()
+        template = copy(self)
+        template.outputfilename = outfile
+        template.images = dict(self.images)
+        template.output_streams = []
+        template.output_files = []
+        return template
 
+    def render_tree(self, data):
+        """prepare the flows without saving to file
+        this method has been decoupled from render_flow to allow better
+        unit testing
+        """
+        self.compile()
+
+        # Add base functions/module access inside the template.
+        # Also allow users to add their own data
+        new_data = self.add_base_data_to_template()
+        if self.parallel_loop_templates:
+            new_data["__py3o_parallel_loop"] = LoopChunkRenderer(self, data)
+
+        self.output_streams = []
+        for fname, template in zip(
+            self.templated_files, self.compiled_templates
+        ):
             # then we need to render the genshi template itself by
             # providing the data to genshi
 
@@ -1338,10 +2904,7 @@ class Template:
             template_dict.update(new_data.items())
 
             self.output_streams.append(
-                (
-                    self.templated_files[fnum],
-                    template.generate(**template_dict),
-                )
+                (fname, template.generate(**template_dict))
             )
 
     def render_flow(self, data):
@@ -1350,6 +2913,9 @@ class Template:
         @param data: the input stream of user data. This should be a dictionary
         mapping, keys being the values accessible to your report.
         @type data: dictionary
+
+        Yields True each time a block of buffer_size characters of the
+        rendered document has been written, then once the archive is closed.
         """
 
         self.render_tree(data)
@@ -1397,59 +2963,162 @@ class Template:
 
         self.images[identifier] = {"data": data, "mime_type": mime_type}
 
+    def __buffer(self, chunks):
+        """Join the serialized chunks into blocks of about buffer_size
+        characters.
+        """
+        buffer = []
+        size = 0
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= self.buffer_size:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+
+    def __compress_repeated(self, blocks):
+        """Merge the identical rows and cells of the serialized content."""
+        root = self.tree_roots[self.templated_files.index("content.xml")]
+        prefixes = {uri: prefix for prefix, uri in root.nsmap.items()}
+        if self.namespaces["table"] not in prefixes:
+            # no table in the document
+            return blocks
+        compressor = RepeatCompressor(prefixes[self.namespaces["table"]])
+        return compressor(blocks)
+
+    def __split_content(self, blocks):
+        """Split the tables and the encoded content of a spreadsheet that
+        grow too large."""
+        root = self.tree_roots[self.templated_files.index("content.xml")]
+        prefixes = {uri: prefix for prefix, uri in root.nsmap.items()}
+        if self.namespaces["table"] not in prefixes:
+            return blocks
+        splitter = TableSplitter(
+            prefixes[self.namespaces["table"]],
+            self.max_sheet_rows,
+            self.max_size,
+        )
+        return splitter(blocks)
+
+    def __serialize(self, fname):
+        """Yield the rendered content of a templated file as encoded blocks.
+        When the document is split, a None block separates the content of
+        one document from the next.
+        """
+        fname, output_stream = self.output_streams[
+            self.templated_files.index(fname)
+        ]
+        transformer = get_list_transformer(self.namespaces)
+        nstream = output_stream | transformer
+
+        # Stream the serialized document straight into the archive.
+        # Unlike Genshi's, our serializer does not cache the output
+        # of every distinct start tag (unique ids, cell values...)
+        # for the whole rendering.
+        serializer = XMLSerializer()
+        blocks = self.__buffer(serializer(nstream))
+        if self.compress_repeated and fname == "content.xml":
+            blocks = self.__compress_repeated(blocks)
+        blocks = (block.encode("utf-8") for block in blocks)
+        if fname == "content.xml" and (
+            self.max_sheet_rows is not None or self.max_size is not None
+        ):
+            blocks = self.__split_content(blocks)
+        return blocks
+
+    def __output_file(self, number):
+        """Return the output of the document ``number`` of a split
+        document, starting at 1."""
+        if callable(self.outputfilename):
+            return self.outputfilename(number)
+        if number == 1:
+            return self.outputfilename
+        if not isinstance(self.outputfilename, (str, os.PathLike)):
+            raise TemplateException(
+                "Splitting a document needs an output file name, or a "
+                "function returning the output of each document"
+            )
+        root, ext = os.path.splitext(os.fspath(self.outputfilename))
+        return "%s_%d%s" % (root, number, ext)
+
     def __save_output(self):
         """Saves the output into a native OOo document format."""
-        out = zipfile.ZipFile(self.outputfilename, "w", allowZip64=True)
-
         manifest_info = None
+        entries = []
         for info_zip in self.infile.infolist():
             if "manifest.xml" in info_zip.filename:
                 manifest_info = info_zip
-                continue
-
-            if info_zip.filename in self.templated_files:
-                # get a temp file
-                streamout = open(_get_secure_filename(), "w+b")
-
-                # Template file - we have edited these.
-                fname, output_stream = self.output_streams[
-                    self.templated_files.index(info_zip.filename)
-                ]
-
-                transformer = get_list_transformer(self.namespaces)
-                nstream = output_stream | transformer
-
-                # write the whole stream to it
-                for chunk in nstream.serialize():
-                    streamout.write(chunk.encode("utf-8"))
-                    yield True
-
-                streamout.seek(0)
+            else:
+                entries.append(info_zip)
+
+        # the content is streamed over as many documents as it is split in,
+        # the other templated files are kept to be written in each of them
+        content = None
+        rendered = {}
+        self.output_files = []
+        split = True
+        while split:
+            split = False
+            outfile = self.__output_file(len(self.output_files) + 1)
+            self.output_files.append(outfile)
+            out = zipfile.ZipFile(outfile, "w", allowZip64=True)
+
+            for info_zip in entries:
+                fname = info_zip.filename
+                if fname == "content.xml":
+                    if content is None:
+                        content = self.__serialize(fname)
+                    with out.open(
+                        fname, "w", force_zip64=self.zip64
+                    ) as streamout:
+                        for block in content:
+                            if block is None:
+                                split = True
+                                break
+                            streamout.write(block)
+                            yield True
+
+                elif fname in self.templated_files:
+                    # Template file - we have edited these.
+                    if fname in rendered:
+                        out.writestr(fname, rendered[fname])
+                        continue
+                    blocks = []
+                    with out.open(
+                        fname, "w", force_zip64=self.zip64
+                    ) as streamout:
+                        for block in self.__serialize(fname):
+                            streamout.write(block)
+                            if self.max_size is not None:
+                                blocks.append(block)
+                            yield True
+                    if self.max_size is not None:
+                        rendered[fname] = b"".join(blocks)
 
-                # close the temp file to flush all data and make sure we get
-                # it back when writing to the zip archive.
-                streamout.close()
+                else:
+                    # Copy other files straight from the source archive.
+                    # writestr updates the ZipInfo it is given, work on a
+                    # copy to keep the source archive readable by later
+                    # renders.
+                    out.writestr(
+                        copy(info_zip), self.infile.read(info_zip.filename)
+                    )
 
-                # write the full file to archive
-                out.write(streamout.name, fname)
+            # the manifest must be processed at the end since its content
+            # depends on the processing of others files (ie: content.xml)
+            if manifest_info:
+                manifest_e = self.__add_images_to_manifest()
+                out.writestr(
+                    copy(manifest_info), lxml.etree.tostring(manifest_e)
+                )
 
-                # remove temp file
-                os.unlink(streamout.name)
+            # Save images in the "Pictures" sub-directory of the archive.
+            for identifier, im_struct in self.images.items():
+                out.writestr(identifier, im_struct.get("data"))
 
-            else:
-                # Copy other files straight from the source archive.
-                out.writestr(info_zip, self.infile.read(info_zip.filename))
-
-        # the manifest must be processed at the end since its content
-        # depends on the processing of others files (ie: content.xml)
-        if manifest_info:
-            manifest_e = self.__add_images_to_manifest()
-            out.writestr(manifest_info, lxml.etree.tostring(manifest_e))
-
-        # Save images in the "Pictures" sub-directory of the archive.
-        for identifier, im_struct in self.images.items():
-            out.writestr(identifier, im_struct.get("data"))
-
-        # close the zipfile before leaving
-        out.close()
-        yield True
+            # close the zipfile before leaving
+            out.close()
+            yield True
@@ -0,0 +1,221 @@
+"""Run-length compression of the rows and cells of spreadsheets.
+
+Rendered spreadsheets often hold long runs of identical rows or cells:
+empty cells at the end of the rows, constant columns, blank rows between
+blocks. OpenDocument writes such a run as a single element with a
+``table:number-rows-repeated`` or ``table:number-columns-repeated``
+attribute, the way office suites save their own documents.
+
+:class:`RepeatCompressor` does the same to the serialized markup of a
+document, as it is written::
+
+    compressor = RepeatCompressor(prefix="table")
+    for markup in compressor(XMLSerializer()(stream)):
+        ...
+
+Cells and rows holding formulas are left alone: a formula refers to other
+cells by their address, which repeating it would not shift.
+"""
+
+import operator
+import re
+
+
+class RepeatCompressor:
+    """Merge the consecutive identical rows and cells of serialized
+    spreadsheet markup.
+
+    Calling the compressor on an iterable of markup strings yields the
+    compressed markup; it works best on large blocks of markup. The markup
+    is expected as written by :class:`py3o.template.serializer.XMLSerializer`:
+    the attribute values are escaped and the table namespace uses the same
+    prefix everywhere.
+    """
+
+    def __init__(self, prefix="table"):
+        """
+        :param prefix: the prefix of the table namespace in the markup
+        """
+        if prefix:
+            qualify = ("%s:%%s" % prefix).__mod__
+        else:
+            qualify = str
+        self.row_start = "<%s" % qualify("table-row")
+        self.row_end = "</%s>" % qualify("table-row")
+        self.row = re.compile(r"%s[ />]" % re.escape(self.row_start))
+        self.cell_start = "<%s" % qualify("table-cell")
+        self.covered_start = "<%s" % qualify("covered-table-cell")
+        self.cell = re.compile(
+            r"<(%s|%s)[ />]"
+            % (
+                re.escape(qualify("table-cell")),
+                re.escape(qualify("covered-table-cell")),
+            )
+        )
+        self.formula = " %s=" % qualify("formula")
+        self.rows_repeated = qualify("number-rows-repeated")
+        self.columns_repeated = qualify("number-columns-repeated")
+        self.repeated = {
+            name: re.compile(r' %s="(\d+)"' % re.escape(name))
+            for name in (self.rows_repeated, self.columns_repeated)
+        }
+
+    def __call__(self, blocks):
+        run = []
+        text = ""
+        output = []
+        for block in blocks:
+            if output:
+                yield "".join(output)
+                output = []
+            text += block
+            text = text[self._scan(text, run, output) :]
+
+        # whatever is left is not a complete row
+        self._flush(run, self.rows_repeated, output)
+        output.append(text)
+        yield "".join(output)
+
+    def _scan(self, text, run, output):
+        """Compress the complete rows of ``text`` into ``output``, return
+        where the remaining text starts.
+        """
+        pos = 0
+        # the last row and its repeat count
+        last, count = None, 0
+        while True:
+            if last is not None and text.startswith(last, pos):
+                # the same row again
+                run[1] += count
+                pos += len(last)
+                continue
+            last = None
+
+            match = self.row.search(text, pos)
+            if match is None:
+                # the end of the text may be the beginning of a row
+                keep = max(pos, len(text) - len(self.row_start))
+                if keep > pos:
+                    self._flush(run, self.rows_repeated, output)
+                    output.append(text[pos:keep])
+                return keep
+
+            start = match.start()
+            if start > pos:
+                self._flush(run, self.rows_repeated, output)
+                output.append(text[pos:start])
+                pos = start
+
+            tag_end = text.find(">", start)
+            if tag_end == -1:
+                return start
+            if text[tag_end - 1] == "/":
+                end = tag_end + 1
+            else:
+                end = text.find(self.row_end, tag_end)
+                if end == -1:
+                    return start
+                nested = text.find(self.row_start, tag_end, end)
+                if nested != -1:
+                    # a row of a sub-table: leave the outer row alone
+                    self._flush(run, self.rows_repeated, output)
+                    output.append(text[start:nested])
+                    pos = nested
+                    continue
+                end += len(self.row_end)
+
+            # the cells of a row are merged once for its whole run
+            row = text[start:end]
+            count = self._add(
+                run, row, self.rows_repeated, output, self._compress_row
+            )
+            if count is not None:
+                last = row
+            pos = end
+
+    def _compress_row(self, row):
+        """Merge the identical cells of a serialized row."""
+        tag_end = row.find(">")
+        if row[tag_end - 1] == "/":
+            return row
+        body_end = len(row) - len(self.row_end)
+        if self.columns_repeated not in row and self.covered_start not in row:
+            # identical cells are made of identical parts
+            parts = row[tag_end + 1 : body_end].split(self.cell_start)
+            if not any(map(operator.eq, parts, parts[1:])):
+                return row
+
+        output = [row[: tag_end + 1]]
+        run = []
+        pos = tag_end + 1
+        while pos < body_end:
+            match = self.cell.match(row, pos)
+            if match is None:
+                # not a plain sequence of cells
+                return row
+            tag_end = row.find(">", pos)
+            if row[tag_end - 1] == "/":
+                end = tag_end + 1
+            else:
+                cell_end = "</%s>" % match.group(1)
+                end = row.find(cell_end, tag_end)
+                if end == -1 or row.find(self.cell_start, tag_end, end) != -1:
+                    # a sub-table
+                    return row
+                end += len(cell_end)
+            self._add(run, row[pos:end], self.columns_repeated, output)
+            pos = end
+
+        self._flush(run, self.columns_repeated, output)
+        output.append(self.row_end)
+        return "".join(output)
+
+    def _add(self, run, element, repeated, output, finish=None):
+        """Add a serialized row or cell to the current ``run`` of identical
+        elements, flush the run into ``output`` if it is a different one.
+        ``finish`` is applied to the elements before they are written.
+
+        Return the repeat count of the element, None if it is written as
+        is.
+        """
+        if self.formula in element:
+            self._flush(run, repeated, output)
+            output.append(finish(element) if finish else element)
+            return None
+
+        tag_end = element.find(">")
+        if element[tag_end - 1] == "/":
+            tag_end -= 1
+        count = 1
+        match = self.repeated[repeated].search(element, 0, tag_end)
+        if match is not None:
+            count = int(match.group(1))
+            element = element[: match.start()] + element[match.end() :]
+
+        if run and run[0] == element:
+            run[1] += count
+        else:
+            self._flush(run, repeated, output)
+            run[:] = [element, count, finish]
+        return count
+
+    @staticmethod
+    def _flush(run, repeated, output):
+        """Write the current run of identical elements into ``output``."""
+        if not run:
+            return
+        element, count, finish = run
+        if finish is not None:
+            element = finish(element)
+        if count > 1:
+            tag_end = element.find(">")
+            if element[tag_end - 1] == "/":
+                tag_end -= 1
+            element = '%s %s="%d"%s' % (
+                element[:tag_end],
+                repeated,
+                count,
+                element[tag_end:],
+            )
+        output.append(element)
+        del run[:]
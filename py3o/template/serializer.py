@@ -0,0 +1,430 @@
+"""A fast XML serializer for rendered documents.
+
+Genshi's ``XMLSerializer`` chains three stream filters (empty tags, white
+space and namespace flattening) before writing markup, each of them being a
+Python generator handling every single event. The serializer below does the
+same work in a single pass, resolves every qualified name once per document
+instead of once per event, and produces exactly the same output as::
+
+    stream.serialize(cache=False)
+
+Most of a document does not depend on the rendered data: styles, column
+definitions, headers... :func:`precompile_static_markup` serializes those
+parts of a compiled template once, so that rendering only has to go through
+the dynamic parts.
+"""
+
+import re
+
+from genshi.core import (
+    COMMENT,
+    DOCTYPE,
+    END,
+    END_CDATA,
+    END_NS,
+    PI,
+    START,
+    START_CDATA,
+    START_NS,
+    TEXT,
+    XML_DECL,
+    XML_NAMESPACE,
+    Markup,
+)
+from genshi.template.base import SUB
+from genshi.template.directives import MatchDirective
+
+_trim_trailing_space = re.compile("[ \t]+(?=\n)").sub
+_collapse_lines = re.compile("\n{2,}").sub
+
+_XML_SPACE = XML_NAMESPACE["space"]
+
+
+def escape_attribute(text):
+    """Escape an attribute value, like genshi.core.escape"""
+    if not text:
+        return ""
+    if isinstance(text, Markup):
+        return text
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&#34;")
+    )
+
+
+def escape_text(text):
+    """Escape a text node, like genshi.core.escape(text, quotes=False)"""
+    if not text:
+        return ""
+    if isinstance(text, Markup):
+        return text
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def strip_text(text):
+    """Remove the extraneous white space of an escaped text node, like
+    genshi.output.WhitespaceFilter"""
+    if "\n" not in text:
+        return text
+    return _collapse_lines("\n", _trim_trailing_space("", text))
+
+
+class StaticMarkup(Markup):
+    """Markup serialized ahead of time, written as is by XMLSerializer"""
+
+    __slots__ = []
+
+
+class XMLSerializer:
+    """Serialize a Genshi event stream to XML.
+
+    Calling the serializer on a stream yields the markup as strings.
+    """
+
+    def __init__(self, namespaces=None):
+        """
+        :param namespaces: the namespaces already declared by the enclosing
+          document, as a ``{prefix: uri}`` dictionary
+        """
+        self.namespaces = namespaces or {}
+
+    def __call__(self, stream):
+        # namespace uri -> stack of prefixes, prefix -> stack of uris
+        namespaces = {XML_NAMESPACE.uri: ["xml"]}
+        prefixes = {"xml": [XML_NAMESPACE.uri]}
+        for prefix, uri in self.namespaces.items():
+            namespaces.setdefault(uri, []).append(prefix)
+            prefixes.setdefault(prefix, []).append(uri)
+        # QName -> qualified name, valid until the namespaces change
+        names = {}
+        ns_attrs = []
+        generated_prefixes = ("ns%d" % i for i in range(1, 1 << 31))
+
+        def push_ns(prefix, uri):
+            namespaces.setdefault(uri, []).append(prefix)
+            prefixes.setdefault(prefix, []).append(uri)
+            names.clear()
+
+        def pop_ns(prefix):
+            uris = prefixes.get(prefix)
+            uri = uris.pop()
+            if not uris:
+                del prefixes[prefix]
+            if uri not in uris or uri != uris[-1]:
+                uri_prefixes = namespaces[uri]
+                uri_prefixes.pop()
+                if not uri_prefixes:
+                    del namespaces[uri]
+            names.clear()
+            return uri
+
+        def qualify(qname):
+            """the qualified name of a QName in a known namespace"""
+            prefix = namespaces[qname.namespace][-1]
+            if prefix:
+                name = "%s:%s" % (prefix, qname.localname)
+            else:
+                name = qname.localname
+            names[qname] = name
+            return name
+
+        def start_tag(tag, attrs, end):
+            name = names.get(tag)
+            if name is None:
+                if not tag.namespace:
+                    name = names[tag] = tag.localname
+                elif tag.namespace in namespaces:
+                    name = qualify(tag)
+                else:
+                    ns_attrs.append(("xmlns", tag.namespace))
+                    push_ns("", tag.namespace)
+                    name = tag.localname
+
+            buf = ["<", name]
+            for attr, value in attrs:
+                attr_name = names.get(attr)
+                if attr_name is None:
+                    if not attr.namespace:
+                        attr_name = names[attr] = attr.localname
+                    else:
+                        if attr.namespace not in namespaces:
+                            prefix = next(generated_prefixes)
+                            push_ns(prefix, attr.namespace)
+                            ns_attrs.append(
+                                ("xmlns:%s" % prefix, attr.namespace)
+                            )
+                        attr_name = qualify(attr)
+                buf += [" ", attr_name, '="', escape_attribute(value), '"']
+
+            if ns_attrs:
+                # namespace declarations go before the other attributes
+                declarations = []
+                for attr, value in ns_attrs:
+                    declarations += [
+                        " ",
+                        attr,
+                        '="',
+                        escape_attribute(value),
+                        '"',
+                    ]
+                buf[2:2] = declarations
+                del ns_attrs[:]
+
+            buf.append(end)
+            return "".join(buf)
+
+        def end_tag(tag):
+            name = names.get(tag)
+            if name is None:
+                if tag.namespace:
+                    name = qualify(tag)
+                else:
+                    name = names[tag] = tag.localname
+            return "</%s>" % name
+
+        have_decl = have_doctype = False
+        preserve = 0
+        noescape = False
+        texts = []
+        pending = None
+
+        for kind, data, _pos in stream:
+            if pending is not None:
+                tag, attrs = pending
+                pending = None
+                if kind is END:
+                    # an element without content: <tag/>
+                    yield start_tag(tag, attrs, "/>")
+                    continue
+                if preserve or attrs.get(_XML_SPACE) == "preserve":
+                    preserve += 1
+                yield start_tag(tag, attrs, ">")
+
+            if kind is TEXT and type(data) is not StaticMarkup:
+                texts.append(Markup(data) if noescape else data)
+                continue
+
+            if texts:
+                if len(texts) > 1:
+                    text = "".join(escape_text(text) for text in texts)
+                else:
+                    text = escape_text(texts[0])
+                del texts[:]
+                if not preserve:
+                    text = strip_text(text)
+                yield text
+
+            if kind is START:
+                # wait for the next event to know if the element is empty
+                pending = data
+
+            elif kind is TEXT:
+                yield data
+
+            elif kind is END:
+                noescape = False
+                if preserve:
+                    preserve -= 1
+                yield end_tag(data)
+
+            elif kind is START_NS:
+                prefix, uri = data
+                if uri not in namespaces:
+                    prefix = prefixes.get(uri, [prefix])[-1]
+                    ns_attrs.append(
+                        ("xmlns%s" % (prefix and ":%s" % prefix or ""), uri)
+                    )
+                push_ns(prefix, uri)
+
+            elif kind is END_NS:
+                if data in prefixes:
+                    uri = pop_ns(data)
+                    if ns_attrs:
+                        attr = (
+                            "xmlns%s" % (data and ":%s" % data or ""),
+                            uri,
+                        )
+                        if attr in ns_attrs:
+                            ns_attrs.remove(attr)
+
+            elif kind is COMMENT:
+                yield "<!--%s-->" % data
+
+            elif kind is XML_DECL and not have_decl:
+                version, encoding, standalone = data
+                buf = ['<?xml version="%s"' % version]
+                if encoding:
+                    buf.append(' encoding="%s"' % encoding)
+                if standalone != -1:
+                    standalone = standalone and "yes" or "no"
+                    buf.append(' standalone="%s"' % standalone)
+                buf.append("?>\n")
+                yield "".join(buf)
+                have_decl = True
+
+            elif kind is DOCTYPE and not have_doctype:
+                name, pubid, sysid = data
+                buf = ["<!DOCTYPE %s"]
+                if pubid:
+                    buf.append(' PUBLIC "%s"')
+                elif sysid:
+                    buf.append(" SYSTEM")
+                if sysid:
+                    buf.append(' "%s"')
+                buf.append(">\n")
+                yield "".join(buf) % tuple(p for p in data if p)
+                have_doctype = True
+
+            elif kind is START_CDATA:
+                noescape = True
+                yield "<![CDATA["
+
+            elif kind is END_CDATA:
+                noescape = False
+                yield "]]>"
+
+            elif kind is PI:
+                yield "<?%s %s?>" % data
+
+        if texts:
+            text = "".join(escape_text(text) for text in texts)
+            if not preserve:
+                text = strip_text(text)
+            yield text
+
+
+def _is_static(event, namespaces, keep_tags):
+    """whether an event of a compiled template renders the same whatever
+    the data"""
+    kind, data, _pos = event
+    if kind is TEXT or kind is COMMENT:
+        return True
+    if kind is START:
+        tag, attrs = data
+        if tag in keep_tags or (
+            tag.namespace and tag.namespace not in namespaces
+        ):
+            return False
+        for attr, value in attrs:
+            # interpolated attribute values are lists of events
+            if type(value) is list or (
+                attr.namespace and attr.namespace not in namespaces
+            ):
+                return False
+        return True
+    if kind is END:
+        return not data.namespace or data.namespace in namespaces
+    return False
+
+
+def _merge_static_events(stream, serializer, keep_tags, protected):
+    """Return ``stream`` where the runs of static events are replaced by
+    their serialized markup. The ``protected`` first and last events of
+    the stream are left alone.
+    """
+    if len(stream) <= sum(protected):
+        return stream
+
+    namespaces = set(serializer.namespaces.values())
+    result = list(stream[: protected[0]])
+    run = []
+
+    def flush():
+        # A start tag at the end of a run may be empty depending on what
+        # follows, an end tag at the start of a run depending on what
+        # precedes; the text on the edges of a run may be joined with the
+        # text around it. All of them stay events.
+        start = 0
+        while start < len(run) and run[start][0] in (TEXT, END):
+            start += 1
+        end = len(run)
+        while end > start and run[end - 1][0] in (TEXT, START):
+            end -= 1
+
+        result.extend(run[:start])
+        if end - start > 1:
+            markup = "".join(serializer(run[start:end]))
+            result.append((TEXT, StaticMarkup(markup), run[start][2]))
+        else:
+            result.extend(run[start:end])
+        result.extend(run[end:])
+        del run[:]
+
+    for event in stream[protected[0] : len(stream) - protected[1]]:
+        if _is_static(event, namespaces, keep_tags):
+            run.append(event)
+            continue
+
+        flush()
+        kind, data, pos = event
+        if kind is SUB:
+            directives, substream = data
+            # directives such as py:strip or py:attrs work on the first and
+            # last events of their substream
+            substream = _merge_static_events(
+                substream, serializer, keep_tags, (1, 1)
+            )
+            event = kind, (directives, substream), pos
+        result.append(event)
+    flush()
+
+    result.extend(stream[len(stream) - protected[1] :])
+    return result
+
+
+def _walk(stream):
+    for event in stream:
+        yield event
+        if event[0] is SUB:
+            yield from _walk(event[1][1])
+
+
+def precompile_static_markup(template, keep_tags=()):
+    """Serialize the static parts of a prepared Genshi markup template.
+
+    The runs of events that do not depend on the rendered data are replaced
+    by their serialized markup, which :class:`XMLSerializer` writes as is.
+    The output of the template is unchanged.
+
+    Templates whose namespace declarations are not all on their root
+    element, that preserve white space or that use ``py:match`` are left
+    untouched.
+
+    :param template: a Genshi MarkupTemplate
+    :param keep_tags: QNames of the start tags that later stream filters
+      need to see as events
+    """
+    stream = template.stream
+
+    # namespace declarations come first, then the root element
+    namespaces = {}
+    root = 0
+    while root < len(stream) and stream[root][0] is START_NS:
+        prefix, uri = stream[root][1]
+        namespaces[prefix] = uri
+        root += 1
+    if root == len(stream) or stream[root][0] is not START:
+        return
+    trailing = 0
+    while trailing < len(stream) and stream[-1 - trailing][0] is END_NS:
+        trailing += 1
+
+    for kind, data, _pos in _walk(stream[root + 1 : len(stream) - trailing]):
+        if kind is START_NS or kind is END_NS or kind is START_CDATA:
+            return
+        if kind is START and data[1].get(_XML_SPACE) is not None:
+            return
+        if kind is SUB and any(
+            isinstance(directive, MatchDirective) for directive in data[0]
+        ):
+            return
+
+    # Genshi has no public API to alter a compiled template
+    template._stream = _merge_static_events(
+        stream,
+        XMLSerializer(namespaces),
+        frozenset(keep_tags),
+        (root + 1, trailing),
+    )
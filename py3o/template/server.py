@@ -0,0 +1,343 @@
+"""A local render server keeping compiled templates warm in memory.
+
+Starting a Python process, importing genshi, lxml, babel and PIL then
+compiling a template costs more than rendering a small document. This
+module provides a long running HTTP server, listening on localhost or on a
+Unix socket, that renders JSON payloads with templates kept in a
+:class:`py3o.template.cache.TemplateCache`.
+
+Endpoints:
+
+* ``POST /render`` with a JSON body ``{"template": name, "data": {...}}``
+  answers with the rendered document.
+* ``GET /metrics`` exposes counters and a render latency histogram in the
+  Prometheus text format.
+
+Run it with::
+
+    python -m py3o.template.server /path/to/templates --port 8765
+"""
+
+import argparse
+import json
+import logging
+import queue
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+
+from py3o.template.cache import TemplateCache
+
+log = logging.getLogger(__name__)
+
+# upper bounds (in seconds) of the render latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RenderMetrics:
+    """Thread safe counters exported by the /metrics endpoint."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.latency_sum = 0.0
+        self.renders = 0
+        self.errors = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def observe(self, duration, error=False):
+        """Record a render that took ``duration`` seconds."""
+        with self._lock:
+            self.renders += 1
+            self.latency_sum += duration
+            if error:
+                self.errors += 1
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    self.bucket_counts[i] += 1
+
+    def reject(self):
+        """Record a request refused because the queue was full."""
+        with self._lock:
+            self.rejected += 1
+
+    def to_prometheus(self, cache, queue_depth):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def add(name, kind, help_, value):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+
+        with self._lock:
+            add(
+                "py3o_template_cache_hits_total",
+                "counter",
+                "Renders served by an already compiled template.",
+                cache.hits,
+            )
+            add(
+                "py3o_template_cache_misses_total",
+                "counter",
+                "Renders that had to load and compile their template.",
+                cache.misses,
+            )
+            add(
+                "py3o_template_cache_size",
+                "gauge",
+                "Number of compiled templates in memory.",
+                len(cache),
+            )
+            add(
+                "py3o_render_errors_total",
+                "counter",
+                "Renders that failed.",
+                self.errors,
+            )
+            add(
+                "py3o_render_rejected_total",
+                "counter",
+                "Requests refused because the request queue was full.",
+                self.rejected,
+            )
+            add(
+                "py3o_render_queue_depth",
+                "gauge",
+                "Requests waiting for a worker.",
+                queue_depth,
+            )
+
+            name = "py3o_render_duration_seconds"
+            lines.append(f"# HELP {name} Time spent rendering documents.")
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(self.buckets, self.bucket_counts):
+                lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{le="+Inf"}} {self.renders}')
+            lines.append(f"{name}_sum {self.latency_sum}")
+            lines.append(f"{name}_count {self.renders}")
+
+        return "\n".join(lines) + "\n"
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Serve the /render and /metrics endpoints."""
+
+    protocol_version = "HTTP/1.0"
+
+    def address_string(self):
+        # Unix sockets do not have a client address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+    def send_body(self, code, body, content_type="text/plain; charset=utf-8"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_body(404, "Not found\n")
+            return
+        self.send_body(
+            200,
+            self.server.metrics.to_prometheus(
+                self.server.cache, self.server.requests.qsize()
+            ),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+    def read_payload(self):
+        """Return the template name and the data of a render request.
+
+        :raises: ValueError if the request is not a valid render payload
+        """
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ValueError("Invalid Content-Length") from None
+        # JSON decoding errors are ValueErrors
+        payload = json.loads(self.rfile.read(length))
+        if not isinstance(payload, dict):
+            raise ValueError("The payload must be a JSON object")
+        if not isinstance(payload.get("template"), str):
+            raise ValueError("The payload must name a 'template'")
+        data = payload.get("data", {})
+        if not isinstance(data, dict):
+            raise ValueError("The 'data' of the payload must be an object")
+        return payload["template"], data
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_body(404, "Not found\n")
+            return
+
+        start = time.perf_counter()
+        try:
+            name, data = self.read_payload()
+            # TemplateException is a ValueError
+            self.server.cache.resolve(name)
+        except ValueError as e:
+            self.server.metrics.observe(time.perf_counter() - start, True)
+            self.send_body(400, f"{e}\n")
+            return
+
+        try:
+            template = self.server.cache.get(name)
+            outfile = BytesIO()
+            template.clone(outfile).render(data)
+        except Exception:
+            # errors of the template or of the library, not of the request
+            log.exception("Could not render %s", name)
+            self.server.metrics.observe(time.perf_counter() - start, True)
+            self.send_body(500, "Internal server error\n")
+            return
+
+        self.server.metrics.observe(time.perf_counter() - start)
+        mime_type = "application/octet-stream"
+        if "mimetype" in template.infile.namelist():
+            mime_type = template.infile.read("mimetype").decode("ascii")
+        self.send_body(200, outfile.getvalue(), content_type=mime_type)
+
+
+class WorkerPoolMixIn:
+    """Handle requests in a fixed pool of worker threads.
+
+    Accepted connections wait in a bounded queue; when it is full the
+    connection is answered right away with a 503 error instead of piling
+    up threads.
+    """
+
+    workers = 4
+    queue_size = 64
+
+    def start_workers(self):
+        self.requests = queue.Queue(self.queue_size)
+        self._threads = [
+            threading.Thread(target=self._process_requests, daemon=True)
+            for _ in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _process_requests(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                break
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        try:
+            self.requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.metrics.reject()
+            try:
+                request.sendall(
+                    b"HTTP/1.0 503 Service Unavailable\r\n"
+                    b"Content-Length: 0\r\n\r\n"
+                )
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self.requests.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class RenderServer(WorkerPoolMixIn, HTTPServer):
+    """Render server listening on a TCP address, localhost by default."""
+
+    def __init__(self, address, cache, workers=None, queue_size=None):
+        if workers is not None:
+            self.workers = workers
+        if queue_size is not None:
+            self.queue_size = queue_size
+        self.cache = cache
+        self.metrics = RenderMetrics()
+        super().__init__(address, RenderRequestHandler)
+        self.start_workers()
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+
+    class UnixRenderServer(WorkerPoolMixIn, socketserver.UnixStreamServer):
+        """Render server listening on a Unix socket."""
+
+        def __init__(self, path, cache, workers=None, queue_size=None):
+            if workers is not None:
+                self.workers = workers
+            if queue_size is not None:
+                self.queue_size = queue_size
+            self.cache = cache
+            self.metrics = RenderMetrics()
+            super().__init__(path, RenderRequestHandler)
+            self.start_workers()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render py3o templates from JSON payloads."
+    )
+    parser.add_argument("template_dir", help="directory of the templates")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--socket", help="listen on this Unix socket instead of TCP"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--cache-size", type=int, default=128)
+    parser.add_argument(
+        "--ignore-undefined-variables", action="store_true", default=False
+    )
+    parser.add_argument("--escape-false", action="store_true", default=False)
+    args = parser.parse_args(argv)
+
+    cache = TemplateCache(
+        args.template_dir,
+        maxsize=args.cache_size,
+        ignore_undefined_variables=args.ignore_undefined_variables,
+        escape_false=args.escape_false,
+    )
+    if args.socket:
+        server = UnixRenderServer(
+            args.socket, cache, args.workers, args.queue_size
+        )
+    else:
+        server = RenderServer(
+            (args.host, args.port), cache, args.workers, args.queue_size
+        )
+
+    logging.basicConfig(level=logging.INFO)
+    log.info("py3o render server listening on %s", server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,367 @@
+"""Splitting of the sheets and documents that grow too large.
+
+A sheet holds at most 1,048,576 rows: office suites do not load the rows
+beyond, or refuse the whole document. :class:`TableSplitter` continues the
+rows of a sheet that reaches the limit in a copy of the sheet, inserted right
+after it. It can also split the document itself once its content reaches a
+given size, each part holding the rows that follow in a copy of the current
+sheet.
+
+Both work on the encoded content of a spreadsheet, as it is written::
+
+    splitter = TableSplitter(prefix="table", max_size=50 * 2**20)
+    for block in splitter(blocks):
+        if block is None:
+            # the end of a document, the next blocks start the next one
+            ...
+
+Sheets are only split between their top-level rows, so that the rows of a
+part are complete. The blank rows office suites repeat up to the end of a
+sheet are cut at the limit rather than continued in a copy of the sheet.
+The copies of a sheet keep its column definitions, header rows and row
+groups; their names get a `` (2)``, `` (3)``... suffix.
+"""
+
+import re
+
+# the rows of a sheet, as of OpenDocument 1.3
+MAX_SHEET_ROWS = 1048576
+
+_tag = re.compile(rb"<(/?)([^\s/>!?]+)[^>]*?(/?)>")
+# the elements of a blank row
+_blank_tags = {b"table-row", b"table-cell", b"covered-table-cell", b"p"}
+_element = re.compile(rb"</?(?:[^\s/>:]+:)?([^\s/>]+)")
+_content = re.compile(rb">\s*[^<\s]|value-type=|formula=")
+
+
+def _is_blank(row):
+    """Tell if the markup of a row shows nothing: empty cells only."""
+    return _content.search(row) is None and all(
+        name in _blank_tags for name in _element.findall(row)
+    )
+
+
+def _closing_tags(markup):
+    """Return the end tags of the elements left open by ``markup``."""
+    stack = []
+    for match in _tag.finditer(markup):
+        closing, name, empty = match.groups()
+        if closing:
+            if stack and stack[-1] == name:
+                stack.pop()
+        elif not empty:
+            stack.append(name)
+    return b"".join(b"</%s>" % name for name in reversed(stack))
+
+
+class TableSplitter:
+    """Split the sheets of serialized spreadsheet content at a number of
+    rows, and the content itself at a size.
+
+    Calling the splitter on an iterable of encoded markup yields the split
+    markup, with None wherever a document ends and the next one starts.
+    The markup is expected as written by
+    :class:`py3o.template.serializer.XMLSerializer`.
+    """
+
+    def __init__(self, prefix="table", max_rows=MAX_SHEET_ROWS, max_size=None):
+        """
+        :param prefix: the prefix of the table namespace in the markup
+        :type prefix: string
+
+        :param max_rows: the number of rows after which a sheet is continued
+          in a copy of itself, None not to split the sheets
+        :type max_rows: int
+
+        :param max_size: the size in bytes after which the content is
+          continued in a new document, None for a single document
+        :type max_size: int
+        """
+        qualified = (prefix + ":" if prefix else "").encode("utf-8")
+        self.tag = re.compile(
+            rb"<(/?)%stable(-row-group|-header-rows|-rows|-row"
+            rb"|-column-group|-header-columns|-columns|-column)?[ />]"
+            % re.escape(qualified)
+        )
+        self.repeated = re.compile(
+            rb' %snumber-rows-repeated="(\d+)"' % re.escape(qualified)
+        )
+        self.name = re.compile(rb' %sname="([^"]*)"' % re.escape(qualified))
+        self.print_ranges = re.compile(
+            rb' %sprint-ranges="[^"]*"' % re.escape(qualified)
+        )
+        self.table_end = b"</%stable>" % qualified
+        # what may come between the last row of a sheet and its end
+        self.sheet_end = re.compile(
+            rb"(?:\s|</%stable-[a-z-]+>)*</%stable>"
+            % (re.escape(qualified), re.escape(qualified))
+        )
+        self.row_start = b"<%stable-row" % qualified
+        # the markup needing a closer look than counting the rows
+        self.structure = re.compile(
+            rb"%stable(?:[ >]|-r(?:ow-group|ows)|-header-|-column)"
+            % re.escape(qualified)
+        )
+        self.row_end = b"</%stable-row>" % qualified
+        self.group_end = b"</%stable%%s>" % qualified
+        self.repeated_attr = b' %snumber-rows-repeated="%%d"' % qualified
+        self.max_rows = max_rows
+        self.max_size = max_size
+
+    def __call__(self, blocks):
+        # the markup that starts every document, up to the first sheet, and
+        # the end tags that close it
+        self.prologue = None
+        self.epilogue = b""
+        self.head = []
+        # the sheet being written: its start tag, column definitions, header
+        # rows and open row groups
+        self.depth = 0
+        self.sheet = None
+        self.columns = []
+        self.header = []
+        self.header_rows = 0
+        self.groups = []
+        self.copies = {}
+        # the column definitions or header rows being copied, if any
+        self.capture = None
+        # rows in the current sheet, size of the current document
+        self.rows = 0
+        self.size = 0
+
+        text = b""
+        output = []
+        for block in blocks:
+            text += block
+            end = len(text)
+            last = text.rfind(b"<")
+            if last != -1 and text.find(b">", last) == -1:
+                # a tag cut by the end of the block
+                end = last
+            text = text[self._scan(text, end, output) :]
+            yield from output
+            del output[:]
+
+        if text:
+            self._emit(text, output)
+            yield from output
+
+    def _emit(self, markup, output):
+        """Write markup into ``output``."""
+        if not markup:
+            return
+        if self.prologue is None:
+            self.head.append(markup)
+        if output and output[-1] is not None:
+            output[-1] += markup
+        else:
+            output.append(markup)
+        self.size += len(markup)
+
+    def _scan(self, text, end, output):
+        """Split the markup of ``text`` up to ``end`` into ``output``,
+        return where the markup left for the next block starts.
+        """
+        if self.capture is None and not self.structure.search(text, 0, end):
+            # only rows: count them
+            rows = 0
+            if self.depth == 1:
+                rows = text.count(self.row_start, 0, end)
+                repeated = self.repeated.findall(text, 0, end)
+                if repeated:
+                    rows += sum(map(int, repeated)) - len(repeated)
+            if (
+                self.max_rows is None or self.rows + rows <= self.max_rows
+            ) and (self.max_size is None or self.size + end <= self.max_size):
+                self.rows += rows
+                self._emit(text[:end], output)
+                return end
+
+        written = 0
+        # where the markup being copied starts in the text
+        captured = 0
+        for match in self.tag.finditer(text, 0, end):
+            start = match.start()
+            closing, kind = match.groups()
+            if not kind:
+                if closing:
+                    self.depth -= 1
+                    continue
+                self.depth += 1
+                if self.depth == 1:
+                    if self.prologue is None:
+                        self.prologue = (
+                            b"".join(self.head) + text[written:start]
+                        )
+                        self.head = None
+                        self.epilogue = _closing_tags(self.prologue)
+                    self.sheet = text[start : text.find(b">", start) + 1]
+                    self.columns = []
+                    self.header = []
+                    self.header_rows = 0
+                    self.groups = []
+                    self.rows = 0
+                continue
+
+            if self.depth != 1:
+                continue
+
+            if kind.startswith(b"-column"):
+                if self.capture is None and not self.columns and not closing:
+                    # the column definitions start
+                    self.capture = self.columns
+                    captured = start
+                continue
+
+            if self.capture is self.columns:
+                # the column definitions end with the first rows
+                self.columns.append(text[captured:start])
+                self.capture = None
+
+            if kind == b"-header-rows":
+                if not closing:
+                    self.capture = self.header
+                    captured = start
+                elif self.capture is self.header:
+                    tag_end = text.find(b">", start) + 1
+                    self.header.append(text[captured:tag_end])
+                    self.header_rows = self.rows
+                    self.capture = None
+                continue
+
+            if kind != b"-row":
+                if closing:
+                    if self.groups:
+                        self.groups.pop()
+                else:
+                    tag_end = text.find(b">", start) + 1
+                    if text[tag_end - 2 : tag_end] != b"/>":
+                        self.groups.append((kind, text[start:tag_end]))
+                continue
+            if closing:
+                continue
+
+            tag_end = text.find(b">", start)
+            count = 1
+            repeated = self.repeated.search(text, start, tag_end)
+            if repeated is not None:
+                count = int(repeated.group(1))
+            if self.capture is not None:
+                # a header row
+                self.rows += count
+                continue
+
+            if (
+                self.max_size is not None
+                and self.rows > self.header_rows
+                and self.size + start - written > self.max_size
+            ):
+                self._emit(text[written:start], output)
+                written = start
+                self._break_document(output)
+
+            if self.max_rows is not None and self.rows + count > self.max_rows:
+                self._emit(text[written:start], output)
+                written = start
+                if count > 1:
+                    # write the repeated row in as many sheets as needed
+                    if text[tag_end - 1 : tag_end] == b"/":
+                        row_end = tag_end + 1
+                    else:
+                        row_end = text.find(self.row_end, tag_end)
+                        if row_end == -1:
+                            # wait for the end of the row
+                            end = start
+                            break
+                        row_end += len(self.row_end)
+                    row = text[start:row_end]
+                    if _is_blank(row):
+                        if self.sheet_end.match(text, row_end) is None:
+                            if (
+                                text.find(self.row_start, row_end, end) == -1
+                                and text.find(self.table_end, row_end, end)
+                                == -1
+                            ):
+                                # wait for what follows the row
+                                end = start
+                                break
+                        else:
+                            # blank rows filling the sheet up to its end:
+                            # keep the ones within the limit
+                            part = self.max_rows - self.rows
+                            if part > 0:
+                                self._emit(self._repeat(row, part), output)
+                                self.rows += part
+                            written = row_end
+                            continue
+                    while self.rows + count > self.max_rows:
+                        part = self.max_rows - self.rows
+                        if part > 0:
+                            self._emit(self._repeat(row, part), output)
+                            count -= part
+                        self._break_sheet(output)
+                    self._emit(self._repeat(row, count), output)
+                    self.rows += count
+                    written = row_end
+                    continue
+                self._break_sheet(output)
+
+            self.rows += count
+
+        if self.capture is not None:
+            self.capture.append(text[captured:end])
+        self._emit(text[written:end], output)
+        return end
+
+    def _repeat(self, row, count):
+        """Return the markup of a row repeated ``count`` times."""
+        tag_end = row.find(b">")
+        if row[tag_end - 1 : tag_end] == b"/":
+            tag_end -= 1
+        start_tag = self.repeated.sub(b"", row[:tag_end])
+        if count > 1:
+            start_tag += self.repeated_attr % count
+        return start_tag + row[tag_end:]
+
+    def _close_sheet(self):
+        """Return the markup closing the current sheet."""
+        return (
+            b"".join(
+                self.group_end % kind for kind, _tag in reversed(self.groups)
+            )
+            + self.table_end
+        )
+
+    def _open_sheet(self, sheet):
+        """Return the markup opening a copy of the current sheet, starting
+        with ``sheet``."""
+        return (
+            sheet
+            + b"".join(self.columns)
+            + b"".join(self.header)
+            + b"".join(tag for _kind, tag in self.groups)
+        )
+
+    def _break_sheet(self, output):
+        """Continue the current sheet in a copy of itself."""
+        sheet = self.print_ranges.sub(b"", self.sheet)
+        name = self.name.search(sheet)
+        if name is not None:
+            copies = self.copies.get(name.group(1), 1) + 1
+            self.copies[name.group(1)] = copies
+            sheet = b'%s%s (%d)"%s' % (
+                sheet[: name.start()],
+                name.group(0)[:-1],
+                copies,
+                sheet[name.end() :],
+            )
+        self._emit(self._close_sheet() + self._open_sheet(sheet), output)
+        self.rows = self.header_rows
+
+    def _break_document(self, output):
+        """Continue the current sheet in a new document."""
+        self._emit(self._close_sheet() + self.epilogue, output)
+        output.append(None)
+        self.size = 0
+        self._emit(self.prologue + self._open_sheet(self.sheet), output)
+        self.rows = self.header_rows
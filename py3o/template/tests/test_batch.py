@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import Mock
+
+from py3o.template import Template
+from py3o.template.batch import estimate_cost, render_batch, schedule
+from py3o.template.cache import TemplateCache
+
+from .utils import resource_filename
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for name in (
+            "py3o_nested_list_template.odt",
+            "py3o_list_template.odt",
+        ):
+            shutil.copy(
+                resource_filename("py3o.template", "tests/templates/" + name),
+                self.tmp_dir,
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_estimate_cost(self):
+        template = Template(
+            os.path.join(self.tmp_dir, "py3o_nested_list_template.odt"), None
+        )
+        structure = template.get_data_structure()
+
+        def item(lines, image=b""):
+            return Mock(lines=[Mock(val=i) for i in range(lines)], logo=image)
+
+        assert estimate_cost(structure, {"items": []}) == 0
+        # 2 items, 3 + 4 lines
+        assert estimate_cost(structure, {"items": [item(3), item(4)]}) == 9
+        # binary values used by the template count in rows of bytes_per_row
+        # bytes, the others are ignored
+        data = {
+            "items": [
+                item(1, b"x" * 4096),
+                {"lines": [{"val": b"xx"}, Mock(val=b"x" * 4096)]},
+            ],
+            "ignored": b"x" * 4096,
+        }
+        assert estimate_cost(structure, data, bytes_per_row=2) == 5 + 4098 / 2
+        # generators are not consumed
+        lines = (i for i in range(3))
+        data = {"items": [Mock(lines=lines)]}
+        assert estimate_cost(structure, data) == 1
+        assert next(lines) == 0
+
+    def test_schedule(self):
+        cache = TemplateCache(self.tmp_dir)
+        jobs = [
+            ("py3o_list_template.odt", {"items": [1] * size}, "out%s" % size)
+            for size in (1, 10, 5)
+        ]
+        assert schedule(jobs, cache, "fifo") == jobs
+        assert [job[2] for job in schedule(jobs, cache)] == [
+            "out10",
+            "out5",
+            "out1",
+        ]
+        # the templates are loaded once, through the cache
+        assert len(cache) == 1
+        assert len(cache.schemas) == 1
+
+    def test_render_batch(self):
+        jobs = []
+        for size in (1, 20, 5):
+            data = {"items": [{"val": "row%s" % i} for i in range(size)]}
+            outfile = os.path.join(self.tmp_dir, "out%s.odt" % size)
+            jobs.append(("py3o_list_template.odt", data, outfile))
+
+        done = render_batch(jobs, self.tmp_dir, processes=2)
+        assert sorted(done) == sorted(job[2] for job in jobs)
+
+        for name, data, outfile in jobs:
+            content = zipfile.ZipFile(outfile).read("content.xml")
+            assert content.count(b"row") == len(data["items"])
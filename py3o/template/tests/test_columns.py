@@ -0,0 +1,93 @@
+import array
+import pickle
+import unittest
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from py3o.template import Template
+from py3o.template.columns import ROW_TYPE_CACHE_SIZE, Columns, row_type
+
+from .utils import resource_filename
+
+
+class TestColumns(unittest.TestCase):
+    def test_rows(self):
+        columns = Columns(
+            {
+                "amount": array.array("d", [1, 2.5, 3]),
+                "label": ["a", "b", "c"],
+                "count": [4, 5, 6],
+                "unit price": [7, 8, 9],
+            },
+            block_size=2,
+        )
+        assert len(columns) == 3
+        rows = list(columns)
+        assert [tuple(row) for row in rows] == [
+            (1.0, "a", 4, 7),
+            (2.5, "b", 5, 8),
+            (3.0, "c", 6, 9),
+        ]
+        row = rows[1]
+        assert row.amount == row["amount"] == row[0] == 2.5
+        # columns are converted to Python values
+        assert type(row.amount) is float
+        assert row.count == 5
+        assert row["unit price"] == 8
+        with pytest.raises(KeyError):
+            row["missing"]
+        with pytest.raises(AttributeError):
+            row.missing
+
+        assert columns[-1] == rows[2]
+        assert list(columns[1:]) == rows[1:]
+        with pytest.raises(IndexError):
+            columns[3]
+        assert pickle.loads(pickle.dumps(row)) == row
+        assert pickle.loads(pickle.dumps(row)).label == "b"
+
+        assert list(Columns({})) == []
+        with pytest.raises(ValueError):
+            Columns({"a": [1], "b": []})
+
+    def test_row_types_bounded(self):
+        row = Columns({"a": [1], "b": [2]})[0]
+        for i in range(ROW_TYPE_CACHE_SIZE + 1):
+            Columns({"c%d" % i: [i]})
+        assert row_type.cache_info().currsize <= ROW_TYPE_CACHE_SIZE
+        # rows of evicted classes keep working
+        assert pickle.loads(pickle.dumps(row)) == row
+        assert pickle.loads(pickle.dumps(row)).b == 2
+
+    def render(self, items, **options):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_ods_variable_type.ods"
+        )
+        outfile = BytesIO()
+        template = Template(template_name, outfile)
+        if options.get("table_loop"):
+            template.set_table_loop("items")
+        if options.get("parallel_loop"):
+            template.set_parallel_loop("items", processes=1, chunk_size=3)
+        template.render({"items": items})
+        with zipfile.ZipFile(outfile) as outods:
+            return outods.read("content.xml")
+
+    def test_template(self):
+        val1 = [1, 2.5, None, "text", "<&>"] * 3
+        val2 = list(range(len(val1)))
+        expected = self.render(
+            [{"val1": a, "val2": b} for a, b in zip(val1, val2)]
+        )
+        columns = Columns(
+            {"val1": val1, "val2": array.array("l", val2)}, block_size=4
+        )
+        for options in (
+            {},
+            {"table_loop": True},
+            {"parallel_loop": True},
+        ):
+            with self.subTest(**options):
+                assert self.render(columns, **options) == expected
@@ -1,11 +1,21 @@
+import copy
+import json
 import os
+import pickle
 import unittest
+from io import StringIO
 from unittest.mock import Mock
 
 import lxml.etree
+import pytest
 from xmldiff import main as xmldiff
 
-from py3o.template.data_struct import Py3oDataError, Py3oName
+from py3o.template.data_struct import (
+    Py3oArray,
+    Py3oContainer,
+    Py3oDataError,
+    Py3oName,
+)
 from py3o.template.helpers import Py3oConvertor
 from py3o.template.main import (
     Template,
@@ -788,6 +798,196 @@ class TestHelpers(unittest.TestCase):
 
         assert json_dict == {"item": {"mytest": 0, "myvar": 1, "myvar2": 2}}
 
+    def test_data_structure_nodes(self):
+        """The nodes of a data structure keep their attributes in slots,
+        through copies and pickling."""
+        expressions = [
+            'for="item in items"',
+            "item",
+            "/for",
+            'for="line in lines"',
+            "line.val",
+            'function="format(line.amount)"',
+            "/for",
+        ]
+        res = Py3oConvertor()(Template.convert_py3o_to_python_ast(expressions))
+        assert res["items"].direct_access
+        assert not res["lines"].direct_access
+        for node in (res, res["items"], res["lines"]["val"]):
+            assert not hasattr(node, "__dict__")
+        for copy_ in (copy.copy(res), pickle.loads(pickle.dumps(res))):
+            assert copy_ == res
+            assert type(copy_["items"]) is Py3oArray
+            assert copy_["items"].direct_access
+        data = {
+            "items": [1, 2],
+            "lines": [Mock(val="a", amount=1), Mock(val="b", amount=2)],
+        }
+        assert pickle.loads(pickle.dumps(res)).render(data) == {
+            "items": [1, 2],
+            "lines": [{"val": "a", "amount": 1}, {"val": "b", "amount": 2}],
+        }
+
+        container = Py3oContainer([Py3oName()])
+        assert container.get_tuple() == (Py3oName(),)
+
+    def test_extractor(self):
+        """The compiled extractor gives the same results as render."""
+        expressions = [
+            'for="item in items"',
+            "item.label",
+            "item.product.name",
+            'for="line in item.lines"',
+            "line.qty",
+            "/for",
+            "/for",
+            'for="tag in tags"',
+            "tag",
+            "/for",
+            'for="a, b in pairs"',
+            "a.x",
+            "b",
+            "/for",
+            'function="format(document.total, document.empty)"',
+        ]
+        res = Py3oConvertor()(Template.convert_py3o_to_python_ast(expressions))
+        data = {
+            "items": [
+                Mock(
+                    label="a",
+                    product=Mock(),
+                    lines=[Mock(qty=0), Mock(qty=None), Mock(qty=False)],
+                ),
+                Mock(label=None, product=Mock(), lines=[]),
+            ],
+            "tags": ["x", "y"],
+            "pairs": [(Mock(x=1), 2), (Mock(x=""), 0)],
+            "document": Mock(total=0.0, empty=""),
+        }
+        data["items"][0].product.name = "p"
+        data["items"][1].product.name = 0
+        expected = res.render(data)
+        extract = res.get_extractor()
+        assert extract(data) == expected
+        assert res.get_extractor() is extract
+
+        records = res.get_extractor(records=True)(data)
+        assert records.keys() == expected.keys()
+        item = records["items"][0]
+        assert item.label == "a"
+        assert item.product.name == "p"
+        assert item["lines"][2].qty is False
+        assert item.lines[1].qty == ""
+        assert records["items"][1].label == ""
+        assert records["tags"] == expected["tags"]
+        assert records["pairs"] == expected["pairs"]
+        assert records["document"].total == 0.0
+
+        # the compiled functions are left out of pickles
+        assert (
+            pickle.loads(pickle.dumps(res)).get_extractor()(data) == expected
+        )
+
+        del data["tags"]
+        with pytest.raises(Py3oDataError):
+            extract(data)
+
+    def test_iter_json(self):
+        """The JSON text of the extracted data is streamed in chunks."""
+        expressions = [
+            'for="item in items"',
+            "item.label",
+            "item.product.name",
+            'for="line in item.lines"',
+            "line.qty",
+            "/for",
+            "/for",
+            'for="tag in tags"',
+            "tag",
+            "/for",
+            'for="a, b in pairs"',
+            "a.x",
+            "b",
+            "/for",
+            'for="line in document.lines"',
+            "line.val",
+            "/for",
+            "document.total",
+        ]
+        res = Py3oConvertor()(Template.convert_py3o_to_python_ast(expressions))
+        data = {
+            "items": [
+                Mock(label='a\u00e9"', lines=[Mock(qty=0), Mock(qty=None)]),
+                Mock(label=None, lines=[]),
+            ],
+            # converted by blocks
+            "tags": ["x", 2.5] + list(range(2500)),
+            "pairs": [(Mock(x=1), float("nan"))],
+            "document": Mock(total=False, lines=[Mock(val=1), Mock(val="")]),
+        }
+        data["items"][0].product.name = "p"
+        data["items"][1].product.name = 0
+        expected = json.dumps(res.render(data))
+        for chunk_size in (1, 20, 1000000):
+            chunks = list(res.iter_json(data, chunk_size))
+            assert "".join(chunks) == expected
+            assert all(len(chunk) >= chunk_size for chunk in chunks[:-1])
+        stream = StringIO()
+        res.dump_json(data, stream)
+        assert stream.getvalue() == expected
+
+        # the first chunks come before the end of the loop
+        consumed = []
+
+        def items():
+            for i in range(1000):
+                consumed.append(i)
+                item = Mock(label=str(i), lines=[])
+                item.product.name = "p"
+                yield item
+
+        data["items"] = items()
+        chunks = res.iter_json(data, chunk_size=100)
+        assert next(chunks).startswith('{"items": [{"label": "0"')
+        assert len(consumed) < 10
+
+        del data["tags"]
+        chunks = res.iter_json(data)
+        with pytest.raises(Py3oDataError):
+            next(chunks)
+
+    def test_repeated_empty_blocks(self):
+        """Empty blocks are found where they are, even when the same block
+        appears earlier with a body."""
+        expressions = [
+            'for="item in items"',
+            "item.val",
+            "/for",
+            'for="item in items"',
+            "/for",
+            'if="item"',
+            "item.val",
+            "/if",
+            'if="item"',
+            "/if",
+        ]
+        py_expr = Template.convert_py3o_to_python_ast(expressions)
+        assert py_expr == (
+            "for item in items:\n"
+            " item.val\n"
+            "for item in items:\n"
+            " pass\n"
+            "if item:\n"
+            " item.val\n"
+            "if item:\n"
+            " pass\n"
+        )
+        res = Py3oConvertor()(py_expr)
+        assert res.render({"items": [Mock(val=1)], "item": Mock(val=2)}) == {
+            "items": [{"val": 1}],
+            "item": {"val": 2},
+        }
+
     def test_if_global(self):
         expressions = ['if="mytest"', "item.myvar", "item.myvar2", "/if"]
         py_expr = Template.convert_py3o_to_python_ast(expressions)
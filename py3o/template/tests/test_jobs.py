@@ -0,0 +1,199 @@
+import glob
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from py3o.template.cache import TemplateCache
+from py3o.template.jobs import (
+    DONE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    JobQueue,
+    _renewing,
+    run_workers,
+    work,
+)
+
+from .utils import resource_filename
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.template_dir = os.path.join(self.tmp_dir, "templates")
+        os.mkdir(self.template_dir)
+        shutil.copy(
+            resource_filename(
+                "py3o.template",
+                "tests/templates/py3o_template_function_call.odt",
+            ),
+            self.template_dir,
+        )
+        self.db = os.path.join(self.tmp_dir, "jobs.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def outfile(self, i):
+        return os.path.join(self.tmp_dir, "out%s.odt" % i)
+
+    def test_run_workers(self):
+        queue = JobQueue(self.db, max_attempts=2)
+        queue.submit_many(
+            (
+                "py3o_template_function_call.odt",
+                {"amount": i + 0.5},
+                self.outfile(i),
+            )
+            for i in range(1, 7)
+        )
+        queue.submit("missing.odt", {}, self.outfile("missing"))
+
+        counts = run_workers(
+            self.db, self.template_dir, processes=2, max_attempts=2
+        )
+        assert counts == {PENDING: 0, RUNNING: 0, DONE: 6, FAILED: 1}
+
+        for i in range(1, 7):
+            content = zipfile.ZipFile(self.outfile(i)).read("content.xml")
+            assert ("%s,50 %%" % i).encode("utf-8") in content
+        assert not os.path.exists(self.outfile("missing"))
+        assert not glob.glob(os.path.join(self.tmp_dir, "*.part"))
+
+        ((job_id, error),) = queue.errors()
+        assert job_id == 7
+        assert error == "Template 'missing.odt' not found"
+
+    @pytest.mark.skipif(
+        "fork" not in multiprocessing.get_all_start_methods(),
+        reason="needs forked workers",
+    )
+    def test_run_workers_shared_cache(self):
+        """the workers render with the templates compiled beforehand"""
+        queue = JobQueue(self.db)
+        queue.submit_many(
+            ("py3o_template_function_call.odt", {"amount": i}, self.outfile(i))
+            for i in range(4)
+        )
+        cache = TemplateCache(self.template_dir)
+        # workers building their own cache would fail
+        with patch(
+            "py3o.template.jobs.TemplateCache", side_effect=[cache]
+        ) as factory:
+            counts = run_workers(self.db, self.template_dir, processes=2)
+        assert counts == {PENDING: 0, RUNNING: 0, DONE: 4, FAILED: 0}
+        assert factory.call_count == 1
+        assert len(cache) == 1
+
+    def test_retry(self):
+        queue = JobQueue(self.db, max_attempts=2)
+        queue.submit("missing.odt", {}, self.outfile(0))
+
+        job = queue.claim()
+        assert job.attempts == 1
+        queue.fail(job, "boom")
+        assert queue.counts()[PENDING] == 1
+
+        job = queue.claim()
+        assert job.attempts == 2
+        queue.fail(job, "boom")
+        assert queue.counts()[FAILED] == 1
+        assert queue.claim() is None
+
+    def test_priority(self):
+        queue = JobQueue(self.db)
+        queue.submit("a.odt", {}, self.outfile(0))
+        queue.submit("b.odt", {}, self.outfile(1), priority=10)
+        assert queue.claim().template == "b.odt"
+        assert queue.claim().template == "a.odt"
+
+    def test_resume_after_crash(self):
+        """jobs claimed by a dead worker are rendered again"""
+        queue = JobQueue(self.db, lease=60)
+        for i in range(3):
+            queue.submit(
+                "py3o_template_function_call.odt",
+                {"amount": i},
+                self.outfile(i),
+            )
+        queue.complete(queue.claim("crashed"))
+        queue.claim("crashed")
+
+        # the lease of the second job is still running
+        cache = TemplateCache(self.template_dir)
+        assert work(JobQueue(self.db, lease=60), cache) == 1
+        assert queue.counts()[RUNNING] == 1
+
+        # until it expires
+        assert work(JobQueue(self.db, lease=-1), cache) == 1
+        assert queue.counts() == {PENDING: 0, RUNNING: 0, DONE: 3, FAILED: 0}
+
+        queue.submit("py3o_template_function_call.odt", {}, self.outfile(4))
+        queue.claim("crashed")
+        queue.recover()
+        assert queue.claim().outfile == self.outfile(4)
+
+    def test_claim_is_exclusive(self):
+        queue = JobQueue(self.db)
+        queue.submit_many(("a.odt", {}, self.outfile(i), 0) for i in range(20))
+        other = JobQueue(self.db)
+        claimed = set()
+        start = time.time()
+        while True:
+            jobs = [queue.claim("one"), other.claim("two")]
+            jobs = [job.id for job in jobs if job is not None]
+            if not jobs:
+                break
+            assert claimed.isdisjoint(jobs)
+            claimed.update(jobs)
+            assert time.time() - start < 30
+        assert len(claimed) == 20
+
+    def test_expired_lease_attempts(self):
+        """a job that keeps killing its worker ends up failed"""
+        queue = JobQueue(self.db, max_attempts=2, lease=-1)
+        queue.submit("a.odt", {}, self.outfile(0))
+        assert queue.claim("crashed").attempts == 1
+        assert queue.claim("crashed").attempts == 2
+        assert queue.claim() is None
+        assert queue.counts()[FAILED] == 1
+        assert queue.errors() == [(1, "Lease expired")]
+
+        queue.submit("a.odt", {}, self.outfile(1))
+        queue.submit("a.odt", {}, self.outfile(2))
+        queue.claim("crashed")
+        queue.fail(queue.claim("crashed"), "boom")
+        queue.claim("crashed")
+        queue.recover()
+        assert queue.counts() == {PENDING: 1, RUNNING: 0, DONE: 0, FAILED: 2}
+
+    def test_claim_ownership(self):
+        """only the worker holding a job can report on it"""
+        queue = JobQueue(self.db, lease=-1)
+        queue.submit("a.odt", {}, self.outfile(0))
+        first = queue.claim("one")
+        second = queue.claim("two")
+        assert second.id == first.id
+        assert not queue.renew(first)
+        assert not queue.complete(first)
+        assert not queue.fail(first, "boom")
+        assert queue.counts()[RUNNING] == 1
+        assert queue.complete(second)
+        assert queue.counts()[DONE] == 1
+
+    def test_lease_renewal(self):
+        queue = JobQueue(self.db, lease=0.3)
+        queue.submit("a.odt", {}, self.outfile(0))
+        job = queue.claim("one")
+        with _renewing(queue, job):
+            time.sleep(0.6)
+            assert queue.claim("two") is None
+        assert queue.complete(job)
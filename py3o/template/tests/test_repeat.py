@@ -0,0 +1,111 @@
+import copy
+import unittest
+import zipfile
+from io import BytesIO
+
+import lxml.etree
+
+from py3o.template import Template
+from py3o.template.repeat import RepeatCompressor
+
+from .utils import resource_filename
+
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+
+
+def expand(element):
+    """Write out the repeated rows and cells of a spreadsheet tree."""
+    for name in ("number-rows-repeated", "number-columns-repeated"):
+        attr = "{%s}%s" % (TABLE_NS, name)
+        for repeated in element.xpath(
+            "//*[@table:%s]" % name, namespaces={"table": TABLE_NS}
+        ):
+            count = int(repeated.attrib.pop(attr))
+            for _ in range(count - 1):
+                repeated.addnext(copy.deepcopy(repeated))
+    return lxml.etree.tostring(element)
+
+
+class TestRepeatCompressor(unittest.TestCase):
+    def compress(self, markup, block_size=1):
+        blocks = [
+            markup[i : i + block_size]
+            for i in range(0, len(markup), block_size)
+        ]
+        return "".join(RepeatCompressor()(blocks))
+
+    def test_rows(self):
+        row = "<table:table-row><table:table-cell/></table:table-row>"
+        markup = (
+            "<table:table>"
+            + row * 3
+            + '<table:table-row table:number-rows-repeated="2">'
+            "<table:table-cell/></table:table-row>"
+            "<table:table-row><table:table-cell>x</table:table-cell>"
+            "</table:table-row>" + row + "</table:table>"
+        )
+        expected = (
+            "<table:table>"
+            '<table:table-row table:number-rows-repeated="5">'
+            "<table:table-cell/></table:table-row>"
+            "<table:table-row><table:table-cell>x</table:table-cell>"
+            "</table:table-row>" + row + "</table:table>"
+        )
+        for block_size in (1, 7, 1000):
+            assert self.compress(markup, block_size) == expected
+
+    def test_cells(self):
+        cell = '<table:table-cell a="1"><text:p>x</text:p></table:table-cell>'
+        markup = (
+            "<table:table-row>" + cell * 2 + "<table:table-cell/>"
+            '<table:table-cell table:number-columns-repeated="1020"/>'
+            "<table:covered-table-cell/><table:covered-table-cell/>"
+            "</table:table-row>"
+        )
+        assert self.compress(markup) == (
+            "<table:table-row>"
+            '<table:table-cell a="1" table:number-columns-repeated="2">'
+            "<text:p>x</text:p></table:table-cell>"
+            '<table:table-cell table:number-columns-repeated="1021"/>'
+            '<table:covered-table-cell table:number-columns-repeated="2"/>'
+            "</table:table-row>"
+        )
+
+    def test_left_alone(self):
+        formula = (
+            '<table:table-row><table:table-cell table:formula="of:=[.A1]"/>'
+            "</table:table-row>"
+        )
+        subtable = (
+            "<table:table-row><table:table-cell><table:table>"
+            "<table:table-row><table:table-cell/></table:table-row>"
+            "</table:table></table:table-cell></table:table-row>"
+        )
+        other = "<table:table-rows/><table:table-rows/>"
+        for markup in (formula * 2, subtable * 2, other):
+            assert self.compress(markup) == markup
+
+    def test_template(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        items = [{"col1": 1, "col2": "2", "col3": None, "col4": None}] * 10 + [
+            {"col1": 2, "col2": "2", "col3": 3.5, "col4": "x"}
+        ]
+
+        contents = []
+        for compress_repeated in (True, False):
+            outfile = BytesIO()
+            template = Template(
+                template_name, outfile, compress_repeated=compress_repeated
+            )
+            template.render({"items": items})
+            with zipfile.ZipFile(outfile) as outods:
+                contents.append(outods.read("content.xml"))
+
+        compressed, plain = contents
+        assert len(compressed) < len(plain)
+        assert b'table:number-columns-repeated="2"' in compressed
+        assert expand(lxml.etree.fromstring(compressed)) == expand(
+            lxml.etree.fromstring(plain)
+        )
@@ -0,0 +1,135 @@
+import glob
+import os
+import unittest
+import zipfile
+from io import BytesIO
+
+from genshi.core import END, START, TEXT, Attrs, Markup, QName, Stream
+from genshi.input import XML, XMLParser
+from genshi.template import MarkupTemplate
+
+from py3o.template.serializer import (
+    StaticMarkup,
+    XMLSerializer,
+    precompile_static_markup,
+)
+
+from .utils import resource_filename
+
+
+class TestXMLSerializer(unittest.TestCase):
+    def assertSameOutput(self, events):
+        events = list(events)
+        expected = "".join(Stream(events).serialize(cache=False))
+        self.assertEqual("".join(XMLSerializer()(events)), expected)
+
+    def test_templates(self):
+        """every XML file of the test templates serializes like Genshi"""
+        template_dir = resource_filename("py3o.template", "tests/templates")
+        for path in glob.glob(os.path.join(template_dir, "*.od?")):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    content = archive.read(name)
+                    if not name.endswith(".xml") or not content:
+                        continue
+                    with self.subTest(template=path, name=name):
+                        self.assertSameOutput(XMLParser(BytesIO(content)))
+
+    def test_markup(self):
+        self.assertSameOutput(
+            XML(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<!DOCTYPE doc PUBLIC "-//py3o//DTD" "http://py3o/doc">\n'
+                '<a xmlns:x="urn:x"><!-- note --><?pi data?>'
+                '<b xml:space="preserve">  x  \n\n\n  <c/> y \n\n</b>  \n\n\n'
+                ' <d x:e="&quot;1 &lt; 2&amp;"/><![CDATA[ <&> ]]>'
+                '<e xml:space="preserve"/> z  \n\n</a>'
+            )
+        )
+        self.assertSameOutput(
+            XML(
+                '<a xmlns="urn:d"><b xmlns="urn:e"><c/></b><b/>'
+                '<x:f xmlns:x="urn:x"><x:g xmlns:x="urn:y"/></x:f></a>'
+            )
+        )
+
+    def test_undeclared_namespaces(self):
+        pos = (None, -1, -1)
+        self.assertSameOutput(
+            [
+                (
+                    START,
+                    (
+                        QName("urn:u}a"),
+                        Attrs([(QName("urn:v}b"), 'q"<'), (QName("c"), "")]),
+                    ),
+                    pos,
+                ),
+                (TEXT, "a < b", pos),
+                (TEXT, Markup("<i/>  \n\n"), pos),
+                (TEXT, "\n", pos),
+                (START, (QName("urn:v}d"), Attrs()), pos),
+                (END, QName("urn:v}d"), pos),
+                (END, QName("urn:u}a"), pos),
+            ]
+        )
+
+
+class TestPrecompileStaticMarkup(unittest.TestCase):
+    source = (
+        '<doc xmlns="urn:doc" xmlns:x="urn:x" '
+        'xmlns:py="http://genshi.edgewall.org/">'
+        '<x:head x:a="1"><x:title>Static  \n\n title</x:title><x:br/></x:head>'
+        '<x:row py:for="row in rows" x:n="${row}">'
+        "<x:cell><x:p>cell</x:p><x:empty/></x:cell>"
+        '<x:cell py:if="row">${row}</x:cell>'
+        '<span py:strip="True"><x:p>a</x:p> <x:p>b</x:p></span>'
+        "</x:row>"
+        "<x:foot><x:p>${total}</x:p>  \n<x:p>end</x:p></x:foot>"
+        "<x:list><x:item/></x:list>"
+        "</doc>"
+    )
+
+    def render(self, template, **data):
+        return "".join(XMLSerializer()(template.generate(**data)))
+
+    def test_same_output(self):
+        template = MarkupTemplate(self.source)
+        precompiled = MarkupTemplate(self.source)
+        precompile_static_markup(precompiled)
+
+        static = [
+            event
+            for event in precompiled.stream
+            if type(event[1]) is StaticMarkup
+        ]
+        assert static
+        assert len(precompiled.stream) < len(template.stream)
+
+        for data in (
+            {"rows": [], "total": ""},
+            {"rows": [0, "1 & 2", 3], "total": "<42>"},
+        ):
+            self.assertEqual(
+                self.render(precompiled, **data),
+                self.render(template, **data),
+            )
+
+    def test_keep_tags(self):
+        template = MarkupTemplate(self.source)
+        list_tag = QName("urn:x}list")
+        precompile_static_markup(template, (list_tag,))
+        assert any(
+            kind is START and data[0] == list_tag
+            for kind, data, _pos in template.stream
+        )
+
+    def test_match_templates(self):
+        """py:match needs every event, templates using it are left alone"""
+        source = self.source.replace(
+            "</doc>", '<x:b py:match="x:foot">new</x:b></doc>'
+        )
+        template = MarkupTemplate(source)
+        events = list(template.stream)
+        precompile_static_markup(template)
+        self.assertEqual(template.stream, events)
@@ -0,0 +1,257 @@
+import gc
+import json
+import os
+import pickle
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import zipfile
+from io import BytesIO
+from unittest import mock
+
+import pytest
+
+from py3o.template.cache import SchemaCache, TemplateCache
+from py3o.template.main import Template, TemplateException
+from py3o.template.server import RenderServer
+
+from .utils import resource_filename
+
+
+class TestTemplateCache(unittest.TestCase):
+    def setUp(self):
+        self.template_dir = tempfile.mkdtemp()
+        shutil.copy(
+            resource_filename(
+                "py3o.template",
+                "tests/templates/py3o_template_function_call.odt",
+            ),
+            self.template_dir,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.template_dir)
+
+    def test_cache_hits(self):
+        cache = TemplateCache(self.template_dir)
+        template = cache.get("py3o_template_function_call.odt")
+        assert cache.get("py3o_template_function_call.odt") is template
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        for _ in range(2):
+            outfile = BytesIO()
+            cache.render(
+                "py3o_template_function_call.odt", {"amount": 32.123}, outfile
+            )
+            content = zipfile.ZipFile(outfile).read("content.xml")
+            assert b"32,12 %" in content
+        assert (cache.hits, cache.misses) == (3, 1)
+
+    def test_cache_eviction(self):
+        cache = TemplateCache(self.template_dir, maxsize=1)
+        shutil.copy(
+            os.path.join(self.template_dir, "py3o_template_function_call.odt"),
+            os.path.join(self.template_dir, "other.odt"),
+        )
+        cache.get("py3o_template_function_call.odt")
+        cache.get("other.odt")
+        assert len(cache) == 1
+        cache.get("py3o_template_function_call.odt")
+        assert cache.misses == 3
+
+    def test_outside_template_dir(self):
+        cache = TemplateCache(self.template_dir)
+        with pytest.raises(TemplateException):
+            cache.get("../py3o_template_function_call.odt")
+        with pytest.raises(TemplateException):
+            cache.get("missing.odt")
+
+    def test_schema_cache(self):
+        """data structures are built once per template content, and can be
+        saved for the next process"""
+        cache = TemplateCache(self.template_dir)
+        shutil.copy(
+            os.path.join(self.template_dir, "py3o_template_function_call.odt"),
+            os.path.join(self.template_dir, "other.odt"),
+        )
+        schema = cache.get_data_structure("py3o_template_function_call.odt")
+        assert schema.render({"amount": 32.123}) == {"amount": 32.123}
+        assert len(cache.schemas) == 1
+        with mock.patch(
+            "py3o.template.main.Py3oConvertor",
+            side_effect=AssertionError("data structure rebuilt"),
+        ):
+            # the same content
+            assert cache.get_data_structure("other.odt") is schema
+
+        path = os.path.join(self.template_dir, "schemas.pickle")
+        cache.schemas.save(path)
+        schemas = SchemaCache.load(path)
+        template = Template(os.path.join(self.template_dir, "other.odt"), None)
+        assert template.content_hash in schemas
+        with mock.patch(
+            "py3o.template.main.Py3oConvertor",
+            side_effect=AssertionError("data structure rebuilt"),
+        ):
+            assert template.get_data_structure(schemas) == schema
+
+        schemas = SchemaCache(maxsize=1)
+        schemas["a"] = schema
+        schemas["b"] = schema
+        assert "a" not in schemas
+        assert schemas.get("b") is schema
+
+        with open(path, "wb") as f:
+            pickle.dump({}, f)
+        with pytest.raises(TemplateException):
+            SchemaCache.load(path)
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+    def test_preload_fork(self):
+        """forked workers render preloaded templates without compiling"""
+        cache = TemplateCache(self.template_dir)
+        cache.preload(["py3o_template_function_call.odt"])
+        assert gc.get_freeze_count() > 0
+        gc.unfreeze()
+
+        pids = []
+        for _ in range(2):
+            pid = os.fork()
+            if pid == 0:  # pragma: no cover
+                status = 1
+                try:
+                    with mock.patch(
+                        "py3o.template.main.MarkupTemplate",
+                        side_effect=AssertionError("template recompiled"),
+                    ):
+                        outfile = BytesIO()
+                        cache.render(
+                            "py3o_template_function_call.odt",
+                            {"amount": 32.123},
+                            outfile,
+                        )
+                    content = zipfile.ZipFile(outfile).read("content.xml")
+                    if b"32,12 %" in content and cache.misses == 1:
+                        status = 0
+                finally:
+                    os._exit(status)
+            pids.append(pid)
+
+        for pid in pids:
+            _, status = os.waitpid(pid, 0)
+            assert os.WIFEXITED(status)
+            assert os.WEXITSTATUS(status) == 0
+
+
+class TestRenderServer(unittest.TestCase):
+    def setUp(self):
+        template_dir = os.path.dirname(
+            str(
+                resource_filename(
+                    "py3o.template",
+                    "tests/templates/py3o_template_function_call.odt",
+                )
+            )
+        )
+        self.server = RenderServer(
+            ("127.0.0.1", 0), TemplateCache(template_dir), workers=2
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def post(self, payload):
+        request = urllib.request.Request(
+            self.url + "/render",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        return urllib.request.urlopen(request)
+
+    def test_render_and_metrics(self):
+        payload = {
+            "template": "py3o_template_function_call.odt",
+            "data": {"amount": 32.123},
+        }
+        for _ in range(3):
+            response = self.post(payload)
+            assert response.status == 200
+            assert response.headers["Content-Type"] == (
+                "application/vnd.oasis.opendocument.text"
+            )
+            outodt = zipfile.ZipFile(BytesIO(response.read()))
+            assert b"32,12 %" in outodt.read("content.xml")
+
+        metrics = urllib.request.urlopen(self.url + "/metrics").read()
+        metrics = metrics.decode("utf-8")
+        assert "py3o_template_cache_hits_total 2\n" in metrics
+        assert "py3o_template_cache_misses_total 1\n" in metrics
+        assert 'py3o_render_duration_seconds_bucket{le="+Inf"} 3\n' in (
+            metrics
+        )
+        assert "py3o_render_duration_seconds_count 3\n" in metrics
+
+    def test_render_errors(self):
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            self.post({"template": "missing.odt", "data": {}})
+        assert exc.value.code == 400
+
+        for payload in (
+            {"data": {}},
+            ["py3o_template_function_call.odt"],
+            {"template": ["py3o_template_function_call.odt"]},
+            {"template": "py3o_template_function_call.odt", "data": [1]},
+        ):
+            with pytest.raises(urllib.error.HTTPError) as exc:
+                self.post(payload)
+            assert exc.value.code == 400
+
+        # errors raised while rendering are not the client's
+        payload = {"template": "py3o_template_function_call.odt", "data": {}}
+        for error in (KeyError("amount"), TypeError("bad argument")):
+            with mock.patch.object(Template, "render", side_effect=error):
+                with pytest.raises(urllib.error.HTTPError) as exc:
+                    self.post(payload)
+            assert exc.value.code == 500
+            assert exc.value.read() == b"Internal server error\n"
+
+        metrics = urllib.request.urlopen(self.url + "/metrics").read()
+        assert b"py3o_render_errors_total 7\n" in metrics
+
+    @pytest.mark.skipif(
+        not hasattr(socket, "AF_UNIX"), reason="Unix sockets only"
+    )
+    def test_unix_socket(self):
+        from py3o.template.server import UnixRenderServer
+
+        path = os.path.join(tempfile.mkdtemp(), "py3o.sock")
+        server = UnixRenderServer(path, self.server.cache, workers=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            response = b""
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                response += chunk
+            client.close()
+            assert response.startswith(b"HTTP/1.0 200")
+            assert b"py3o_render_queue_depth" in response
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            os.unlink(path)
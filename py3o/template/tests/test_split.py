@@ -0,0 +1,253 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from io import BytesIO
+
+import lxml.etree
+import pytest
+
+from py3o.template import Template, TemplateException
+from py3o.template.split import MAX_SHEET_ROWS, TableSplitter
+
+from .utils import resource_filename
+
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+
+ROW = b"<table:table-row><table:table-cell/></table:table-row>"
+HEADER = (
+    b"<table:table-header-rows><table:table-row><table:table-cell>h"
+    b"</table:table-cell></table:table-row></table:table-header-rows>"
+)
+REPEATED = (
+    b'<table:table-row table:number-rows-repeated="5">'
+    b"<table:table-cell/></table:table-row>"
+)
+
+
+def sheet_rows(content):
+    """Return the names of the sheets of a spreadsheet content, with the
+    number of their rows."""
+    root = lxml.etree.fromstring(content)
+    sheets = []
+    for table in root.iter("{%s}table" % TABLE_NS):
+        rows = 0
+        for row in table.iter("{%s}table-row" % TABLE_NS):
+            rows += int(
+                row.get("{%s}number-rows-repeated" % TABLE_NS, default=1)
+            )
+        sheets.append((table.get("{%s}name" % TABLE_NS), rows))
+    return sheets
+
+
+class TestTableSplitter(unittest.TestCase):
+    def split(self, markup, block_size=1, **options):
+        """Return the documents ``markup`` is split in."""
+        blocks = [
+            markup[i : i + block_size]
+            for i in range(0, len(markup), block_size)
+        ]
+        documents = [b""]
+        for block in TableSplitter(**options)(blocks):
+            if block is None:
+                documents.append(b"")
+            else:
+                documents[-1] += block
+        return documents
+
+    def test_rows(self):
+        markup = (
+            b'<doc xmlns:table="%s"><table:table table:name="S" '
+            b'table:print-ranges="S.A1:S.A2"><table:table-column/>'
+            % TABLE_NS.encode()
+            + HEADER
+            + ROW * 3
+            + REPEATED
+            + ROW
+            + b'</table:table><table:table table:name="T">'
+            + ROW
+            + b"</table:table></doc>"
+        )
+        expected = (
+            b'<doc xmlns:table="%s"><table:table table:name="S" '
+            b'table:print-ranges="S.A1:S.A2"><table:table-column/>'
+            % TABLE_NS.encode()
+            + HEADER
+            + ROW * 3
+            + b'</table:table><table:table table:name="S (2)">'
+            b"<table:table-column/>"
+            + HEADER
+            + REPEATED.replace(b"5", b"3")
+            + b'</table:table><table:table table:name="S (3)">'
+            b"<table:table-column/>"
+            + HEADER
+            + REPEATED.replace(b"5", b"2")
+            + ROW
+            + b'</table:table><table:table table:name="T">'
+            + ROW
+            + b"</table:table></doc>"
+        )
+        for block_size in (1, 7, 1000):
+            assert self.split(markup, block_size, max_rows=4) == [expected]
+        assert self.split(markup, 1000, max_rows=None) == [markup]
+        assert sheet_rows(expected) == [
+            ("S", 4),
+            ("S (2)", 4),
+            ("S (3)", 4),
+            ("T", 1),
+        ]
+
+    def test_trailing_blank_rows(self):
+        """the blank rows filling a sheet are cut at the limit"""
+        start = (
+            b'<doc xmlns:table="%s"><table:table table:name="S">'
+            % TABLE_NS.encode()
+        )
+        end = b"</table:table-row-group></table:table></doc>"
+        markup = start + b"<table:table-row-group>" + ROW * 3 + REPEATED + end
+        expected = (
+            start
+            + b"<table:table-row-group>"
+            + ROW * 3
+            + REPEATED.replace(b"5", b"2")
+            + end
+        )
+        for block_size in (1, 7, 1000):
+            assert self.split(markup, block_size, max_rows=5) == [expected]
+        # rows that hold something are continued in a copy of the sheet
+        full = REPEATED.replace(
+            b"<table:table-cell/>", b"<table:table-cell>x</table:table-cell>"
+        )
+        markup = start + b"<table:table-row-group>" + ROW * 3 + full + end
+        assert sheet_rows(self.split(markup, 7, max_rows=5)[0]) == [
+            ("S", 5),
+            ("S (2)", 3),
+        ]
+
+    def test_size(self):
+        markup = (
+            b'<doc xmlns:table="%s"><body><table:table table:name="S">'
+            % TABLE_NS.encode()
+            + b"<table:table-row-group>"
+            + ROW * 10
+            + b"</table:table-row-group></table:table></body></doc>"
+        )
+        for block_size in (1, 7, 1000):
+            documents = self.split(
+                markup, block_size, max_rows=None, max_size=250
+            )
+            assert len(documents) == 4
+            for document in documents:
+                # the row going over the size, and the closing tags
+                assert len(document) <= 250 + len(ROW) + len(markup[-50:])
+                assert document.startswith(markup[:150])
+                assert document.endswith(markup[-50:])
+            assert [sheet_rows(document) for document in documents] == [
+                [("S", 3)],
+                [("S", 3)],
+                [("S", 3)],
+                [("S", 1)],
+            ]
+
+
+class TestTemplateSplit(unittest.TestCase):
+    def setUp(self):
+        self.template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        self.items = [
+            {"col1": i, "col2": str(i), "col3": None, "col4": "x%d" % i}
+            for i in range(10)
+        ]
+
+    def test_sheet_rows(self):
+        outfile = BytesIO()
+        template = Template(self.template_name, outfile, max_sheet_rows=4)
+        template.render({"items": self.items})
+        with zipfile.ZipFile(outfile) as outods:
+            content = outods.read("content.xml")
+        # a header row and the loop rows
+        assert sheet_rows(content) == [
+            ("Sheet1", 4),
+            ("Sheet1 (2)", 4),
+            ("Sheet1 (3)", 3),
+        ]
+
+    def test_sheet_filler_rows(self):
+        """a template whose sheet ends with blank rows up to the limit of
+        the format keeps a single sheet"""
+        with zipfile.ZipFile(self.template_name) as template:
+            content = template.read("content.xml")
+            filler = (
+                b'<table:table-row table:number-rows-repeated="%d">'
+                b'<table:table-cell table:number-columns-repeated="4"/>'
+                b"</table:table-row></table:table>" % (MAX_SHEET_ROWS - 6)
+            )
+            template_file = BytesIO()
+            with zipfile.ZipFile(template_file, "w") as filled:
+                for info in template.infolist():
+                    data = template.read(info.filename)
+                    if info.filename == "content.xml":
+                        data = content.replace(b"</table:table>", filler, 1)
+                    filled.writestr(info, data)
+
+        for max_sheet_rows in (None, MAX_SHEET_ROWS):
+            outfile = BytesIO()
+            template = Template(
+                BytesIO(template_file.getvalue()),
+                outfile,
+                max_sheet_rows=max_sheet_rows,
+            )
+            template.render({"items": self.items})
+            with zipfile.ZipFile(outfile) as outods:
+                sheets = sheet_rows(outods.read("content.xml"))
+            if max_sheet_rows is None:
+                assert sheets == [("Sheet1", MAX_SHEET_ROWS + 5)]
+            else:
+                assert sheets == [("Sheet1", MAX_SHEET_ROWS)]
+
+    def test_max_size(self):
+        directory = tempfile.mkdtemp()
+        try:
+            outname = os.path.join(directory, "out.ods")
+            template = Template(self.template_name, outname, max_size=30000)
+            template.render({"items": self.items * 10})
+            assert len(template.output_files) > 1
+            assert template.output_files[1] == os.path.join(
+                directory, "out_2.ods"
+            )
+            rows = 0
+            for output_file in template.output_files:
+                with zipfile.ZipFile(output_file) as outods:
+                    assert outods.namelist()[0] == "mimetype"
+                    assert "styles.xml" in outods.namelist()
+                    content = outods.read("content.xml")
+                for _name, sheet in sheet_rows(content):
+                    rows += sheet
+            assert rows == 101
+
+            outputs = []
+
+            def output_file(number):
+                outputs.append(BytesIO())
+                return outputs[-1]
+
+            template = Template(
+                self.template_name, output_file, max_size=30000
+            )
+            template.render({"items": self.items * 10})
+            assert template.output_files == outputs
+        finally:
+            shutil.rmtree(directory)
+
+    def test_errors(self):
+        template = Template(self.template_name, BytesIO(), max_size=30000)
+        with pytest.raises(TemplateException):
+            template.render({"items": self.items * 10})
+
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_example_template.odt"
+        )
+        with pytest.raises(TemplateException):
+            Template(template_name, BytesIO(), max_size=30000)
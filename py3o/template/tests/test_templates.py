@@ -1,29 +1,52 @@
+import array
 import base64
 import copy
 import datetime
+import decimal
 import os
+import pickle
 import re
+import struct
 import sys
 import traceback
+import tracemalloc
 import unittest
+import warnings
 import zipfile
 from io import BytesIO
-from unittest.mock import Mock
+from locale import format_string
+from unittest.mock import Mock, patch
 
+import babel.dates
+import babel.numbers
 import lxml.etree
 import pytest
+from genshi.core import Markup
 from genshi.template import TemplateError
+from genshi.template.eval import Undefined, UndefinedError
 from PIL import Image
 from xmldiff import main as xmldiff
 
 from py3o.template import Template, TemplateException, TextTemplate
 from py3o.template.main import (
+    ISO_DATE_FORMAT,
+    ISO_DATETIME_FORMAT,
     MANIFEST,
     XML_NS,
     _get_secure_filename,
+    _parse_iso_date,
+    format_currency,
+    format_currency_column,
+    format_datetime,
+    format_datetime_column,
+    format_locale,
+    format_multiline,
+    format_multiline_column,
     get_image_frames,
     get_soft_breaks,
+    preload_locales,
 )
+from py3o.template.serializer import StaticMarkup, XMLSerializer
 
 from .utils import resource_filename
 
@@ -500,6 +523,216 @@ class TestTemplate(unittest.TestCase):
 
         self._ensureSameXml(expected, outodt.read(template.templated_files[0]))
 
+    def test_format_helpers_cache(self):
+        """The format helpers give the same results as babel, with cached
+        locales and patterns."""
+        preload_locales(["fr_FR", "de_CH"])
+        for number in (0, -1.5, 1234567.891, decimal.Decimal("1099.9876")):
+            for currency, format, options in (
+                ("EUR", None, {}),
+                ("USD", "#,##0.00 \xa4", {}),
+                ("", "#", {}),
+                ("JPY", None, {"currency_digits": False}),
+                ("EUR", None, {"format_type": "accounting"}),
+                ("EUR", "0.0", {"decimal_quantization": False}),
+            ):
+                for locale in ("en_US", "fr_FR", "de_CH"):
+                    for _ in range(2):
+                        assert format_currency(
+                            number, currency, format, locale, **options
+                        ) == babel.numbers.format_currency(
+                            number, currency, format, locale, **options
+                        )
+
+        date = datetime.date(2015, 8, 2)
+        date_time = datetime.datetime(2015, 8, 2, 17, 5, 6)
+        for format in (None, "dd/MM/YYYY", "EEE d MMMM", "long"):
+            for locale in ("en_US", "fr_FR"):
+                assert format_datetime(
+                    date, format, locale
+                ) == babel.dates.format_date(
+                    date, format or "YYYY-MM-dd", locale=locale
+                )
+                assert format_datetime(
+                    date_time, format, locale
+                ) == babel.dates.format_datetime(
+                    date_time, format or "YYYY-MM-dd HH:mm:ss", locale=locale
+                )
+
+    def test_format_locale(self):
+        """format_locale gives the result of locale.format with the
+        separators of the Babel locale, without setting the locale."""
+        amounts = (0, 5, -1.5, 10000.33, -1234567.891, 123456789)
+        formats = ("%f", "%.02f", "%d", "%10.2f", "%-14.1f", "%e", "%s")
+        with patch("locale.setlocale") as setlocale:
+            for locale_, conventions in (
+                ("fr_FR.UTF-8", (",", "\u202f", [3, 3, 0])),
+                ("de_CH.UTF-8", (".", "\u2019", [3, 3, 0])),
+                ("en_IN", (".", ",", [3, 2, 0])),
+                ("C", (".", "", [])),
+            ):
+                decimal_point, thousands_sep, grouping = conventions
+                localeconv = {
+                    "decimal_point": decimal_point,
+                    "thousands_sep": thousands_sep,
+                    "grouping": grouping,
+                }
+                for amount in amounts:
+                    for format_ in formats:
+                        with patch(
+                            "locale.localeconv", return_value=localeconv
+                        ):
+                            expected = format_string(
+                                format_, amount, grouping=True
+                            )
+                        with warnings.catch_warnings():
+                            warnings.simplefilter("ignore", DeprecationWarning)
+                            assert (
+                                format_locale(amount, format_, locale_)
+                                == expected
+                            )
+            assert not setlocale.called
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            assert format_locale(10000.33, "%.02f", "fr_FR.UTF-8") == (
+                "10\u202f000,33"
+            )
+            assert format_locale(10000.33, "%.02f", "fr_FR", False) == (
+                "10000,33"
+            )
+            with pytest.raises(ValueError):
+                format_locale(1, "%d %d", "fr_FR")
+
+            # the locale of the environment, the C locale without one
+            with patch.dict(os.environ, clear=True):
+                assert format_locale(10000.33, "%.02f", "") == "10000.33"
+            with patch.dict(os.environ, {"LANG": "fr_FR.UTF-8"}, clear=True):
+                assert format_locale(10000.33, "%.02f", "") == (
+                    "10\u202f000,33"
+                )
+
+    def test_parse_iso_date(self):
+        """ISO strings are parsed as datetime.strptime does, with the same
+        errors."""
+
+        def strptime(string):
+            try:
+                return datetime.datetime.strptime(string, ISO_DATE_FORMAT)
+            except ValueError:
+                return datetime.datetime.strptime(string, ISO_DATETIME_FORMAT)
+
+        for string in (
+            "2015-08-02",
+            "2015-08-02 17:05:06",
+            "2015-8-2",
+            "2015-08-02 7:5:6",
+            "2016-02-29",
+            "2015-02-29",
+            "2015-13-02",
+            "2015-08-02 24:00:00",
+            "2015-08-02 17:05:61",
+            "2015-08-02T17:05:06",
+            "20150802",
+            "2015-08-02 17:05",
+            "2015-08-02 17:05:06+01:00",
+            "2015-08-02 ",
+            "\uff12015-08-02",
+            "",
+        ):
+            with self.subTest(string=string):
+                try:
+                    expected = strptime(string)
+                except ValueError as e:
+                    with pytest.raises(ValueError) as error:
+                        _parse_iso_date(string)
+                    assert str(error.value) == str(e)
+                    with pytest.raises(TemplateException):
+                        format_datetime(string)
+                else:
+                    date, is_datetime = _parse_iso_date(string)
+                    assert date == expected
+                    assert is_datetime == (" " in string)
+
+    def test_format_columns(self):
+        """The column formatters give the same results as the format
+        helpers, value per value."""
+        numbers = [
+            0,
+            -0.0,
+            2.675,
+            0.125,
+            -0.001,
+            -1234567.891,
+            1e20,
+            12,
+            decimal.Decimal("-1099.98765432109876543210"),
+            float("nan"),
+            float("inf"),
+        ]
+        for currency, format, options in (
+            ("EUR", None, {}),
+            ("USD", "#,##0.00 \xa4", {}),
+            ("", "#", {}),
+            ("", "#,##0.000", {"group_separator": False}),
+            ("", "#,##,##0.00", {}),
+            ("EUR", "\xa4\xa4 #,##0.00;(\xa4\xa4 #,##0.00)", {}),
+            ("JPY", None, {"currency_digits": False}),
+            ("EUR", None, {"format_type": "accounting"}),
+            ("EUR", "0.0", {"decimal_quantization": False}),
+            # patterns the fast path must leave to Babel
+            ("", "#,##0.##", {}),
+            ("", "#,##0.00%", {}),
+            ("", "0.00E0", {}),
+            ("EUR", "'net' #,##0.00 \xa4\xa4\xa4", {}),
+        ):
+            for locale in ("en_US", "fr_FR", "de_CH", "en_IN", "ar_EG"):
+                with self.subTest(
+                    currency=currency, format=format, locale=locale
+                ):
+                    assert format_currency_column(
+                        numbers, currency, format, locale, **options
+                    ) == [
+                        format_currency(
+                            number, currency, format, locale, **options
+                        )
+                        for number in numbers
+                    ]
+        # Babel cannot name the currency of NaN
+        assert format_currency_column(
+            numbers[:-2], "EUR", locale="fr_FR", format_type="name"
+        ) == [
+            format_currency(number, "EUR", locale="fr_FR", format_type="name")
+            for number in numbers[:-2]
+        ]
+        assert format_currency_column(
+            array.array("d", [1.5, -2]), "EUR", locale="fr_FR"
+        ) == ["1,50\xa0\u20ac", "-2,00\xa0\u20ac"]
+        with pytest.raises(Exception) as column_error:
+            format_currency_column([1, None], "EUR", locale="fr_FR")
+        with pytest.raises(Exception) as error:
+            format_currency(None, "EUR", locale="fr_FR")
+        assert column_error.type is error.type
+
+        dates = [
+            datetime.date(2015, 8, 2),
+            "2015-08-02",
+            datetime.datetime(2015, 8, 2, 17, 5, 6),
+            "2015-08-02 17:05:06",
+            datetime.date(2015, 8, 2),
+        ]
+        for format in (None, "EEE d MMMM", "long"):
+            assert format_datetime_column(dates, format, "fr_FR") == [
+                format_datetime(date, format, "fr_FR") for date in dates
+            ]
+        with pytest.raises(TemplateException):
+            format_datetime_column(["2015-08"])
+
+        texts = ["a\nb", "<&>", ""]
+        assert format_multiline_column(texts) == [
+            format_multiline(text) for text in texts
+        ]
+
     def test_format_date(self):
         template_name = resource_filename(
             "py3o.template", "tests/templates/py3o_template_format_date.odt"
@@ -1096,6 +1329,78 @@ class TestTemplate(unittest.TestCase):
 
         self._ensureSameXml(outodt.read(template.templated_files[0]), expected)
 
+    def test_odt_typed_user_fields(self):
+        """Numbers and dates of ODT user fields with a data style are typed
+        values with typed_user_fields."""
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_odt_value_styles.odt"
+        )
+        text_ns = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+        office_ns = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+        style_ns = "urn:oasis:names:tc:opendocument:xmlns:style:1.0"
+
+        def render(data, **options):
+            outfile = BytesIO()
+            template = Template(template_name, outfile, **options)
+            template.render(data)
+            with zipfile.ZipFile(outfile) as outodt:
+                root = lxml.etree.fromstring(outodt.read("content.xml"))
+            return [
+                (
+                    {
+                        lxml.etree.QName(name).localname: value
+                        for name, value in expression.attrib.items()
+                        if lxml.etree.QName(name).namespace
+                        in (text_ns, office_ns, style_ns)
+                    },
+                    expression.text,
+                )
+                for expression in root.iter("{%s}expression" % text_ns)
+            ]
+
+        data = {
+            "string_date": datetime.datetime(1999, 12, 30, 12),
+            "odt_value_date": decimal.Decimal("1234.50"),
+        }
+        assert render(data, typed_user_fields=True) == [
+            (
+                {
+                    "data-style-name": "N38",
+                    "formula": "ooow:36524.5",
+                    "value-type": "date",
+                    "date-value": "1999-12-30T12:00:00",
+                },
+                "1999-12-30 12:00:00",
+            ),
+            (
+                {
+                    "data-style-name": "N38",
+                    "formula": "ooow:1234.50",
+                    "value-type": "float",
+                    "value": "1234.50",
+                },
+                "1234.50",
+            ),
+            (
+                {
+                    "data-style-name": "N0",
+                    "formula": "ooow:1234.50",
+                    "value-type": "float",
+                    "value": "1234.50",
+                },
+                "1234.50",
+            ),
+        ]
+        # only without the option, or for other values, as text
+        assert render(data) == []
+        data = {"string_date": "1999-12-30", "odt_value_date": True}
+        assert render(data, typed_user_fields=True) == []
+        # odf_value attributes take precedence
+        data["odt_value_date"] = Mock(
+            __str__=lambda s: "2009-07-06", odf_value=40000, odf_type="date"
+        )
+        assert render(data, typed_user_fields=True) == render(data)
+
     def test_ods_value_styles(self):
         """Test odf_value attribute and ODS styles"""
         template_name = resource_filename(
@@ -1275,3 +1580,430 @@ class TestTemplate(unittest.TestCase):
         """
 
         self.assertEqual(xmldiff.diff_texts(tested, expected), [])
+
+    def _render_list_template(self, data, **parallel_options):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_list_template.odt"
+        )
+        outname = _get_secure_filename()
+        template = Template(template_name, outname)
+        if parallel_options:
+            template.set_parallel_loop("items", **parallel_options)
+        template.set_image_path(
+            "staticimage.logo",
+            resource_filename(
+                "py3o.template", "tests/templates/images/new_logo.png"
+            ),
+        )
+        template.render(data)
+        with zipfile.ZipFile(outname, "r") as outodt:
+            content = lxml.etree.parse(
+                BytesIO(outodt.read(template.templated_files[0]))
+            )
+        os.unlink(outname)
+        return template, content
+
+    def test_parallel_loop(self):
+        data = {"items": [{"val": i} for i in range(10)]}
+        _, expected = self._render_list_template(data)
+        for processes in (1, 2):
+            template, content = self._render_list_template(
+                data, processes=processes, chunk_size=3
+            )
+
+            ids = [
+                node.get(f"{XML_NS}id")
+                for node in content.xpath(
+                    "//text:list", namespaces=template.namespaces
+                )
+            ]
+            assert len(ids) == len(set(ids)), "all ids should be unique"
+
+            for tree in (content, expected):
+                for node in tree.xpath("//*[@xml:id]"):
+                    del node.attrib[f"{XML_NS}id"]
+            assert lxml.etree.tostring(content) == lxml.etree.tostring(
+                expected
+            )
+
+    def test_parallel_loop_errors(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_nested_list_template.odt"
+        )
+        for iterable in ("lines", "unknown"):
+            template = Template(
+                template_name, BytesIO(), ignore_undefined_variables=True
+            )
+            template.set_parallel_loop(iterable)
+            with pytest.raises(TemplateException):
+                template.compile()
+
+        template = Template(
+            template_name, BytesIO(), ignore_undefined_variables=True
+        )
+        template.compile()
+        with pytest.raises(TemplateException):
+            template.set_parallel_loop("items")
+
+    def test_parallel_loop_undefined(self):
+        data = {"items": [{"val": i} for i in range(5)] + [{}]}
+        messages = []
+        for processes in (1, 2):
+            with pytest.raises(UndefinedError) as error:
+                self._render_list_template(
+                    data, processes=processes, chunk_size=2
+                )
+            messages.append(str(error.value))
+        assert messages[0] == messages[1]
+        assert messages[0].endswith('has no member named "val"')
+
+    def test_streaming_memory(self):
+        """rendering a generator keeps the same peak memory usage whatever
+        the number of rows"""
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        compiled = Template(template_name, BytesIO())
+        compiled.compile()
+
+        def rows(count):
+            for i in range(count):
+                yield {
+                    "col1": i,
+                    "col2": f"row {i}",
+                    "col3": i * 1.5,
+                    "col4": i,
+                }
+
+        peaks = []
+        outname = _get_secure_filename()
+        try:
+            for count in (200, 2000):
+                template = compiled.clone(outname)
+                tracemalloc.start()
+                try:
+                    template.render({"items": rows(count)})
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+            with zipfile.ZipFile(outname) as outods:
+                content = lxml.etree.parse(BytesIO(outods.read("content.xml")))
+        finally:
+            os.unlink(outname)
+
+        rows_found = content.xpath(
+            "//table:table-row", namespaces=compiled.namespaces
+        )
+        assert len(rows_found) >= 2000
+        assert peaks[1] < 2 * peaks[0], peaks
+
+    def test_parallel_loop_streaming_memory(self):
+        """the rows of a parallel loop are written as they are rendered"""
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        compiled = Template(template_name, BytesIO())
+        compiled.set_parallel_loop("items", processes=1, chunk_size=100)
+        compiled.compile()
+
+        def rows(count):
+            for i in range(count):
+                yield {
+                    "col1": i,
+                    "col2": f"row {i}",
+                    "col3": i * 1.5,
+                    "col4": i,
+                }
+
+        # compile the loop chunk template outside of the measures
+        compiled.clone(BytesIO()).render({"items": rows(1)})
+
+        peaks = []
+        outname = _get_secure_filename()
+        try:
+            for count in (2000, 20000):
+                template = compiled.clone(outname)
+                tracemalloc.start()
+                try:
+                    template.render({"items": rows(count)})
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+            with zipfile.ZipFile(outname) as outods:
+                content = lxml.etree.parse(BytesIO(outods.read("content.xml")))
+        finally:
+            os.unlink(outname)
+
+        rows_found = content.xpath(
+            "//table:table-row", namespaces=compiled.namespaces
+        )
+        assert len(rows_found) >= 20000
+        assert peaks[1] < 2 * peaks[0], peaks
+
+    def test_render_flow_buffer_size(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        data = {
+            "items": [
+                {"col1": i, "col2": f"row {i}", "col3": i * 1.5, "col4": i}
+                for i in range(500)
+            ]
+        }
+        outputs = []
+        for buffer_size in (1, 1024, 1024 * 1024):
+            outfile = BytesIO()
+            template = Template(
+                template_name, outfile, buffer_size=buffer_size
+            )
+            steps = sum(1 for _ in template.render_flow(data))
+            with zipfile.ZipFile(outfile) as outods:
+                content = outods.read("content.xml")
+            outputs.append((steps, len(content)))
+
+        # one step per buffer written (content.xml and styles.xml get at
+        # least one each), plus one for the archive
+        small, medium, large = outputs
+        assert small[1] == medium[1] == large[1]
+        assert large[0] == 3
+        assert medium[0] > large[0]
+        assert medium[0] < len(content) // 1024 + 4
+        assert small[0] > medium[0]
+
+    def test_streamed_entries_zip64(self):
+        """streamed entries get zip64 headers, to grow beyond 2 GiB, on
+        demand only"""
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+
+        def local_header(archive, info):
+            """Return the version needed to extract an entry, its sizes and
+            the ids of its extra fields, from its local header."""
+            fields = struct.unpack_from(
+                "<4s2B4HL2L2H", archive, info.header_offset
+            )
+            version, sizes = fields[1], fields[8:10]
+            extra_start = info.header_offset + 30 + fields[10]
+            extra = archive[extra_start : extra_start + fields[11]]
+            ids = []
+            while extra:
+                field_id, size = struct.unpack_from("<2H", extra)
+                ids.append(field_id)
+                extra = extra[4 + size :]
+            return version, sizes, ids
+
+        for options, zip64 in (
+            ({}, False),
+            ({"max_size": 2**20}, False),
+            ({"zip64": True}, True),
+            ({"max_size": 2**31}, True),
+        ):
+            outfile = BytesIO()
+            template = Template(template_name, outfile, **options)
+            template.render({"items": []})
+            archive = outfile.getvalue()
+            with zipfile.ZipFile(outfile) as outods:
+                for fname in ("content.xml", "styles.xml"):
+                    info = outods.getinfo(fname)
+                    version, sizes, ids = local_header(archive, info)
+                    if zip64:
+                        assert version == zipfile.ZIP64_VERSION
+                        assert sizes == (0xFFFFFFFF, 0xFFFFFFFF)
+                        assert 1 in ids
+                    else:
+                        assert version < zipfile.ZIP64_VERSION
+                        assert sizes == (info.compress_size, info.file_size)
+                        assert 1 not in ids
+
+    def test_typed_cells(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        template = Template(template_name, BytesIO())
+        template.compile()
+        assert len(template.typed_cells) == 3
+
+        serializer = XMLSerializer(template.namespaces)
+        values = [
+            None,
+            "",
+            'a <b> & "c"',
+            "trailing  \n\n\n space",
+            0,
+            -12,
+            1.5,
+            True,
+            Markup("<text:span>markup</text:span>"),
+            datetime.date(2020, 1, 31),
+            [1, 2],
+            Undefined("missing"),
+        ]
+        for cell in template.typed_cells:
+            for value in values:
+                # twice, to go through the prepared value types
+                for _ in range(2):
+                    result = cell(value)
+                    if not isinstance(result, StaticMarkup):
+                        # rendered by Genshi
+                        result = "".join(serializer(result))
+                    expected = "".join(serializer(cell.generate(value)))
+                    assert result == expected
+            assert isinstance(cell("text"), StaticMarkup)
+            assert isinstance(cell(1.5), StaticMarkup)
+
+    def test_typed_cells_prepared(self):
+        """the Genshi templates of the cells are ready before any render, so
+        that concurrent renders do not prepare them"""
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        template = Template(template_name, BytesIO())
+        template.compile()
+        cells = template.typed_cells + pickle.loads(
+            pickle.dumps(template.typed_cells)
+        )
+        serializer = XMLSerializer(template.namespaces)
+        with patch(
+            "py3o.template.main.MarkupTemplate", side_effect=AssertionError
+        ):
+            for cell in cells:
+                assert cell.template._prepared
+                assert "".join(serializer(cell([1, 2])))
+
+    def _render_table_loop(self, template_name, items, table_loop, **kw):
+        outfile = BytesIO()
+        template = Template(template_name, outfile, **kw)
+        if table_loop:
+            template.set_table_loop("items")
+        template.render({"items": items})
+        with zipfile.ZipFile(outfile) as outods:
+            return outods.read("content.xml")
+
+    def test_table_loop(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_ods_variable_type.ods"
+        )
+
+        class Item:
+            def __init__(self, val1, val2):
+                self.val1 = val1
+                self.val2 = val2
+
+        values = [
+            None,
+            "",
+            'a <b> & "c"',
+            "trailing  \n\n\n space",
+            "{braces}",
+            0,
+            1.5,
+            True,
+            Markup("<text:span>markup</text:span>"),
+            datetime.date(2020, 1, 31),
+        ]
+        items = [{"val1": value, "val2": 1} for value in values]
+        items += [Item(2, value) for value in values]
+        for kw in ({}, {"ignore_undefined_variables": True}):
+            with self.subTest(**kw):
+                result = self._render_table_loop(
+                    template_name, items, True, **kw
+                )
+                expected = self._render_table_loop(
+                    template_name, items, False, **kw
+                )
+                assert result == expected
+
+        # missing fields
+        items = [{"val1": 1}, Item(1, 2)]
+        result = self._render_table_loop(
+            template_name, items, True, ignore_undefined_variables=True
+        )
+        assert result == self._render_table_loop(
+            template_name, items, False, ignore_undefined_variables=True
+        )
+        with pytest.raises(UndefinedError):
+            self._render_table_loop(template_name, items, True)
+
+    def test_table_loop_tuples(self):
+        source = resource_filename(
+            "py3o.template", "tests/templates/py3o_ods_variable_type.ods"
+        )
+        template_name = _get_secure_filename()
+        with zipfile.ZipFile(source) as template, zipfile.ZipFile(
+            template_name, "w"
+        ) as target:
+            for info in template.infolist():
+                content = template.read(info)
+                if info.filename == "content.xml":
+                    content = content.replace(b"item.val1", b"item[1]")
+                    content = content.replace(b"item.val2", b"item")
+                target.writestr(info, content)
+
+        try:
+            items = [(i, "row %d" % i) for i in range(10)]
+            result = self._render_table_loop(template_name, items, True)
+            expected = self._render_table_loop(template_name, items, False)
+            assert result == expected
+            assert b"row 9" in result
+        finally:
+            os.unlink(template_name)
+
+    def test_table_loop_errors(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        template = Template(template_name, BytesIO())
+        template.set_table_loop("items")
+        # the formula cell is not a field of the loop item
+        with pytest.raises(TemplateException):
+            template.compile()
+
+        template = Template(template_name, BytesIO())
+        template.set_table_loop("lines")
+        with pytest.raises(TemplateException):
+            template.compile()
+
+        template = Template(template_name, BytesIO())
+        template.compile()
+        with pytest.raises(TemplateException):
+            template.set_table_loop("items")
+
+    def test_cell_expressions_evaluated_once(self):
+        template_name = resource_filename(
+            "py3o.template", "tests/templates/py3o_simple_calc.ods"
+        )
+        loads = []
+
+        class Record:
+            def __init__(self, i):
+                self.values = {
+                    "col1": i,
+                    "col2": f"row {i}",
+                    "col3": i * 1.5,
+                    "col4": None,
+                }
+
+            def __getattr__(self, name):
+                if name not in self.__dict__.get("values", ()):
+                    raise AttributeError(name)
+                loads.append(name)
+                return self.values[name]
+
+        outfile = BytesIO()
+        template = Template(template_name, outfile)
+        template.render({"items": [Record(i) for i in range(3)]})
+
+        # one value, type and text per cell from a single evaluation
+        assert sorted(loads) == sorted(["col1", "col2", "col3", "col4"] * 3)
+        with zipfile.ZipFile(outfile) as outods:
+            content = lxml.etree.parse(BytesIO(outods.read("content.xml")))
+        cells = content.xpath(
+            "//table:table-cell[@office:value='1.5']",
+            namespaces=template.namespaces,
+        )
+        assert len(cells) == 1
+        assert cells[0].get(
+            "{%s}value-type" % template.namespaces["office"]
+        ) == ("float")
+        assert "".join(cells[0].itertext()) == "1.5"